@@ -1,37 +1,429 @@
+import heapq
+import os
+from collections import deque
+import numpy as np
 import pandas as pd
-from strategy import generate_signal
-from risk import calculate_position_size, get_sl_tp
+from strategy import generate_signal, get_strategies, combine_signals, iter_signals, IndicatorCache, SIGNAL_WINDOW
+from risk import calculate_lot_size, get_sl_tp
+from symbol_registry import default_spec, get_symbol_spec
+from timeframes import htf_filter, confirm, ResampleCache
 from utils import setup_logger
-from config import INITIAL_BALANCE, ATR_SL_MULTIPLIER
+import bar_store
+from config import INITIAL_BALANCE, ATR_SL_MULTIPLIER, REWARD_RISK_RATIO, MAX_HOLDING_BARS, MAX_OPEN_POSITIONS, INTRABAR_TIMEFRAME
+from config import BACKTEST_VERBOSITY, BACKTEST_CHUNK_BARS, LOG_DIR
 
 logger = setup_logger('backtest')
 
-def run_backtest(df, initial_balance=None):
+EXIT_NONE, EXIT_SL, EXIT_TP = 0, 1, 2
+VERBOSITY_QUIET, VERBOSITY_SUMMARY, VERBOSITY_TRADES = 0, 1, 2
+
+# Columns of run_backtest's results plus the symbol the multi-symbol run adds,
+# i.e. the layout of logs/backtest_results.csv
+RESULT_COLUMNS = ['time', 'signal', 'price', 'lot', 'pnl', 'balance', 'exit_time', 'exit_price', 'exit_reason', 'bars_held', 'symbol']
+
+# Upper bound on bars x trades examined per step of the first-touch search
+_SEARCH_BLOCK = 2_000_000
+
+def find_exits(entry_idx, is_buy, sl, tp, high, low, max_bars=None, intrabar=None):
+    """
+    Vectorized first-touch search. For each trade entered at the close of
+    bar entry_idx[k], finds the first later bar whose range reaches the
+    stop-loss or take-profit, looking at most max_bars bars ahead (None for
+    no limit, or an array with a limit per trade). When both levels fall inside the same bar the stop-loss is
+    assumed to have been hit first, unless `intrabar` is given: a tuple
+    (start, end, low_tf_high, low_tf_low) mapping each bar to its rows in a
+    finer timeframe (see bar_store.load_timeframe_index). Only those
+    ambiguous bars are then replayed on the finer bars to see which level
+    was reached first.
+
+    All still-open trades are tested against a window of upcoming bars at
+    once; the window doubles each step, so a trade held L bars costs O(L)
+    array work and there is no per-bar Python loop.
+    Returns (exit_idx, exit_kind) where exit_kind is EXIT_SL, EXIT_TP, or
+    EXIT_NONE with exit_idx at the last bar examined (time limit or end of data).
+    """
+    n = len(high)
+    count = len(entry_idx)
+    horizon = n - 1 - entry_idx if max_bars is None else np.minimum(max_bars, n - 1 - entry_idx)
+    exit_idx = entry_idx + horizon
+    exit_kind = np.full(count, EXIT_NONE, dtype=np.int8)
+    ambiguous = np.zeros(count, dtype=bool)
+
+    pending = np.flatnonzero(horizon > 0)
+    offset, width = 1, 8
+    while len(pending):
+        step = max(1, min(width, _SEARCH_BLOCK // len(pending)))
+        bars = entry_idx[pending, None] + offset + np.arange(step)
+        in_range = (bars - entry_idx[pending, None]) <= horizon[pending, None]
+        bars = np.minimum(bars, n - 1)
+        buy = is_buy[pending, None]
+        bar_high, bar_low = high[bars], low[bars]
+        sl_hit = np.where(buy, bar_low <= sl[pending, None], bar_high >= sl[pending, None]) & in_range
+        tp_hit = np.where(buy, bar_high >= tp[pending, None], bar_low <= tp[pending, None]) & in_range
+        hit = sl_hit | tp_hit
+
+        found = hit.any(axis=1)
+        first = hit.argmax(axis=1)
+        done = pending[found]
+        exit_idx[done] = bars[found, first[found]]
+        exit_kind[done] = np.where(sl_hit[found, first[found]], EXIT_SL, EXIT_TP)
+        ambiguous[done] = sl_hit[found, first[found]] & tp_hit[found, first[found]]
+
+        offset += step
+        width *= 2
+        pending = pending[~found & (horizon[pending] >= offset)]
+
+    if intrabar is not None:
+        resolve_intrabar(np.flatnonzero(ambiguous), exit_idx, exit_kind, is_buy, sl, tp, intrabar)
+    return exit_idx, exit_kind
+
+def resolve_intrabar(trades, exit_idx, exit_kind, is_buy, sl, tp, intrabar):
+    """
+    Replays the bars where both SL and TP were touched on the finer
+    timeframe and switches the exit to take-profit when it was reached first.
+    If a finer bar still touches both, or there is no finer data, the
+    stop-loss stands. Updates exit_kind in place.
+    """
+    for k in trades.tolist():
+        if tp_hit_first(exit_idx[k], is_buy[k], sl[k], tp[k], intrabar):
+            exit_kind[k] = EXIT_TP
+
+def tp_hit_first(bar, is_buy, sl, tp, intrabar):
+    """True if the finer bars of `bar` reach tp strictly before sl (see resolve_intrabar)."""
+    start, end, fine_high, fine_low = intrabar
+    if bar >= len(start) or end[bar] <= start[bar]:
+        return False
+    h = np.asarray(fine_high[start[bar]:end[bar]])
+    l = np.asarray(fine_low[start[bar]:end[bar]])
+    if is_buy:
+        sl_hit, tp_hit = l <= sl, h >= tp
+    else:
+        sl_hit, tp_hit = h >= sl, l <= tp
+    first_sl = sl_hit.argmax() if sl_hit.any() else len(h)
+    first_tp = tp_hit.argmax() if tp_hit.any() else len(h)
+    return first_tp < first_sl
+
+def simulate_trades(times, high, low, close, direction, atr, initial_balance, sl_multiplier=ATR_SL_MULTIPLIER,
+                    reward_risk=REWARD_RISK_RATIO, max_holding_bars=MAX_HOLDING_BARS,
+                    max_open_positions=MAX_OPEN_POSITIONS, intrabar=None, spec=None):
+    """
+    Enters a trade at the close of every signal bar of `direction` (1 buy,
+    -1 sell) and holds it until its stop-loss or take-profit is touched, it
+    has been open max_holding_bars bars (closed at that bar's close), or the
+    data ends. Signals arriving while max_open_positions trades are open are
+    skipped. Lots are sized off the balance realised so far.
+
+    All inputs are NumPy arrays aligned with the bars. Returns a dict of
+    column lists: time, signal, price, lot, pnl, balance, exit_time,
+    exit_price, exit_reason, bars_held. `balance` is the running total of
+    PnL in entry order, which is the account balance when trades do not
+    overlap. With max_holding_bars=1 and no position limit this reproduces
+    run_backtest_loop exactly. `intrabar` is passed through to find_exits.
+    `spec` is the symbol's SymbolSpec for pip size, pip value and lot limits;
+    None assumes a major USD-quoted pair.
+    """
+    if spec is None:
+        spec = default_spec('')
+    pip_size = spec.pip_size
+    trades = {name: [] for name in ('time', 'signal', 'price', 'lot', 'pnl', 'balance', 'exit_time', 'exit_price', 'exit_reason', 'bars_held')}
+
+    # A signal on bar s is traded from bar s + 1, and the last bar is never
+    # traded, so the final two bars cannot signal
+    direction = direction.copy()
+    direction[max(len(direction) - 2, 0):] = 0
+    signal_idx = np.flatnonzero((direction != 0) & (atr != 0))
+    if len(signal_idx) == 0:
+        return trades
+
+    is_buy = direction[signal_idx] == 1
+
+    # Same arithmetic as get_sl_tp so levels match bit for bit
+    entry = close[signal_idx]
+    sl_distance = atr[signal_idx] * sl_multiplier
+    tp_distance = sl_distance * reward_risk
+    sl = np.where(is_buy, entry - sl_distance, entry + sl_distance)
+    tp = np.where(is_buy, entry + tp_distance, entry - tp_distance)
+
+    exit_idx, exit_kind = find_exits(signal_idx, is_buy, sl, tp, high, low, max_holding_bars, intrabar=intrabar)
+    exit_price = np.where(exit_kind == EXIT_SL, sl, np.where(exit_kind == EXIT_TP, tp, close[exit_idx]))
+    pnl_pips = np.where(is_buy, exit_price - entry, entry - exit_price) / pip_size
+    sl_pips = np.abs(entry - sl) / pip_size
+    reasons = np.array(['time', 'sl', 'tp'])[exit_kind]
+    if max_holding_bars is None:
+        reasons[exit_kind == EXIT_NONE] = 'end'
+    else:
+        reasons[(exit_kind == EXIT_NONE) & (exit_idx - signal_idx < max_holding_bars)] = 'end'
+
+    signals = np.where(is_buy, 'buy', 'sell')
+    reasons = reasons.tolist()
+    realised = initial_balance
+    running = initial_balance
+    open_trades = []  # heap of (exit bar, pnl)
+    # Position limits and compounding make this part sequential, but it only
+    # walks the signals; every exit is already known
+    for k, (s, e, signal, entry_price, exit_px, stop_pips, pips) in enumerate(zip(
+            signal_idx.tolist(), exit_idx.tolist(), signals.tolist(), entry.tolist(),
+            exit_price.tolist(), sl_pips.tolist(), pnl_pips.tolist())):
+        while open_trades and open_trades[0][0] <= s:
+            realised += heapq.heappop(open_trades)[1]
+        if max_open_positions is not None and len(open_trades) >= max_open_positions:
+            continue
+        lot = calculate_lot_size(realised, stop_pips, spec)
+        if lot <= 0:
+            continue
+        pnl_amount = pips * lot * spec.pip_value
+        heapq.heappush(open_trades, (e, pnl_amount))
+        running += pnl_amount
+        trades['time'].append(times[s])
+        trades['signal'].append(signal)
+        trades['price'].append(entry_price)
+        trades['lot'].append(lot)
+        trades['pnl'].append(pnl_amount)
+        trades['balance'].append(running)
+        trades['exit_time'].append(times[e])
+        trades['exit_price'].append(exit_px)
+        trades['exit_reason'].append(reasons[k])
+        trades['bars_held'].append(e - s)
+    return trades
+
+def run_backtest(df, initial_balance=None, max_holding_bars=MAX_HOLDING_BARS, max_open_positions=MAX_OPEN_POSITIONS,
+                 intrabar=None, spec=None, verbosity=BACKTEST_VERBOSITY, name=None, htf_filters=None,
+                 strategies=None, cache=None):
+    """
+    Vectorized backtest. Indicators and signals are computed once over the
+    whole frame, exits are found with a vectorized first-touch search, and
+    only position limits and balance-dependent lot sizing walk the signals.
+    See find_exits for `intrabar` and simulate_trades for `spec`. Signals
+    are confirmed on the higher timeframes in htf_filters (default
+    HTF_FILTERS) resampled from df.
+    Signals come from `strategies` (default STRATEGIES), combined as in
+    strategy.combine_signals, over `cache` (an IndicatorCache of df with
+    window SIGNAL_WINDOW) if given, so several runs can share indicators.
+    Nothing is logged per trade; `verbosity` (see BACKTEST_VERBOSITY) picks
+    between silence, one summary line, and the summary plus a JSON-lines
+    dump of the trades. `name` (e.g. the symbol) labels both.
+    """
+    if initial_balance is None:
+        initial_balance = INITIAL_BALANCE
+
+    if cache is None:
+        cache = IndicatorCache(df, window=SIGNAL_WINDOW)
+    direction, atr, _ = combine_signals(cache, get_strategies(strategies))
+    direction = htf_filter(df, direction, htf_filters)
+    trades = simulate_trades(
+        df['time'].to_numpy(),
+        df['high'].to_numpy(dtype=float),
+        df['low'].to_numpy(dtype=float),
+        df['close'].to_numpy(dtype=float),
+        direction, atr, initial_balance,
+        max_holding_bars=max_holding_bars, max_open_positions=max_open_positions, intrabar=intrabar, spec=spec,
+    )
+
+    results = pd.DataFrame(trades) if trades['time'] else pd.DataFrame()
+    if verbosity >= VERBOSITY_SUMMARY:
+        log_summary(results, initial_balance, name)
+    if verbosity >= VERBOSITY_TRADES and not results.empty:
+        dump_trades(results, name)
+    return results
+
+def iter_backtest(chunks, initial_balance=None, max_holding_bars=MAX_HOLDING_BARS, max_open_positions=MAX_OPEN_POSITIONS,
+                  intrabar=None, spec=None, htf_filters=None, strategies=None):
+    """
+    run_backtest over a series that arrives as consecutive chunks of bars
+    (DataFrames in time order, e.g. from iter_history). Yields the same
+    trades as run_backtest on the whole series, in the same (entry) order,
+    each as a dict once it and every trade entered before it have closed.
+
+    Signals come from iter_signals, which carries the indicator warm-up
+    across chunks, and each chunk's exits are found with find_exits on that
+    chunk alone: trades whose exit is not in it carry over to the next.
+    Signals on a chunk's last two bars are only taken once a later bar
+    shows they are not the last two of the series. Memory is one chunk
+    plus the open trades, however long the history.
+    """
+    if initial_balance is None:
+        initial_balance = INITIAL_BALANCE
+    if spec is None:
+        spec = default_spec('')
+    pip_size = spec.pip_size
+    htf = ResampleCache(htf_filters)
+    realised = running = initial_balance
+    closed = []  # heap of (exit bar, pnl) of accepted trades whose exit is known
+    unresolved = []  # candidates and accepted trades whose exit is not known yet
+    waiting = deque()  # candidates not yet accepted or skipped, in entry order
+    accepted = deque()  # accepted trades in entry order, until they are yielded
+    open_unresolved = 0  # accepted trades in `unresolved`
+    offset = 0  # Bars before the current chunk
+    last_time = last_close = None
+
+    for chunk, direction, atr in iter_signals(chunks, window=SIGNAL_WINDOW, strategies=get_strategies(strategies)):
+        if htf.timeframes:
+            direction = confirm(direction, htf.update(chunk))
+        times = chunk['time'].to_numpy()
+        high = chunk['high'].to_numpy(dtype=float)
+        low = chunk['low'].to_numpy(dtype=float)
+        close = chunk['close'].to_numpy(dtype=float)
+        n = len(chunk)
+
+        # Same arithmetic as simulate_trades so levels match bit for bit
+        signal_idx = np.flatnonzero((direction != 0) & (atr != 0))
+        is_buy = direction[signal_idx] == 1
+        entry = close[signal_idx]
+        sl_distance = atr[signal_idx] * ATR_SL_MULTIPLIER
+        tp_distance = sl_distance * REWARD_RISK_RATIO
+        sl = np.where(is_buy, entry - sl_distance, entry + sl_distance)
+        tp = np.where(is_buy, entry + tp_distance, entry - tp_distance)
+        sl_pips = np.abs(entry - sl) / pip_size
+        for s, buy, price, stop, target, stop_pips in zip(
+                (signal_idx + offset).tolist(), is_buy.tolist(), entry.tolist(), sl.tolist(), tp.tolist(), sl_pips.tolist()):
+            trade = {'bar': s, 'time': times[s - offset], 'is_buy': buy, 'price': price, 'sl': stop, 'tp': target,
+                     'sl_pips': stop_pips, 'exit': None, 'accepted': False}
+            unresolved.append(trade)
+            waiting.append(trade)
+
+        # Exits within this chunk, for trades entered in it (searched from
+        # the bar after entry) and those carried in (from its first bar)
+        if unresolved:
+            local = np.array([max(trade['bar'] - offset, -1) for trade in unresolved])
+            deadline = None
+            if max_holding_bars is not None:
+                deadline = np.array([trade['bar'] + max_holding_bars for trade in unresolved])
+                limit = deadline - offset - local
+            exit_idx, exit_kind = find_exits(
+                local, np.array([trade['is_buy'] for trade in unresolved]),
+                np.array([trade['sl'] for trade in unresolved]), np.array([trade['tp'] for trade in unresolved]),
+                high, low, None if deadline is None else limit,
+                intrabar=None if intrabar is None else (intrabar[0][offset:offset + n], intrabar[1][offset:offset + n]) + intrabar[2:],
+            )
+            still = []
+            for k, trade in enumerate(unresolved):
+                kind, e = int(exit_kind[k]), int(exit_idx[k])
+                if kind == EXIT_SL:
+                    trade['exit'] = (offset + e, times[e], trade['sl'], 'sl')
+                elif kind == EXIT_TP:
+                    trade['exit'] = (offset + e, times[e], trade['tp'], 'tp')
+                elif deadline is not None and offset + e == deadline[k]:
+                    trade['exit'] = (offset + e, times[e], close[e], 'time')
+                else:
+                    still.append(trade)
+                    continue
+                if trade['accepted']:
+                    heapq.heappush(closed, (offset + e, _trade_pnl(trade, spec)))
+                    open_unresolved -= 1
+            unresolved = still
+        offset += n
+        last_time, last_close = times[-1], close[-1]
+
+        # The final two bars of the series never signal, so a candidate is
+        # only decided once two more bars have arrived
+        while waiting and waiting[0]['bar'] <= offset - 3:
+            trade = waiting.popleft()
+            s = trade['bar']
+            while closed and closed[0][0] <= s:
+                realised += heapq.heappop(closed)[1]
+            lot = 0
+            if max_open_positions is None or len(closed) + open_unresolved < max_open_positions:
+                lot = calculate_lot_size(realised, trade['sl_pips'], spec)
+            if lot <= 0:
+                if trade['exit'] is None:
+                    unresolved.remove(trade)
+                continue
+            trade['accepted'] = True
+            trade['lot'] = lot
+            if trade['exit'] is not None:
+                heapq.heappush(closed, (trade['exit'][0], _trade_pnl(trade, spec)))
+            else:
+                open_unresolved += 1
+            accepted.append(trade)
+
+        while accepted and accepted[0]['exit'] is not None:
+            trade = accepted.popleft()
+            running += _trade_pnl(trade, spec)
+            yield _trade_row(trade, spec, running)
+
+    # Whatever is still open closes at the last bar
+    for trade in accepted:
+        if trade['exit'] is None:
+            reason = 'end' if max_holding_bars is None or offset - 1 - trade['bar'] < max_holding_bars else 'time'
+            trade['exit'] = (offset - 1, last_time, last_close, reason)
+        running += _trade_pnl(trade, spec)
+        yield _trade_row(trade, spec, running)
+
+def _trade_pnl(trade, spec):
+    exit_price = trade['exit'][2]
+    pips = (exit_price - trade['price'] if trade['is_buy'] else trade['price'] - exit_price) / spec.pip_size
+    return pips * trade['lot'] * spec.pip_value
+
+def _trade_row(trade, spec, balance):
+    exit_bar, exit_time, exit_price, reason = trade['exit']
+    return {
+        'time': trade['time'], 'signal': 'buy' if trade['is_buy'] else 'sell', 'price': trade['price'], 'lot': trade['lot'],
+        'pnl': _trade_pnl(trade, spec), 'balance': balance, 'exit_time': exit_time, 'exit_price': exit_price,
+        'exit_reason': reason, 'bars_held': exit_bar - trade['bar'],
+    }
+
+def compare_strategies(df, strategies=None, name=None, **kwargs):
+    """
+    Backtests each strategy on its own over df, all reading one
+    IndicatorCache, so each distinct indicator is computed once. Returns
+    {strategy name: results}; kwargs go to run_backtest.
+    """
+    cache = IndicatorCache(df, window=SIGNAL_WINDOW)
+    return {
+        strategy.name: run_backtest(df, strategies=[strategy], cache=cache, name=f"{name}/{strategy.name}" if name else strategy.name, **kwargs)
+        for strategy in get_strategies(strategies)
+    }
+
+def log_summary(results, initial_balance, name=None):
+    """Logs one line with the trade count, win rate, PnL and final balance of a backtest."""
+    label = f" for {name}" if name else ""
+    if results.empty:
+        logger.info(f"Backtest complete{label}. No trades. Final balance: {initial_balance:.2f}")
+        return
+    pnl = results['pnl'].to_numpy()
+    logger.info(
+        f"Backtest complete{label}. Trades: {len(pnl)}, win rate: {(pnl > 0).mean() * 100:.1f}%, "
+        f"PnL: {pnl.sum():.2f}, final balance: {results['balance'].iloc[-1]:.2f}"
+    )
+
+def dump_trades(results, name=None):
+    """Writes the trades as JSON lines to LOG_DIR/backtest_trades[_name].jsonl in one pass."""
+    path = os.path.join(LOG_DIR, f"backtest_trades_{name}.jsonl" if name else "backtest_trades.jsonl")
+    results.to_json(path, orient='records', lines=True, date_format='iso')
+    logger.info(f"Wrote {len(results)} trades to {path}")
+
+def run_backtest_loop(df, initial_balance=None, spec=None):
+    """
+    Reference per-bar implementation that calls generate_signal on a sliding
+    window. Kept to cross-check run_backtest; it is O(n * window).
+    """
     if initial_balance is None:
         initial_balance = INITIAL_BALANCE
+    if spec is None:
+        spec = default_spec('')
     balance = initial_balance
     positions = []
-    pip_size = 0.0001 # For 5-digit brokers
+    pip_size = spec.pip_size
 
-    for i in range(51, len(df) - 1): # Stop one bar early to prevent index error
+    for i in range(SIGNAL_WINDOW, len(df) - 1): # Stop one bar early to prevent index error
         # The window for calculating indicators ends at index i-1
-        window = df.iloc[i-51:i].copy()
+        window = df.iloc[i-SIGNAL_WINDOW:i].copy()
         signal, atr = generate_signal(window)
-        
+
         if signal and atr:
             # Entry price is the close of the signal bar (i-1)
             entry_price = window.iloc[-1]['close']
             entry_time = window.iloc[-1]['time'] # Get the time of the trade
-            
+
             sl, tp = get_sl_tp(entry_price, signal, atr)
-            
+
             if sl is None or tp is None:
                 continue
 
             sl_pips = abs(entry_price - sl) / pip_size
             tp_pips = abs(entry_price - tp) / pip_size
 
-            lot = calculate_position_size(balance, sl_pips)
+            lot = calculate_lot_size(balance, sl_pips, spec)
             if lot <= 0:
                 continue
 
@@ -51,9 +443,9 @@ def run_backtest(df, initial_balance=None):
                 # Otherwise, the trade is closed at the end of the bar
                 else:
                     exit_price = trade_bar['close']
-                
+
                 pnl_pips = (exit_price - entry_price) / pip_size
-                pnl_amount = pnl_pips * lot * 10  # Assuming pip_value_per_lot is 10
+                pnl_amount = pnl_pips * lot * spec.pip_value
 
             # --- SELL ---
             elif signal == 'sell':
@@ -66,18 +458,132 @@ def run_backtest(df, initial_balance=None):
                 # Otherwise, the trade is closed at the end of the bar
                 else:
                     exit_price = trade_bar['close']
-                
+
                 pnl_pips = (entry_price - exit_price) / pip_size
-                pnl_amount = pnl_pips * lot * 10  # Assuming pip_value_per_lot is 10
-            
+                pnl_amount = pnl_pips * lot * spec.pip_value
+
             # Add logging to debug PnL for each trade
             logger.info(f"TRADE: {signal.upper()} | Entry: {entry_price:.5f}, Exit: {exit_price:.5f}, PnL: ${pnl_amount:.2f}")
 
             # PnL in account currency
             balance += pnl_amount
             positions.append({'time': entry_time, 'signal': signal, 'price': entry_price, 'lot': lot, 'pnl': pnl_amount, 'balance': balance})
-            
+
     logger.info(f"Backtest complete. Final balance: {balance:.2f}")
     if not positions:
         return pd.DataFrame()
-    return pd.DataFrame(positions) 
\ No newline at end of file
+    return pd.DataFrame(positions)
+
+def load_history(symbol, timeframe):
+    """
+    Loads bars for symbol from the bar store, falling back to
+    historical_{symbol}_{timeframe}.csv. Either way 'time' is datetime64.
+    Returns None if neither has data.
+    """
+    df = bar_store.load_bars(symbol, timeframe)
+    if df is not None:
+        logger.info(f"Loaded {len(df)} bars for {symbol} from the bar store")
+    else:
+        file_path = f'historical_{symbol}_{timeframe}.csv'
+        logger.info(f"Loading data for {symbol} from {file_path}...")
+        try:
+            df = pd.read_csv(file_path, parse_dates=['time'])
+        except FileNotFoundError:
+            logger.warning(f"Historical data file not found for {symbol} at {file_path}. Skipping.")
+            return None
+    if df.empty:
+        logger.warning(f"Data file for {symbol} is empty. Skipping.")
+        return None
+    return df
+
+def iter_history(symbol, timeframe, chunk_bars):
+    """
+    The same bars as load_history, as DataFrames of at most chunk_bars rows
+    in time order. Bar store columns are sliced from the memory map and a
+    CSV is parsed chunk by chunk, so only one chunk is in memory at a time.
+    Yields nothing if neither has data.
+    """
+    arrays = bar_store.load_arrays(symbol, timeframe, columns=['time', 'open', 'high', 'low', 'close'])
+    if arrays is not None:
+        for start in range(0, len(arrays['time']), chunk_bars):
+            chunk = {name: np.asarray(values[start:start + chunk_bars]) for name, values in arrays.items()}
+            chunk['time'] = pd.to_datetime(chunk['time'], unit='s')
+            yield pd.DataFrame(chunk)
+        return
+    file_path = f'historical_{symbol}_{timeframe}.csv'
+    try:
+        reader = pd.read_csv(file_path, chunksize=chunk_bars)
+    except FileNotFoundError:
+        logger.warning(f"Historical data file not found for {symbol} at {file_path}. Skipping.")
+        return
+    with reader:
+        for chunk in reader:
+            chunk['time'] = pd.to_datetime(chunk['time'])
+            yield chunk
+
+def load_intrabar(symbol, timeframe, bars, intrabar_timeframe=INTRABAR_TIMEFRAME):
+    """
+    Finer-timeframe data for resolving same-bar SL/TP hits, as the tuple
+    find_exits expects, or None when it is disabled or not stored. The finer
+    bars stay memory-mapped; only the ambiguous bars' rows are ever read.
+    """
+    if not intrabar_timeframe or intrabar_timeframe == timeframe:
+        return None
+    index = bar_store.load_timeframe_index(symbol, timeframe, intrabar_timeframe)
+    if index is None or len(index[0]) != bars:
+        # The index describes the stored series; the data came from elsewhere
+        return None
+    fine = bar_store.load_arrays(symbol, intrabar_timeframe, columns=['high', 'low'])
+    return index[0], index[1], fine['high'], fine['low']
+
+def stored_intrabar(symbol, timeframe):
+    """Intrabar data for a symbol whose bars come from the bar store, else None."""
+    arrays = bar_store.load_arrays(symbol, timeframe, columns=['time'])
+    if arrays is None:
+        return None
+    return load_intrabar(symbol, timeframe, len(arrays['time']))
+
+def stream_backtest(symbol, timeframe, initial_balance=None, chunk_bars=None, verbosity=BACKTEST_VERBOSITY, **kwargs):
+    """
+    iter_backtest over the symbol's history, read by iter_history in chunks
+    of chunk_bars (default BACKTEST_CHUNK_BARS), collected into the frame
+    run_backtest would return and logged the same way. kwargs go to
+    iter_backtest; the symbol's spec and stored intrabar data are the defaults.
+    """
+    if initial_balance is None:
+        initial_balance = INITIAL_BALANCE
+    kwargs.setdefault('spec', get_symbol_spec(symbol))
+    kwargs.setdefault('intrabar', stored_intrabar(symbol, timeframe))
+    chunks = iter_history(symbol, timeframe, chunk_bars or BACKTEST_CHUNK_BARS)
+    results = pd.DataFrame(list(iter_backtest(chunks, initial_balance, **kwargs)))
+    if verbosity >= VERBOSITY_SUMMARY:
+        log_summary(results, initial_balance, symbol)
+    if verbosity >= VERBOSITY_TRADES and not results.empty:
+        dump_trades(results, symbol)
+    return results
+
+def backtest_symbol(symbol, timeframe, initial_balance=None):
+    """
+    Loads the history for symbol and backtests it, streaming it in chunks
+    when BACKTEST_CHUNK_BARS is set.
+    Returns (symbol, results) where results is None if the data is missing or
+    empty. Lives at module level so it can run in a worker process.
+    """
+    if BACKTEST_CHUNK_BARS:
+        results = stream_backtest(symbol, timeframe, initial_balance)
+        if not results.empty:
+            results['symbol'] = symbol
+        return symbol, results
+
+    df = load_history(symbol, timeframe)
+    if df is None:
+        return symbol, None
+
+    results = run_backtest(
+        df, initial_balance=initial_balance, intrabar=load_intrabar(symbol, timeframe, len(df)),
+        spec=get_symbol_spec(symbol), name=symbol,
+    )
+    if not results.empty:
+        # We need to add the symbol to the results to differentiate trades
+        results['symbol'] = symbol
+    return symbol, results
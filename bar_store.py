@@ -0,0 +1,247 @@
+"""
+Columnar local store for OHLC bars.
+
+Each symbol/timeframe series is a directory under BAR_STORE_DIR holding one
+.npy file per column, with times as int64 epoch seconds:
+
+    data/EURUSD_M15/time.npy, open.npy, high.npy, low.npy, close.npy,
+                    tick_volume.npy, spread.npy, real_volume.npy
+
+Columns are memory-mapped on load, so a date-range slice only touches the
+pages it needs and no text parsing happens at all.
+
+Usage:
+    python bar_store.py import     # one-shot import of historical_*.csv files
+"""
+import glob
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+from config import BAR_STORE_DIR
+
+COLUMNS = {
+    'time': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'tick_volume': np.int64,
+    'spread': np.int32,
+    'real_volume': np.int64,
+}
+
+def series_dir(symbol, timeframe, root=None):
+    return os.path.join(root or BAR_STORE_DIR, f"{symbol}_{timeframe}")
+
+def has_bars(symbol, timeframe, root=None):
+    return os.path.exists(os.path.join(series_dir(symbol, timeframe, root), 'time.npy'))
+
+def _to_epoch(times):
+    """Converts a time column (datetime, string or epoch seconds) to int64 epoch seconds."""
+    if np.issubdtype(np.asarray(times).dtype, np.integer):
+        return np.asarray(times, dtype=np.int64)
+    return pd.to_datetime(times).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+def _to_columns(df):
+    """Typed column arrays for a bar frame; missing volume/spread columns are zero-filled."""
+    columns = {'time': _to_epoch(df['time'])}
+    for name, dtype in COLUMNS.items():
+        if name == 'time':
+            continue
+        if name in df.columns:
+            columns[name] = df[name].to_numpy(dtype=dtype)
+        else:
+            columns[name] = np.zeros(len(df), dtype=dtype)
+    return columns
+
+def save_bars(symbol, timeframe, df, root=None):
+    """
+    Replaces the stored series with df. Rows are sorted by time and duplicate
+    times keep the last row. Written to a temporary directory first so readers
+    never see a half-written series.
+    """
+    columns = _to_columns(df)
+    order = np.argsort(columns['time'], kind='stable')
+    times = columns['time'][order]
+    # Keep the last occurrence of each timestamp
+    keep = np.r_[times[1:] != times[:-1], True] if len(times) else np.zeros(0, dtype=bool)
+
+    path = series_dir(symbol, timeframe, root)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values[order][keep])
+    old_path = f"{path}.old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return int(keep.sum())
+
+def load_arrays(symbol, timeframe, start=None, end=None, root=None, columns=None):
+    """
+    Memory-mapped column arrays for bars with start <= time <= end.
+    Slices are views into the mapped files, so nothing is copied until used.
+    Returns None if the series is not stored.
+    """
+    if not has_bars(symbol, timeframe, root):
+        return None
+    path = series_dir(symbol, timeframe, root)
+    times = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+    lo = 0 if start is None else int(np.searchsorted(times, _to_epoch([start])[0], side='left'))
+    hi = len(times) if end is None else int(np.searchsorted(times, _to_epoch([end])[0], side='right'))
+    arrays = {}
+    for name in columns or COLUMNS:
+        values = times if name == 'time' else np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+        arrays[name] = values[lo:hi]
+    return arrays
+
+def last_time(symbol, timeframe, root=None):
+    """Epoch seconds of the newest stored bar, or None if the series is empty or missing."""
+    arrays = load_arrays(symbol, timeframe, root=root, columns=['time'])
+    if arrays is None or len(arrays['time']) == 0:
+        return None
+    return int(arrays['time'][-1])
+
+def first_time(symbol, timeframe, root=None):
+    """Epoch seconds of the oldest stored bar, or None if the series is empty or missing."""
+    arrays = load_arrays(symbol, timeframe, root=root, columns=['time'])
+    if arrays is None or len(arrays['time']) == 0:
+        return None
+    return int(arrays['time'][0])
+
+def _write_rows_npy(path, start_row, values):
+    """
+    Writes `values` into a 1-D .npy file starting at row start_row, truncating
+    anything after them, and updates the header in place. Returns False when
+    the file cannot be extended in place (format or dtype mismatch, or the new
+    shape does not fit in the existing header padding).
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0):
+            return False
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        data_start = f.tell()
+        if fortran_order or len(shape) != 1 or dtype != values.dtype or start_row > shape[0]:
+            return False
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), start_row + len(values))
+        # magic (6) + version (2) + header length (2) precede the header text
+        header_space = data_start - 10
+        if len(header) + 1 > header_space:
+            return False
+        # Data first, header last: a crash in between leaves the old shape valid
+        f.seek(data_start + start_row * dtype.itemsize)
+        f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate()
+        f.seek(10)
+        f.write((header.ljust(header_space - 1) + '\n').encode('latin1'))
+    return True
+
+def append_bars(symbol, timeframe, df, root=None):
+    """
+    Adds bars to a stored series and returns how many new bars it gained.
+    Bars newer than the last stored one are appended in place, replacing the
+    last stored bar if it is fetched again (it may have still been forming).
+    Anything older, e.g. a backfill of earlier history, is merged with a full
+    rewrite where the fetched rows win on duplicate times.
+    """
+    if not has_bars(symbol, timeframe, root):
+        return save_bars(symbol, timeframe, df, root=root)
+
+    columns = _to_columns(df)
+    order = np.argsort(columns['time'], kind='stable')
+    columns = {name: values[order] for name, values in columns.items()}
+    times = columns['time']
+    if len(times) == 0:
+        return 0
+    keep = np.r_[times[1:] != times[:-1], True]
+    columns = {name: values[keep] for name, values in columns.items()}
+    times = columns['time']
+
+    path = series_dir(symbol, timeframe, root)
+    stored_times = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+    count = len(stored_times)
+    stored_last = int(stored_times[-1]) if count else None
+    del stored_times
+
+    if stored_last is None or times[0] >= stored_last:
+        start_row = count - 1 if stored_last is not None and times[0] == stored_last else count
+        # time.npy goes last so its length always bounds the valid rows
+        names = [name for name in COLUMNS if name != 'time'] + ['time']
+        written = True
+        for name in names:
+            if not _write_rows_npy(os.path.join(path, f"{name}.npy"), start_row, columns[name]):
+                written = False
+                break
+        if written:
+            return start_row + len(times) - count
+
+    existing = load_bars(symbol, timeframe, root=root)
+    merged = pd.concat([existing, pd.DataFrame(columns).assign(time=pd.to_datetime(times, unit='s'))], ignore_index=True)
+    return save_bars(symbol, timeframe, merged, root=root) - len(existing)
+
+def load_bars(symbol, timeframe, start=None, end=None, root=None):
+    """Bars with start <= time <= end as a DataFrame with a datetime 'time' column, or None."""
+    arrays = load_arrays(symbol, timeframe, start=start, end=end, root=root)
+    if arrays is None:
+        return None
+    df = pd.DataFrame({name: np.asarray(values) for name, values in arrays.items()})
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df
+
+def load_timeframe_index(symbol, high_tf, low_tf, root=None):
+    """
+    For every stored high_tf bar, the half-open range [start, end) of the
+    low_tf rows that fall inside it, e.g. the M1 bars making up each M15 bar.
+    Built with one searchsorted pass and cached next to the high_tf series;
+    the cache is rebuilt only when either series has changed.
+    Returns (start, end) int64 arrays, or None if either series is missing.
+    """
+    from utils import timeframe_seconds
+    high = load_arrays(symbol, high_tf, root=root, columns=['time'])
+    low = load_arrays(symbol, low_tf, root=root, columns=['time'])
+    if high is None or low is None:
+        return None
+    high_times, low_times = high['time'], low['time']
+    meta = np.array([
+        len(high_times), high_times[-1] if len(high_times) else 0,
+        len(low_times), low_times[-1] if len(low_times) else 0,
+    ], dtype=np.int64)
+
+    cache_path = os.path.join(series_dir(symbol, high_tf, root), f"index_{low_tf}.npz")
+    try:
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached['meta'], meta):
+                return cached['start'], cached['end']
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+
+    start = np.searchsorted(low_times, high_times, side='left').astype(np.int64)
+    end = np.searchsorted(low_times, np.asarray(high_times) + timeframe_seconds(high_tf), side='left').astype(np.int64)
+    tmp_path = f"{cache_path}.tmp.npz"
+    np.savez(tmp_path, start=start, end=end, meta=meta)
+    os.replace(tmp_path, cache_path)
+    return start, end
+
+def import_csv(file_path, symbol, timeframe, root=None):
+    """Imports a historical_{symbol}_{timeframe}.csv file into the store."""
+    df = pd.read_csv(file_path)
+    return save_bars(symbol, timeframe, df, root=root)
+
+def import_all_csv(pattern='historical_*_*.csv', root=None):
+    """One-shot import of every historical CSV matching pattern in the working directory."""
+    for file_path in sorted(glob.glob(pattern)):
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        symbol, timeframe = name[len('historical_'):].rsplit('_', 1)
+        count = import_csv(file_path, symbol, timeframe, root=root)
+        print(f"Imported {count} bars from {file_path} into {series_dir(symbol, timeframe, root)}")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'import':
+        import_all_csv()
+    else:
+        print(__doc__)
@@ -0,0 +1,273 @@
+"""
+Benchmarks for the strategy, backtest and dashboard hot paths.
+
+Every case runs on seeded synthetic OHLC bars, so results are reproducible
+and nothing needs MetaTrader5 or historical files. Each case is timed
+BENCHMARK_REPEAT times (the minimum and median are reported) and then run
+once more under tracemalloc for its peak memory. Results are written as
+JSON and can be compared against a saved baseline run.
+
+Usage:
+    python benchmark.py                              # default sizes
+    python benchmark.py --sizes 1000 10000000        # choose bar counts
+    python benchmark.py --baseline logs/benchmark_baseline.json
+    cp logs/benchmark_results.json logs/benchmark_baseline.json   # accept a run as the baseline
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from strategy import generate_signal, generate_signals
+from backtest import run_backtest
+from dashboard_data import JournalTradeLog, lttb
+import indicators
+from indicators import IndicatorState, live_signal, restore_live_states, save_states
+from journal import TradeJournal
+
+# --- Benchmark Settings ---
+BENCHMARK_SIZES = [1_000, 10_000, 100_000, 1_000_000]  # Bars per series; add 10_000_000 for a full run
+BENCHMARK_SYMBOLS = 8  # Series in the multi-symbol case
+BENCHMARK_REPEAT = 3
+BENCHMARK_SEED = 42
+BENCHMARK_LIVE_SCANS = 1_000  # New bars evaluated in the live_signal case
+LIVE_FETCH_BARS = 100  # Bars the live scan fetches per symbol (see main.scan_and_trade)
+BENCHMARK_THRESHOLD = 0.2  # A case is a regression when it is this much slower than the baseline
+BENCHMARK_RESULTS_FILE = 'logs/benchmark_results.json'
+
+def synthetic_bars(n, seed=BENCHMARK_SEED, start_price=1.1):
+    """n M15 bars of a seeded geometric random walk, shaped like the historical CSVs."""
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    open_ = np.r_[start_price, close[:-1]]
+    high = np.maximum(open_, close) + np.abs(rng.normal(0, 0.0004, n)) * start_price
+    low = np.minimum(open_, close) - np.abs(rng.normal(0, 0.0004, n)) * start_price
+    return pd.DataFrame({
+        'time': pd.date_range('2000-01-01', periods=n, freq='15min'),
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'tick_volume': rng.integers(50, 500, n), 'spread': 10, 'real_volume': 0,
+    })
+
+def synthetic_trades(n, seed=BENCHMARK_SEED, symbols=5):
+    """n trade rows in the layout of logs/backtest_results.csv."""
+    rng = np.random.default_rng(seed)
+    pnl = rng.normal(2.0, 40.0, n)
+    return pd.DataFrame({
+        'time': pd.date_range('2000-01-01', periods=n, freq='15min'),
+        'signal': np.where(rng.random(n) < 0.5, 'buy', 'sell'),
+        'price': 1.1 + rng.normal(0, 0.01, n),
+        'lot': 0.1,
+        'pnl': pnl,
+        'balance': 10000 + np.cumsum(pnl),
+        'symbol': np.array([f"SYN{i}" for i in range(symbols)])[rng.integers(0, symbols, n)],
+    })
+
+def _backtest_frame(df):
+    # Module level so it can run in a worker process
+    return len(run_backtest(df))
+
+# --- Cases ---
+# Each returns a zero-argument callable to time; setup (data generation)
+# happens outside the timed region.
+
+def case_signals(n):
+    df = synthetic_bars(n)
+    return lambda: generate_signals(df)
+
+def case_live_signal(n, tmp_dir=None):
+    # The live scan's hot path: restore the checkpointed indicator state, then
+    # one indicators.live_signal call per new bar on the LIVE_FETCH_BARS frame
+    # the scan fetches. The first n - scans bars only build the checkpoint.
+    df = synthetic_bars(n)
+    scans = min(BENCHMARK_LIVE_SCANS, n // 2)
+    warm = len(df) - scans
+    state = IndicatorState()
+    state.update_frame(df.iloc[:warm - 1])
+    path = os.path.join(tmp_dir or tempfile.gettempdir(), f"benchmark_indicator_state_{n}.json")
+    save_states({'SYN': state}, path)
+    frames = [df.iloc[max(0, end - LIVE_FETCH_BARS):end] for end in range(warm, len(df))]
+
+    def run():
+        indicators._live_states.clear()
+        restore_live_states(path)
+        for frame in frames:
+            live_signal('SYN', frame)
+    return run
+
+def case_generate_signal(n):
+    # strategy.generate_signal recomputed over a frame of n bars
+    df = synthetic_bars(n)
+    return lambda: generate_signal(df)
+
+def case_backtest(n):
+    df = synthetic_bars(n)
+    return lambda: run_backtest(df)
+
+def case_multi_symbol(n, symbols=BENCHMARK_SYMBOLS, workers=None):
+    frames = [synthetic_bars(n, seed=BENCHMARK_SEED + i) for i in range(symbols)]
+    workers = workers or min(symbols, os.cpu_count() or 1)
+
+    # Peak memory covers the parent process only
+    def run():
+        if workers <= 1:
+            return [_backtest_frame(df) for df in frames]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_backtest_frame, frames))
+    return run
+
+def case_dashboard_metrics(n, tmp_dir=None):
+    path = os.path.join(tmp_dir or tempfile.gettempdir(), f"benchmark_trades_{n}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    journal = TradeJournal(path)
+    journal.add_frame(journal.start_run('backtest'), synthetic_trades(n))
+    journal.close()
+    page_size = 100
+
+    def run():
+        # Cold load of the journal plus the queries of one unfiltered and one filtered page render
+        journal = TradeJournal(path)
+        try:
+            log = JournalTradeLog(journal, 'backtest')
+            log.refresh()
+            stats = log.stats_for(log.symbols)
+            stats.win_rate, stats.profit_factor, stats.sharpe, stats.max_drawdown
+            first, last = log.time_range()
+            for filters in ({'symbols': log.symbols}, {'symbols': ['SYN0', 'SYN1'], 'start': first, 'end': first + (last - first) / 2}):
+                count = log.count(**filters)
+                log.window_stats(**filters)
+                series = log.balance_series(8000, **filters)
+                lttb(series['trade'], series['balance'], 2000)
+                log.pnl_histogram(30, **filters)
+                log.query(offset=max(0, count - page_size), limit=page_size, **filters)
+        finally:
+            journal.close()
+    return run
+
+CASES = {
+    'signals': case_signals,
+    'live_signal': case_live_signal,
+    'generate_signal': case_generate_signal,
+    'backtest': case_backtest,
+    'multi_symbol': case_multi_symbol,
+    'dashboard_metrics': case_dashboard_metrics,
+}
+
+def measure(fn, repeat=BENCHMARK_REPEAT):
+    """Times fn `repeat` times, then runs it once under tracemalloc. Returns (seconds list, peak bytes)."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+def run_benchmarks(sizes=None, cases=None, repeat=BENCHMARK_REPEAT, symbols=BENCHMARK_SYMBOLS, workers=None):
+    """Runs every case at every size and returns the results document."""
+    sizes = sizes or BENCHMARK_SIZES
+    cases = cases or list(CASES)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in cases:
+            for n in sizes:
+                if name == 'multi_symbol':
+                    fn = case_multi_symbol(n, symbols=symbols, workers=workers)
+                elif name in ('dashboard_metrics', 'live_signal'):
+                    fn = CASES[name](n, tmp_dir=tmp_dir)
+                else:
+                    fn = CASES[name](n)
+                seconds, peak = measure(fn, repeat)
+                row = {
+                    'case': name,
+                    'bars': n,
+                    'symbols': symbols if name == 'multi_symbol' else 1,
+                    'seconds_min': min(seconds),
+                    'seconds_median': statistics.median(seconds),
+                    'peak_mb': peak / 2**20,
+                }
+                results.append(row)
+                print(f"{name:<18} {n:>10,} bars  min {row['seconds_min']:9.4f}s  median {row['seconds_median']:9.4f}s  peak {row['peak_mb']:9.1f} MB")
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': BENCHMARK_SEED,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def _key(row):
+    return row['case'], row['bars'], row['symbols']
+
+def compare(current, baseline, threshold=BENCHMARK_THRESHOLD):
+    """
+    Compares minimum times case by case. Returns a list of
+    (case, bars, symbols, baseline seconds, current seconds, ratio, regressed).
+    Cases missing from either run are skipped.
+    """
+    base = {_key(row): row for row in baseline['results']}
+    rows = []
+    for row in current['results']:
+        old = base.get(_key(row))
+        if old is None or old['seconds_min'] <= 0:
+            continue
+        ratio = row['seconds_min'] / old['seconds_min']
+        rows.append((*_key(row), old['seconds_min'], row['seconds_min'], ratio, ratio > 1 + threshold))
+    return rows
+
+def save_results(results, path=BENCHMARK_RESULTS_FILE):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the strategy, backtest and dashboard hot paths.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES, help="Bar counts per series")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help="Cases to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--symbols', type=int, default=BENCHMARK_SYMBOLS, help="Series in the multi-symbol case")
+    parser.add_argument('--workers', type=int, help="Processes for the multi-symbol case (default: one per symbol, up to the core count)")
+    parser.add_argument('--output', default=BENCHMARK_RESULTS_FILE)
+    parser.add_argument('--baseline', help="Results file to compare against")
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_THRESHOLD, help="Allowed slowdown before a case counts as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.cases, args.repeat, args.symbols, args.workers)
+    save_results(results, args.output)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline} (threshold +{args.threshold:.0%}):")
+        for case, bars, symbols, old, new, ratio, regressed in rows:
+            flag = 'REGRESSION' if regressed else ''
+            print(f"{case:<18} {bars:>10,} bars  {old:9.4f}s -> {new:9.4f}s  x{ratio:5.2f}  {flag}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,24 @@
+import threading
+import time
 import MetaTrader5 as mt5
-from config import ACCOUNT_LOGIN, ACCOUNT_PASSWORD, SERVER
+from config import ACCOUNT_LOGIN, ACCOUNT_PASSWORD, SERVER, ORDER_DEVIATION, ORDER_RETRY_BUDGET, ORDER_MAX_ATTEMPTS
 from utils import setup_logger
 from notifier import send_telegram
+from instrumentation import inc, observe, span, SLIPPAGE_BUCKETS
+from symbol_registry import get_symbol_spec, refresh_if_stale
+from risk import round_volume
 
 logger = setup_logger('broker')
 
+MAGIC = 234000  # Tags this bot's orders, so its positions can be told apart
+
+# The MetaTrader5 package talks to one terminal over a single IPC channel and
+# keeps last_error() per process, so calls from the scan's fetch threads and
+# the main thread must not interleave. Every terminal call made while a scan
+# is running (and the last_error() that explains it) holds this lock; it is
+# only held for the call itself, so fetches still overlap signal evaluation.
+_terminal = threading.RLock()
+
 def _get_mt5_timeframe(timeframe_str):
     # Converts string like 'M15' to mt5.TIMEFRAME_M15
     try:
@@ -18,6 +32,7 @@ def connect():
         logger.error(f"MT5 initialize() failed, error code: {mt5.last_error()}")
         return False
     logger.info("Connected to MetaTrader 5")
+    refresh_if_stale()
     return True
 
 def disconnect():
@@ -25,49 +40,198 @@ def disconnect():
     logger.info("Disconnected from MetaTrader 5")
 
 def get_account_info():
-    info = mt5.account_info()
+    with _terminal:
+        info = mt5.account_info()
     if info is None:
         logger.error("Failed to get account info")
         return None
     return info
 
+def get_tick(symbol):
+    """The latest tick (time, bid, ask, last) for symbol, or None."""
+    with _terminal:
+        tick = mt5.symbol_info_tick(symbol)
+        if tick is None:
+            logger.error(f"No tick for {symbol}: {mt5.last_error()}")
+    return tick
+
+def get_positions(symbol=None):
+    """This bot's open positions, for one symbol or all of them."""
+    with _terminal:
+        positions = mt5.positions_get(symbol=symbol) if symbol else mt5.positions_get()
+        if positions is None:
+            logger.error(f"positions_get() failed: {mt5.last_error()}")
+            return []
+    return [position for position in positions if position.magic == MAGIC]
+
+def get_server_time_offset(symbol):
+    """
+    Offset of the broker's server clock from UTC in seconds, rounded to the
+    half hour, estimated from the latest tick. Returns 0 if it can't be told.
+    """
+    with _terminal:
+        tick = mt5.symbol_info_tick(symbol)
+    if tick is None:
+        return 0
+    offset = round((tick.time - time.time()) / 1800) * 1800
+    # A stale tick (e.g. over a weekend) says nothing about the offset
+    return offset if abs(offset) <= 14 * 3600 else 0
+
 def get_historical_data(symbol, timeframe, bars=100):
     mt5_timeframe = _get_mt5_timeframe(timeframe)
     if mt5_timeframe is None:
         return None
-    rates = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 0, bars)
+    with _terminal:
+        rates = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 0, bars)
+        if rates is None or len(rates) == 0:
+            logger.error(f"No rates returned for {symbol} {timeframe}: {mt5.last_error()}")
+            return None
     import pandas as pd
     df = pd.DataFrame(rates)
     df['time'] = pd.to_datetime(df['time'], unit='s')
     return df
 
-def place_order(symbol, direction, lot, sl, tp):
-    price = mt5.symbol_info_tick(symbol).ask if direction == 'buy' else mt5.symbol_info_tick(symbol).bid
-    order_type = mt5.ORDER_TYPE_BUY if direction == 'buy' else mt5.ORDER_TYPE_SELL
+def _record_slippage(symbol, direction, fill_price, requested_price, signal_price):
+    # Positive slippage is against us: paid more on a buy, got less on a sell
+    sign = 1 if direction == 'buy' else -1
+    pip_size = get_symbol_spec(symbol).pip_size
+    slippage = (fill_price - requested_price) * sign / pip_size
+    observe('bot_slippage_pips', slippage, buckets=SLIPPAGE_BUCKETS, reference='requested')
+    if signal_price is not None:
+        observe('bot_slippage_pips', (fill_price - signal_price) * sign / pip_size, buckets=SLIPPAGE_BUCKETS, reference='signal')
+    return slippage
+
+# Rejections that only mean the price moved; retried at a fresh price
+_RETRY_RETCODES = (mt5.TRADE_RETCODE_REQUOTE, mt5.TRADE_RETCODE_PRICE_CHANGED, mt5.TRADE_RETCODE_PRICE_OFF)
+# order_check reports success as 0 ("Done")
+_CHECK_OK = (0, mt5.TRADE_RETCODE_DONE)
+_FILLING_MODES = (mt5.ORDER_FILLING_IOC, mt5.ORDER_FILLING_FOK, mt5.ORDER_FILLING_RETURN)
+_filling = {}  # symbol -> order filling mode order_check last accepted
+
+def _filling_modes(symbol, spec):
+    """
+    Filling modes to try for symbol, best first: the one that worked last
+    time, then those the symbol's cached SYMBOL_FILLING_* mask allows
+    (IOC if unknown), then the rest.
+    """
+    preferred = []
+    if symbol in _filling:
+        preferred.append(_filling[symbol])
+    if spec.filling_mode is None:
+        preferred.append(mt5.ORDER_FILLING_IOC)
+    else:
+        if spec.filling_mode & mt5.SYMBOL_FILLING_IOC:
+            preferred.append(mt5.ORDER_FILLING_IOC)
+        if spec.filling_mode & mt5.SYMBOL_FILLING_FOK:
+            preferred.append(mt5.ORDER_FILLING_FOK)
+    return list(dict.fromkeys(preferred + list(_FILLING_MODES)))
+
+def _quote(symbol, direction):
+    """The price a market order would take now (one tick snapshot), or None."""
+    with span('bot_broker_seconds', call='symbol_info_tick'):
+        tick = get_tick(symbol)
+    if tick is None:
+        return None
+    return tick.ask if direction == 'buy' else tick.bid
+
+def _check(symbol, spec, request):
+    """
+    Pre-validates request with order_check, moving on to the next filling
+    mode when the current one is refused, and remembers the mode that was
+    accepted. Returns an error message, or None if the order can be sent.
+    """
+    for mode in _filling_modes(symbol, spec):
+        request['type_filling'] = mode
+        with _terminal:
+            with span('bot_broker_seconds', call='order_check'):
+                check = mt5.order_check(request)
+            if check is None:
+                # The terminal could not check it; order_send has the final word
+                logger.warning(f"order_check() returned nothing for {symbol}: {mt5.last_error()}")
+                return None
+        inc('bot_order_check_total', retcode=check.retcode)
+        if check.retcode in _CHECK_OK:
+            _filling[symbol] = mode
+            return None
+        if check.retcode != mt5.TRADE_RETCODE_INVALID_FILL:
+            return f"{check.comment} ({check.retcode})"
+    _filling.pop(symbol, None)
+    return "no filling mode accepted"
+
+def place_order(symbol, direction, lot, sl, tp, signal_price=None):
+    """
+    Sends a market order. The price comes from one tick snapshot, the volume
+    is rounded to the symbol's step and limits, and the request is checked
+    with order_check first (see _check for the filling mode). Requotes and
+    off-quotes are re-sent at a fresh price until ORDER_RETRY_BUDGET seconds
+    or ORDER_MAX_ATTEMPTS sends; any other rejection is final.
+
+    Terminal call latencies, every retcode, the submit-to-fill latency and,
+    for fills, the slippage in pips against the requested price and against
+    signal_price (the price the signal was computed at) are recorded in the
+    instrumentation metrics.
+    """
+    spec = get_symbol_spec(symbol)
+    volume = round_volume(lot, spec)
+    price = _quote(symbol, direction)
+    if price is None:
+        inc('bot_order_retcode_total', retcode='no_tick')
+        return False
     request = {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
-        "volume": lot,
-        "type": order_type,
+        "volume": volume,
+        "type": mt5.ORDER_TYPE_BUY if direction == 'buy' else mt5.ORDER_TYPE_SELL,
         "price": price,
         "sl": sl,
         "tp": tp,
-        "deviation": 10,
-        "magic": 234000,
+        "deviation": ORDER_DEVIATION,
+        "magic": MAGIC,
         "comment": "AI Forex Bot",
         "type_time": mt5.ORDER_TIME_GTC,
         "type_filling": mt5.ORDER_FILLING_IOC,
     }
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        logger.error(f"Order failed: {result.comment}")
-        send_telegram(
-            f"❌ Trade FAILED:\nSymbol: {symbol}\nDirection: {direction}\nLot: {lot}\nEntry: {price:.5f}\nSL: {sl:.5f}\nTP: {tp:.5f}\nError: {result.comment}"
-        )
-        return False
-    logger.info(f"Order placed: {direction} {lot} lots at {price}")
+    error = _check(symbol, spec, request)
+
+    submitted = time.perf_counter()
+    attempts = 0
+    while error is None:
+        attempts += 1
+        with _terminal:
+            with span('bot_broker_seconds', call='order_send'):
+                result = mt5.order_send(request)
+            if result is None:
+                error = f"order_send() returned nothing: {mt5.last_error()}"
+        if result is None:
+            inc('bot_order_retcode_total', retcode='none')
+            break
+        inc('bot_order_retcode_total', retcode=result.retcode)
+        if result.retcode == mt5.TRADE_RETCODE_DONE:
+            latency = time.perf_counter() - submitted
+            observe('bot_order_fill_seconds', latency)
+            fill_price = result.price or price
+            slippage = _record_slippage(symbol, direction, fill_price, price, signal_price)
+            logger.info(
+                f"Order placed: {direction} {volume} lots of {symbol} at {fill_price} "
+                f"(requested {price}, slippage {slippage:+.1f} pips, {attempts} send(s), {latency * 1000:.1f} ms)"
+            )
+            send_telegram(
+                f"✅ Trade executed:\nSymbol: {symbol}\nDirection: {direction}\nLot: {volume}\nEntry: {fill_price:.5f}\nSL: {sl:.5f}\nTP: {tp:.5f}"
+            )
+            return True
+        error = f"{result.comment} ({result.retcode})"
+        if result.retcode not in _RETRY_RETCODES or attempts >= ORDER_MAX_ATTEMPTS or time.perf_counter() - submitted >= ORDER_RETRY_BUDGET:
+            break
+        fresh = _quote(symbol, direction)
+        if fresh is None:
+            break
+        inc('bot_order_retries_total', retcode=result.retcode)
+        logger.warning(f"{error} for {symbol} at {price}; re-sending at {fresh}")
+        request['price'] = price = fresh
+        error = None
+
+    logger.error(f"Order failed for {symbol} after {attempts} send(s): {error}")
     send_telegram(
-        f"✅ Trade executed:\nSymbol: {symbol}\nDirection: {direction}\nLot: {lot}\nEntry: {price:.5f}\nSL: {sl:.5f}\nTP: {tp:.5f}"
+        f"❌ Trade FAILED:\nSymbol: {symbol}\nDirection: {direction}\nLot: {volume}\nEntry: {price:.5f}\nSL: {sl:.5f}\nTP: {tp:.5f}\nError: {error}"
     )
-    return True
-# NOTE: Pip value is hardcoded for EURUSD ($10 per lot per pip). For other symbols, adjust risk.py accordingly. 
\ No newline at end of file
+    return False
@@ -11,6 +11,18 @@ SYMBOLS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCAD"]
 # Use MetaTrader 5 timeframes, e.g., 'M15', 'H1', 'D1', etc.
 TIMEFRAME = 'M15'
 
+# Number of threads used to fetch bars for all symbols during a live scan. The
+# terminal calls themselves are serialized (see broker._terminal); the threads
+# let later symbols' fetches run while earlier symbols are being evaluated.
+FETCH_WORKERS = 8
+
+# --- Daemon Mode ---
+# If True (or with `python main.py --daemon`), the bot stays running with one
+# MT5 session and scans right after every TIMEFRAME bar close.
+DAEMON = False
+DAEMON_BAR_CLOSE_DELAY = 1.0  # Seconds to wait after the bar close before scanning
+DAEMON_MAX_BACKOFF = 300  # Max seconds between reconnect attempts
+
 # --- Lot Sizing & Risk ---
 # This is the master switch for lot sizing method.
 # If True, the bot uses a fixed lot size defined by LOT_SIZE.
@@ -18,6 +30,10 @@ TIMEFRAME = 'M15'
 USE_FIXED_LOT_SIZE = False
 LOT_SIZE = 0.01  # Used only if USE_FIXED_LOT_SIZE is True
 RISK_PER_TRADE = 0.01  # Risk 1% of account balance per trade. Used if USE_FIXED_LOT_SIZE is False.
+# Max open positions per symbol for the live bot; further signals on that
+# symbol are skipped. None for no limit. (MAX_OPEN_POSITIONS below is the
+# backtest's; the replay applies it here to match the backtest.)
+LIVE_MAX_OPEN_POSITIONS = None
 
 # --- ATR-Based Stop-Loss and Take-Profit ---
 ATR_PERIOD = 14  # Period for ATR calculation
@@ -29,14 +45,89 @@ REWARD_RISK_RATIO = 1.5  # Take-profit will be X times the stop-loss distance
 # Set to False for live trading.
 BACKTEST = False
 INITIAL_BALANCE = 10000  # Starting balance for the backtest
+# Positions are held until stop-loss or take-profit. Set a number of bars to
+# also close them at the bar close after that many bars; None holds indefinitely.
+MAX_HOLDING_BARS = None
+# Finer timeframe (e.g. 'M1') used to decide whether SL or TP came first when
+# both fall inside one bar. Needs that series in the bar store. None assumes SL.
+INTRABAR_TIMEFRAME = None
+# Max simultaneously open positions per symbol; further signals are skipped. None for no limit.
+MAX_OPEN_POSITIONS = 1
+# Number of worker processes for the multi-symbol backtest. 1 runs the symbols
+# one after another; set to your core count to backtest symbols in parallel.
+# Only used when PORTFOLIO_BACKTEST is False.
+BACKTEST_WORKERS = 1
+# Backtest all symbols as one portfolio: bars are replayed in time order
+# across symbols and every trade is sized off one shared balance (see
+# portfolio.py). False (the default) backtests each symbol on its own balance,
+# using BACKTEST_WORKERS and BACKTEST_CHUNK_BARS.
+PORTFOLIO_BACKTEST = False
+# Max simultaneously open positions across all symbols. None for no limit.
+MAX_PORTFOLIO_POSITIONS = None
+# Bars held in memory by the portfolio backtest, split across the symbols
+PORTFOLIO_BUFFER_BARS = 500_000
+# Per-symbol backtests (PORTFOLIO_BACKTEST = False) read the history in
+# chunks of this many bars instead of loading it whole, so memory does not
+# grow with its length; the trades are the same. None loads it whole.
+BACKTEST_CHUNK_BARS = None
+
+# How much a backtest logs: 0 = errors only, 1 = one summary line per symbol,
+# 2 = the summary plus every trade as JSON lines in logs/backtest_trades_<symbol>.jsonl
+BACKTEST_VERBOSITY = 1
+
+# --- Order Execution ---
+ORDER_DEVIATION = 10  # Max slippage accepted on a market order, in points
+# Requotes and off-quotes are retried at a fresh price until this many
+# seconds have passed since the first send, or ORDER_MAX_ATTEMPTS sends.
+ORDER_RETRY_BUDGET = 2.0
+ORDER_MAX_ATTEMPTS = 5
+
+# --- Strategies ---
+# Registered strategies (see strategy.REGISTRY) evaluated on every bar, in
+# order; the first to signal trades. They share one set of indicators per
+# symbol, so extra strategies only cost the indicators they add.
+STRATEGIES = ['rsi_ma']
+
+# --- Higher-Timeframe Confirmation ---
+# Only take a signal when the short MA is above the long MA (buy) or below
+# it (sell) on each of these timeframes as well, e.g. ['H1', 'D1']. They are
+# resampled from the TIMEFRAME bars (see timeframes.py). Empty to disable.
+HTF_FILTERS = []
+HTF_MA_SHORT = 20
+HTF_MA_LONG = 50
+
+# --- Historical Data ---
+# Directory of the columnar bar store (see bar_store.py)
+BAR_STORE_DIR = 'data/'
+
+# --- Symbol Metadata ---
+# Digits, pip value and volume limits of every broker symbol, cached from one
+# bulk query (see symbol_registry.py) and refreshed when older than the TTL.
+SYMBOL_CACHE_FILE = 'data/symbols.json'
+SYMBOL_CACHE_TTL = 24 * 3600  # Seconds
 
 # --- Logging ---
+# Each component (main, broker, backtest, ...) logs to its own <name>.log here
 LOG_DIR = 'logs/'
 
+# --- Trade Journal ---
+# SQLite database holding live trades and backtest results (see journal.py)
+JOURNAL_FILE = 'logs/trades.db'
+JOURNAL_BATCH_SIZE = 5000  # Rows per insert batch
+
+# --- Metrics ---
+# Latency, slippage and order retcode metrics of the live loop are written to
+# this file (Prometheus text format) after every scan; the dashboard reads it.
+METRICS_FILE = 'logs/metrics.prom'
+# Streaming indicator state of every symbol, checkpointed after each live scan
+# so a restarted bot only folds in the bars it missed (see indicators.py)
+INDICATOR_STATE_FILE = 'logs/indicator_state.json'
+# Port for serving the same metrics at http://127.0.0.1:<port>/metrics in daemon mode. None to disable.
+METRICS_PORT = None
+
 # --- Telegram Notifications ---
 # Replace with your Telegram Bot Token and Chat ID
 TELEGRAM_TOKEN = 'YOUR_TELEGRAM_BOT_TOKEN' # <-- IMPORTANT: Replace with your real token
 TELEGRAM_CHAT_ID = 'YOUR_TELEGRAM_CHAT_ID' # <-- IMPORTANT: Replace with your real chat ID
-
-# NOTE: Pip value is currently hardcoded for major pairs.
-# A more advanced version would calculate this dynamically based on the symbol.
+# Base URL of the Bot API. Point it at a local stub server to test notifications offline.
+TELEGRAM_API_URL = 'https://api.telegram.org'
@@ -1,69 +1,92 @@
+import io
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
 from streamlit_autorefresh import st_autorefresh
-
-# Auto-refresh every 60 seconds
-st_autorefresh(interval=60000, key="datarefresh")
-
-# Data source selection
-data_source = st.selectbox("Select data source", ["Backtest", "Live"])
+from dashboard_data import JournalTradeLog, lttb
+from journal import TradeJournal
+from monte_carlo import analyze_run
+from instrumentation import read_metrics
+from config import METRICS_FILE
 
 # --- Page Configuration ---
+# Must be the first Streamlit call on the page
 st.set_page_config(
     page_title="Forex Bot Performance Dashboard",
     page_icon="🤖",
     layout="wide"
 )
 
+# Auto-refresh every 60 seconds
+st_autorefresh(interval=60000, key="datarefresh")
+
+# Charts send at most this many points to the browser, however many trades there are
+MAX_CHART_POINTS = 2000
+TRADE_LOG_PAGE_SIZE = 100
+
+# Data source selection
+data_source = st.selectbox("Select data source", ["Backtest", "Live"])
+
 # --- Load Data ---
-@st.cache_data
-def load_data(filepath):
-    try:
-        data = pd.read_csv(filepath)
-        if data.empty:
-            return "empty"
-        if 'time' in data.columns:
-            data['time'] = pd.to_datetime(data['time'])
-        return data
-    except FileNotFoundError:
-        return "not_found"
-    except pd.errors.EmptyDataError:
-        return "empty"
-
-# Use the selected data source
-results_obj = load_data('logs/backtest_results.csv' if data_source == "Backtest" else 'logs/trades.csv')
+# Trades come from the SQLite trade journal (see journal.py). One
+# JournalTradeLog per source is shared across reruns and sessions; each
+# refresh only reads rows added since the last one and updates the running
+# metrics, and the filters below are indexed range queries.
+@st.cache_resource
+def get_journal():
+    return TradeJournal()
+
+@st.cache_resource
+def get_trade_log(kind):
+    return JournalTradeLog(get_journal(), kind)
+
+trade_log = get_trade_log('backtest' if data_source == "Backtest" else 'live')
+status = trade_log.refresh()
 
 # --- Main Application ---
 st.title("🤖 Forex Bot Performance Dashboard")
 st.markdown("This dashboard visualizes the performance of the automated trading bot based on backtest or live results.")
 
-if isinstance(results_obj, str):
-    if results_obj == "not_found":
+if status != 'ok':
+    if status == "not_found":
         st.error("No data found. Please run a backtest or live trading session first.")
-    elif results_obj == "empty":
-        st.warning("The results file is empty. This usually means no trades were executed.")
+    elif status == "empty":
+        st.warning("No trades were recorded. This usually means no trades were executed.")
         st.info("💡 Try adjusting your strategy, symbol list, or the historical data range.")
 else:
-    results_df = results_obj
-
     # --- Filters ---
     st.sidebar.header("Filters")
-    symbols = results_df['symbol'].unique()
+    symbols = trade_log.symbols
     selected_symbols = st.sidebar.multiselect("Symbols", symbols, default=list(symbols))
-    filtered_df = results_df[results_df['symbol'].isin(selected_symbols)]
+    first_time, last_time = trade_log.time_range()
+    dates = st.sidebar.date_input(
+        "Dates", value=(first_time.date(), last_time.date()),
+        min_value=first_time.date(), max_value=last_time.date(),
+    )
+    start_date, end_date = (dates[0], dates[-1]) if len(dates) else (first_time.date(), last_time.date())
+    date_filtered = (start_date, end_date) != (first_time.date(), last_time.date())
+    # Only aggregates, a reduced balance series and one page of rows are read
+    # from the journal, so a refresh costs the same however many trades it holds
+    filters = {
+        'symbols': selected_symbols,
+        'start': pd.Timestamp(start_date) if date_filtered else None,
+        'end': pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if date_filtered else None,
+    }
+    trade_count = trade_log.count(**filters)
 
     # --- Key Performance Indicators (KPIs) ---
     st.header("Key Performance Metrics")
-    if 'pnl' in filtered_df.columns and 'balance' in filtered_df.columns:
-        total_trades = len(filtered_df)
-        winning_trades = len(filtered_df[filtered_df['pnl'] > 0])
-        win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
-        total_pnl = filtered_df['pnl'].sum()
-        gross_profit = filtered_df[filtered_df['pnl'] > 0]['pnl'].sum()
-        gross_loss = abs(filtered_df[filtered_df['pnl'] < 0]['pnl'].sum())
-        profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
+    if trade_count:
+        if date_filtered:
+            # Running stats cover whole runs; a date window is aggregated in the database
+            stats = trade_log.window_stats(**filters)
+        else:
+            stats = trade_log.stats_for(selected_symbols)
+        total_trades = stats.count
+        win_rate = stats.win_rate
+        total_pnl = stats.total_pnl
+        profit_factor = stats.profit_factor
 
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Total PnL", f"${total_pnl:,.2f}")
@@ -73,10 +96,10 @@ else:
 
         # --- Advanced Metrics ---
         st.header("Advanced Metrics")
-        avg_win = filtered_df[filtered_df['pnl'] > 0]['pnl'].mean()
-        avg_loss = filtered_df[filtered_df['pnl'] < 0]['pnl'].mean()
-        max_drawdown = (filtered_df['balance'].cummax() - filtered_df['balance']).max() if 'balance' in filtered_df.columns else None
-        sharpe = filtered_df['pnl'].mean() / filtered_df['pnl'].std() * np.sqrt(252) if filtered_df['pnl'].std() > 0 else None
+        avg_win = stats.avg_win
+        avg_loss = stats.avg_loss
+        max_drawdown = stats.max_drawdown
+        sharpe = stats.sharpe
 
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Avg Win", f"${avg_win:,.2f}")
@@ -86,37 +109,124 @@ else:
 
         # --- Equity Curve Chart ---
         st.header("Equity Curve")
-        fig = px.line(filtered_df, x=filtered_df.index, y='balance', title='Account Balance Over Time', labels={'index': 'Trade Number', 'balance': 'Account Balance ($)'})
+        # Reduced to bucket minima and maxima in SQLite, then LTTB to the chart's budget
+        series = trade_log.balance_series(MAX_CHART_POINTS * 4, **filters)
+        kept = lttb(series['trade'], series['balance'], MAX_CHART_POINTS)
+        equity = series.iloc[kept]
+        fig = px.line(equity, x='trade', y='balance', title='Account Balance Over Time', labels={'trade': 'Trade Number', 'balance': 'Account Balance ($)'})
         fig.update_layout(
             xaxis_title="Trade Number",
             yaxis_title="Account Balance ($)",
             template="plotly_dark"
         )
         st.plotly_chart(fig, use_container_width=True)
+        if len(kept) < trade_count:
+            st.caption(f"Showing {len(kept):,} of {trade_count:,} points (downsampled).")
 
         # --- Win/Loss Pie Chart ---
         st.header("Win vs Loss")
-        win_loss = filtered_df['pnl'] > 0
-        win_loss_counts = win_loss.value_counts()
-        fig_pie = px.pie(values=win_loss_counts, names=['Win', 'Loss'], title='Win vs Loss')
+        fig_pie = px.pie(values=[stats.wins, stats.count - stats.wins], names=['Win', 'Loss'], title='Win vs Loss')
         st.plotly_chart(fig_pie, use_container_width=True)
 
         # --- PnL Histogram ---
+        # Binned on the server so only the bar heights are sent
         st.header("PnL Distribution")
-        fig_hist = px.histogram(filtered_df, x='pnl', nbins=30, title='Trade PnL Distribution')
+        bins = trade_log.pnl_histogram(30, **filters)
+        fig_hist = px.bar(bins, x='bin', y='count', title='Trade PnL Distribution', labels={'bin': 'pnl', 'count': 'count'})
+        fig_hist.update_traces(width=bins['width'])
+        fig_hist.update_layout(bargap=0)
         st.plotly_chart(fig_hist, use_container_width=True)
 
+        # --- Monte Carlo Risk ---
+        # Computed once per backtest run and cached on disk (see monte_carlo.py)
+        if data_source == "Backtest" and trade_log.run_id is not None:
+            st.header("Monte Carlo Risk")
+            report = analyze_run(get_journal(), trade_log.run_id)
+            if report is not None:
+                final = report['final_balance']
+                drawdown = report['max_drawdown_pct']
+                st.caption(f"{report['paths']:,} {report['method']} paths over {report['trades']:,} trades of the whole run.")
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Median Final Balance", f"${final['p50']:,.2f}")
+                col2.metric("5th Percentile Final Balance", f"${final['p5']:,.2f}")
+                col3.metric("95th Percentile Max Drawdown", f"{drawdown['p95']:.1f}%")
+                col4.metric(f"Risk of Ruin ({report['ruin_level']:.0%} loss)", f"{report['ruin_probability']:.2%}")
+                if report.get('sharpe_annualized') is not None:
+                    st.caption(f"Sharpe ratio annualized by the observed trade frequency: {report['sharpe_annualized']:.2f}")
+
+                bands = pd.DataFrame(report['bands'])
+                fig_bands = px.line(
+                    bands, x='trade', y=['p5', 'p25', 'p50', 'p75', 'p95'], title='Equity Curve Percentile Bands',
+                    labels={'trade': 'Trade Number', 'value': 'Account Balance ($)', 'variable': 'Percentile'},
+                    template="plotly_dark",
+                )
+                st.plotly_chart(fig_bands, use_container_width=True)
+
+                col1, col2 = st.columns(2)
+                for column, key, title in ((col1, 'final_balance', 'Final Balance'), (col2, 'max_drawdown_pct', 'Max Drawdown (%)')):
+                    hist = report[key]['histogram']
+                    edges = np.asarray(hist['edges'])
+                    dist = pd.DataFrame({'bin': (edges[:-1] + edges[1:]) / 2, 'paths': hist['counts']})
+                    fig_dist = px.bar(dist, x='bin', y='paths', title=f'{title} Distribution', labels={'bin': title}, template="plotly_dark")
+                    fig_dist.update_traces(width=np.diff(edges))
+                    fig_dist.update_layout(bargap=0)
+                    column.plotly_chart(fig_dist, use_container_width=True)
+
         # --- Latest Trade Notification ---
         st.header("Latest Trade")
-        st.write(filtered_df.iloc[-1] if not filtered_df.empty else "No trades yet.")
+        st.write(trade_log.query(offset=trade_count - 1, limit=1, **filters).iloc[-1])
 
         # --- Download Button ---
-        st.download_button("Download Trade Log as CSV", filtered_df.to_csv(index=False), "trade_log.csv")
+        # The export reads every selected trade, so it is only built when asked for
+        if st.button("Prepare Trade Log CSV"):
+            buffer = io.StringIO()
+            trade_log.export_csv(buffer, **filters)
+            st.download_button("Download Trade Log as CSV", buffer.getvalue(), "trade_log.csv")
 
     # --- Trade Log Table ---
+    # Paginated so only one page of rows is sent to the browser
     st.header("Trade Log")
-    st.dataframe(filtered_df)
+    pages = max(1, -(-trade_count // TRADE_LOG_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=pages, step=1)
+    st.dataframe(trade_log.query(offset=(page - 1) * TRADE_LOG_PAGE_SIZE, limit=TRADE_LOG_PAGE_SIZE, **filters))
 
     # Add a little footer
     st.markdown("---")
-    st.text("Run a new backtest or live session to update the data.")
\ No newline at end of file
+    st.text("Run a new backtest or live session to update the data.")
+# --- Execution Metrics ---
+# Written by the live bot after every scan (see instrumentation.py)
+if data_source == "Live":
+    st.header("Execution Metrics")
+    live_metrics = read_metrics(METRICS_FILE)
+    if live_metrics is None:
+        st.info("No metrics yet. They are written after the first live scan.")
+    else:
+        rows = []
+        for (name, labels), hist in sorted(live_metrics.histograms.items()):
+            if not name.endswith('_seconds'):
+                continue
+            label = ', '.join(value for _, value in labels) or name
+            rows.append({
+                'stage': label, 'count': hist.count, 'mean ms': hist.mean * 1000,
+                'p50 ms': hist.quantile(0.5) * 1000, 'p90 ms': hist.quantile(0.9) * 1000, 'p99 ms': hist.quantile(0.99) * 1000,
+            })
+        if rows:
+            st.subheader("Latency")
+            st.dataframe(pd.DataFrame(rows).round(2), use_container_width=True)
+
+        slippage = [
+            {'reference': dict(labels).get('reference', ''), 'fills': hist.count, 'mean pips': hist.mean,
+             'p50 pips': hist.quantile(0.5), 'p90 pips': hist.quantile(0.9)}
+            for (name, labels), hist in sorted(live_metrics.histograms.items()) if name == 'bot_slippage_pips'
+        ]
+        if slippage:
+            st.subheader("Slippage (positive is against us)")
+            st.dataframe(pd.DataFrame(slippage).round(2), use_container_width=True)
+
+        retcodes = pd.DataFrame([
+            {'retcode': dict(labels)['retcode'], 'orders': value}
+            for (name, labels), value in live_metrics.counters.items() if name == 'bot_order_retcode_total'
+        ])
+        if not retcodes.empty:
+            st.subheader("Order Retcodes")
+            st.plotly_chart(px.bar(retcodes, x='retcode', y='orders', template="plotly_dark"), use_container_width=True)
@@ -0,0 +1,240 @@
+"""
+Incremental loading and running metrics for the dashboard.
+
+JournalTradeLog follows the SQLite trade journal by row id and folds only
+the rows added since the last refresh into running aggregates (TradeStats)
+for all symbols and for each symbol, so a refresh costs time proportional
+to the new rows, not to the length of the log.
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+class TradeStats:
+    """
+    Running KPIs over a stream of trades: counts, PnL sums, running max of
+    the balance for drawdown, and Welford mean/variance of PnL for Sharpe.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.wins = 0
+        self.losses = 0
+        self.total_pnl = 0.0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.peak_balance = -np.inf
+        self.max_drawdown = 0.0
+
+    def update(self, pnl, balance=None):
+        """Folds in a chunk of trades (arrays of PnL and, optionally, balance after each trade)."""
+        pnl = np.asarray(pnl, dtype=float)
+        n = len(pnl)
+        if n == 0:
+            return
+        self.wins += int((pnl > 0).sum())
+        self.losses += int((pnl < 0).sum())
+        self.total_pnl += float(pnl.sum())
+        self.gross_profit += float(pnl[pnl > 0].sum())
+        self.gross_loss += float(-pnl[pnl < 0].sum())
+
+        # Chan et al. combination of the running and chunk mean/variance
+        chunk_mean = float(pnl.mean())
+        chunk_m2 = float(((pnl - chunk_mean) ** 2).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        if balance is not None:
+            balance = np.asarray(balance, dtype=float)
+            peaks = np.maximum.accumulate(np.r_[self.peak_balance, balance])[1:]
+            self.peak_balance = float(peaks[-1])
+            self.max_drawdown = max(self.max_drawdown, float((peaks - balance).max()))
+
+    def merge(self, other):
+        """Combined stats of two disjoint trade sets. Drawdown is not combinable and is left unset."""
+        merged = TradeStats()
+        for name in ('count', 'wins', 'losses', 'total_pnl', 'gross_profit', 'gross_loss'):
+            setattr(merged, name, getattr(self, name) + getattr(other, name))
+        if merged.count:
+            delta = other.mean - self.mean
+            merged.mean = self.mean + delta * other.count / merged.count
+            merged.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / merged.count
+        merged.max_drawdown = None
+        return merged
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count * 100 if self.count else 0
+
+    @property
+    def profit_factor(self):
+        return self.gross_profit / self.gross_loss if self.gross_loss > 0 else float('inf')
+
+    @property
+    def avg_win(self):
+        return self.gross_profit / self.wins if self.wins else float('nan')
+
+    @property
+    def avg_loss(self):
+        return -self.gross_loss / self.losses if self.losses else float('nan')
+
+    @property
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float('nan')
+
+    @property
+    def sharpe(self):
+        std = self.std
+        return self.mean / std * np.sqrt(252) if std > 0 else None
+
+def _fold(stats, symbol_stats, chunk):
+    """Folds a chunk of trade rows into the overall and per-symbol stats."""
+    if 'pnl' not in chunk.columns:
+        return
+    balance = chunk['balance'] if 'balance' in chunk.columns else None
+    stats.update(chunk['pnl'], balance)
+    if 'symbol' in chunk.columns:
+        for symbol, rows in chunk.groupby('symbol', sort=False):
+            symbol_stats.setdefault(symbol, TradeStats()).update(rows['pnl'], rows['balance'] if balance is not None else None)
+
+def _stats_for(stats, symbol_stats, symbols, subset_balance):
+    symbols = list(symbols)
+    if not symbol_stats or set(symbols) >= set(symbol_stats):
+        return stats
+    if len(symbols) == 1:
+        return symbol_stats.get(symbols[0], TradeStats())
+    merged = TradeStats()
+    for symbol in symbols:
+        if symbol in symbol_stats:
+            merged = merged.merge(symbol_stats[symbol])
+    balance = subset_balance()
+    if balance is not None:
+        merged.max_drawdown = float((balance.cummax() - balance).max()) if len(balance) else 0.0
+    return merged
+
+class JournalTradeLog:
+    """
+    Running KPIs over trades in the trade journal. kind='backtest' follows the latest backtest run and starts
+    over when a new one appears; kind='live' covers every live run. Each
+    refresh() reads only rows added since the last one (by row id), and rows
+    for display are fetched with indexed range queries, so nothing holds the
+    whole log in memory.
+    """
+
+    def __init__(self, journal, kind):
+        self.journal = journal
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, run_id):
+        self.run_id = run_id
+        self._last_id = 0
+        self.stats = TradeStats()
+        self.symbol_stats = {}
+
+    def refresh(self):
+        with self._lock:
+            run_id = None
+            if self.kind == 'backtest':
+                run_id = self.journal.latest_run('backtest')
+                if run_id is None:
+                    self._reset(None)
+                    return 'not_found'
+            elif self.journal.runs(self.kind).empty:
+                return 'not_found'
+            if run_id != self.run_id:
+                self._reset(run_id)
+            chunk = self.journal.query(columns=['id', 'symbol', 'pnl', 'balance'], kind=self.kind, run_id=run_id, after_id=self._last_id)
+            if not chunk.empty:
+                self._last_id = int(chunk['id'].iloc[-1])
+                _fold(self.stats, self.symbol_stats, chunk)
+            return 'ok' if self.stats.count else 'empty'
+
+    @property
+    def symbols(self):
+        return list(self.symbol_stats)
+
+    def time_range(self):
+        return self.journal.time_range(kind=self.kind, run_id=self.run_id)
+
+    def _filters(self, symbols=None, start=None, end=None):
+        return {'kind': self.kind, 'run_id': self.run_id, 'symbols': symbols, 'start': start, 'end': end}
+
+    def count(self, symbols=None, start=None, end=None):
+        """Number of trades for the selected symbols and entry-time range."""
+        return self.journal.count(**self._filters(symbols, start, end))
+
+    def query(self, symbols=None, start=None, end=None, offset=None, limit=None):
+        """Trades for the selected symbols and entry-time range, oldest first; `offset`/`limit` select a page."""
+        return self.journal.query(offset=offset, limit=limit, **self._filters(symbols, start, end)).drop(columns=['id', 'run_id'])
+
+    def window_stats(self, symbols=None, start=None, end=None):
+        """TradeStats of the selected trades, aggregated in the database rather than from their rows."""
+        summary = self.journal.summary(**self._filters(symbols, start, end))
+        stats = TradeStats()
+        for name in ('count', 'wins', 'losses', 'total_pnl', 'gross_profit', 'gross_loss'):
+            setattr(stats, name, summary[name])
+        if stats.count:
+            stats.mean = stats.total_pnl / stats.count
+            stats.m2 = max(0.0, summary['sum_sq'] - stats.count * stats.mean ** 2)
+        stats.max_drawdown = summary['max_drawdown']
+        return stats
+
+    def balance_series(self, points, symbols=None, start=None, end=None):
+        """The balance by trade number, reduced to about `points` rows (see TradeJournal.sample)."""
+        return self.journal.sample('balance', points, **self._filters(symbols, start, end)).rename(columns={'value': 'balance'})
+
+    def pnl_histogram(self, bins=30, symbols=None, start=None, end=None):
+        """PnL histogram of the selected trades as a frame of bin centers, widths and counts for a bar chart."""
+        counts, edges = self.journal.histogram('pnl', bins, **self._filters(symbols, start, end))
+        return pd.DataFrame({'bin': (edges[:-1] + edges[1:]) / 2, 'width': np.diff(edges), 'count': counts})
+
+    def export_csv(self, path, symbols=None, start=None, end=None):
+        """Writes the selected trades to a CSV path or buffer. Returns the row count."""
+        return self.journal.export_csv(path, **self._filters(symbols, start, end))
+
+    def stats_for(self, symbols):
+        """
+        Running stats for a selection of symbols. Exact (including drawdown)
+        for all symbols or a single one; for other subsets drawdown is
+        computed from the filtered rows, since it cannot be combined.
+        """
+        return _stats_for(
+            self.stats, self.symbol_stats, symbols,
+            lambda: self.journal.query(columns=['balance'], kind=self.kind, run_id=self.run_id, symbols=list(symbols))['balance'],
+        )
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a line to at most
+    `threshold` points. Keeps the first and last points and, from each bucket
+    in between, the point forming the largest triangle with the previously
+    kept point and the average of the next bucket, which preserves peaks and
+    troughs far better than taking every k-th point.
+    Returns the indices of the kept points.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
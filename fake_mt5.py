@@ -0,0 +1,295 @@
+"""
+Stand-in for the MetaTrader5 package that serves deterministic synthetic
+rates, for exercising the data and trading code on machines without an MT5
+terminal (e.g. Linux).
+
+Install it before importing any module that does `import MetaTrader5`:
+
+    import fake_mt5
+    fake_mt5.install()
+    import fetch_mt5_data
+
+Each symbol/timeframe gets a seeded random walk starting at HISTORY_START.
+Bar k is the same no matter which call or window requests it, so
+incremental fetches can be checked against a full fetch. The clock is
+controlled with set_time().
+
+Order execution faults can be injected with inject(): a number of requotes
+or off-quotes before a fill (each moves the quote by a point, so a retry
+sees a fresh price), a delay per order_send, slippage on fills and the
+symbols' allowed filling modes. reset() clears them along with the
+recorded calls and orders.
+"""
+import sys
+import time as _time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timezone
+import numpy as np
+
+HISTORY_START = int(datetime(2015, 1, 1, tzinfo=timezone.utc).timestamp())
+_BLOCK = 4096  # Bars per seeded block of random-walk increments
+
+TIMEFRAME_M1 = 1
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H4 = 16388
+TIMEFRAME_D1 = 16408
+_TIMEFRAME_SECONDS = {
+    TIMEFRAME_M1: 60, TIMEFRAME_M5: 300, TIMEFRAME_M15: 900, TIMEFRAME_M30: 1800,
+    TIMEFRAME_H1: 3600, TIMEFRAME_H4: 14400, TIMEFRAME_D1: 86400,
+}
+
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+TRADE_ACTION_DEAL = 1
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+SYMBOL_FILLING_FOK = 1
+SYMBOL_FILLING_IOC = 2
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_INVALID_FILL = 10030
+
+SymbolInfo = namedtuple('SymbolInfo', 'name visible spread path digits point trade_tick_value trade_tick_size trade_contract_size volume_min volume_max volume_step filling_mode')
+AccountInfo = namedtuple('AccountInfo', 'login balance equity currency')
+Tick = namedtuple('Tick', 'time bid ask last')
+OrderSendResult = namedtuple('OrderSendResult', 'retcode deal order volume price bid ask comment request')
+TradePosition = namedtuple('TradePosition', 'ticket time symbol type volume price_open sl tp magic comment')
+OrderCheckResult = namedtuple('OrderCheckResult', 'retcode balance equity profit margin margin_free margin_level comment request')
+
+SYMBOLS = ['EURUSD', 'GBPUSD', 'USDJPY', 'AUDUSD', 'USDCAD']
+# Ticks are quoted off the newest bar of this series
+TICK_TIMEFRAME = TIMEFRAME_M15
+
+_state = {'now': None, 'initialized': False, 'balance': 10000.0, 'quote_shift': 0}
+_NO_FAULTS = {'requotes': 0, 'off_quotes': 0, 'delay': 0.0, 'slippage_points': 0, 'filling_mode': SYMBOL_FILLING_FOK | SYMBOL_FILLING_IOC}
+# Faults order_send injects; see inject()
+faults = dict(_NO_FAULTS)
+_closes = {}  # (symbol, seconds) -> cumulative close prices by bar index
+# Calls served, for checking how much a caller asked for
+calls = []
+# Requests accepted by order_send
+orders = []
+# Positions opened by those orders (the fake never closes them)
+positions = []
+
+def install():
+    """Registers this module as MetaTrader5 in sys.modules."""
+    sys.modules['MetaTrader5'] = sys.modules[__name__]
+
+def inject(requotes=0, off_quotes=0, delay=0.0, slippage_points=0, filling_mode=None):
+    """
+    Makes the next `requotes` order_send calls return a requote and the
+    `off_quotes` after them an off-quote, sleeps `delay` seconds in every
+    order_send, fills `slippage_points` worse than requested, and sets the
+    SYMBOL_FILLING_* mask symbols report (FOK | IOC by default).
+    """
+    faults.update(requotes=requotes, off_quotes=off_quotes, delay=delay, slippage_points=slippage_points,
+                  filling_mode=_NO_FAULTS['filling_mode'] if filling_mode is None else filling_mode)
+
+def reset():
+    """Clears injected faults, quote moves and the recorded calls and orders."""
+    faults.update(_NO_FAULTS)
+    _state['quote_shift'] = 0
+    del calls[:]
+    del orders[:]
+    del positions[:]
+
+def set_time(epoch_seconds):
+    """Freezes the fake server clock; None follows the real clock."""
+    _state['now'] = epoch_seconds
+
+def _now():
+    return int(_time.time()) if _state['now'] is None else int(_state['now'])
+
+def _seed(symbol):
+    return zlib.crc32(symbol.encode())
+
+def _base_price(symbol):
+    return 110.0 if symbol.endswith('JPY') else 1.1
+
+def _closes_upto(symbol, seconds, count):
+    """Close prices for bar indices [0, count), generated block by block."""
+    key = (symbol, seconds)
+    closes = _closes.get(key, np.empty(0))
+    if len(closes) < count:
+        blocks = [closes]
+        last = closes[-1] if len(closes) else _base_price(symbol)
+        for block in range(len(closes) // _BLOCK, -(-count // _BLOCK)):
+            rng = np.random.default_rng([_seed(symbol), seconds, block])
+            path = last * np.exp(np.cumsum(rng.normal(0, 0.0008, _BLOCK)))
+            blocks.append(path)
+            last = path[-1]
+        closes = np.concatenate(blocks)
+        _closes[key] = closes
+    return closes[:count]
+
+def _bars(symbol, timeframe, first, last):
+    """Rates for bar indices first..last inclusive (clipped to the available history)."""
+    seconds = _TIMEFRAME_SECONDS[timeframe]
+    available = (_now() - HISTORY_START) // seconds + 1
+    first, last = max(first, 0), min(last, available - 1)
+    if last < first:
+        return np.empty(0, dtype=RATES_DTYPE)
+    closes = _closes_upto(symbol, seconds, last + 1)
+    idx = np.arange(first, last + 1)
+    close = closes[idx]
+    open_ = np.where(idx > 0, closes[np.maximum(idx - 1, 0)], close)
+    wick = np.abs(close - open_) * 0.5 + close * 0.0002
+    rates = np.empty(len(idx), dtype=RATES_DTYPE)
+    rates['time'] = HISTORY_START + idx * seconds
+    rates['open'] = open_
+    rates['high'] = np.maximum(open_, close) + wick * (0.5 + 0.5 * np.sin(idx))**2
+    rates['low'] = np.minimum(open_, close) - wick * (0.5 + 0.5 * np.cos(idx))**2
+    rates['close'] = close
+    rates['tick_volume'] = 100 + idx % 50
+    rates['spread'] = 10
+    rates['real_volume'] = 0
+    return rates
+
+def _index_at(timeframe, when):
+    if isinstance(when, datetime):
+        when = when.timestamp()
+    return (int(when) - HISTORY_START) // _TIMEFRAME_SECONDS[timeframe]
+
+# --- MetaTrader5 API surface ---
+
+def initialize(*args, **kwargs):
+    _state['initialized'] = True
+    return True
+
+def shutdown():
+    _state['initialized'] = False
+
+def last_error():
+    return (1, 'Success')
+
+def version():
+    return (500, 0, 'fake')
+
+def account_info():
+    return AccountInfo(login=0, balance=_state['balance'], equity=_state['balance'], currency='USD')
+
+def symbol_info(symbol):
+    if symbol not in SYMBOLS:
+        return None
+    jpy = symbol.endswith('JPY')
+    return SymbolInfo(
+        name=symbol, visible=True, spread=10, path=f"Forex\\{symbol}",
+        digits=3 if jpy else 5, point=0.001 if jpy else 0.00001,
+        trade_tick_value=0.67 if jpy else 1.0, trade_tick_size=0.001 if jpy else 0.00001,
+        trade_contract_size=100000.0, volume_min=0.01, volume_max=100.0, volume_step=0.01,
+        filling_mode=faults['filling_mode'],
+    )
+
+def symbols_get(*args, **kwargs):
+    return tuple(symbol_info(s) for s in SYMBOLS)
+
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    calls.append(('copy_rates_from_pos', symbol, timeframe, start_pos, count))
+    newest = _index_at(timeframe, _now()) - start_pos
+    return _bars(symbol, timeframe, newest - count + 1, newest)
+
+def copy_rates_from(symbol, timeframe, date_from, count):
+    """`count` bars ending at the bar open at or before date_from."""
+    calls.append(('copy_rates_from', symbol, timeframe, date_from, count))
+    newest = _index_at(timeframe, date_from)
+    return _bars(symbol, timeframe, newest - count + 1, newest)
+
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    calls.append(('copy_rates_range', symbol, timeframe, date_from, date_to))
+    seconds = _TIMEFRAME_SECONDS[timeframe]
+    start = date_from.timestamp() if isinstance(date_from, datetime) else date_from
+    first = -(-(int(start) - HISTORY_START) // seconds)
+    return _bars(symbol, timeframe, first, _index_at(timeframe, date_to))
+
+def symbol_info_tick(symbol):
+    info = symbol_info(symbol)
+    if info is None:
+        return None
+    now = _now()
+    newest = _index_at(TICK_TIMEFRAME, now)
+    bar = _bars(symbol, TICK_TIMEFRAME, newest, newest)
+    if len(bar) == 0:
+        return None
+    half_spread = info.spread * info.point / 2
+    close = float(bar['close'][0]) + _state['quote_shift'] * info.point
+    return Tick(time=now, bid=close - half_spread, ask=close + half_spread, last=close)
+
+def positions_get(symbol=None, **kwargs):
+    return tuple(position for position in positions if symbol is None or position.symbol == symbol)
+
+def _filling_allowed(mask, filling):
+    if filling == ORDER_FILLING_FOK:
+        return bool(mask & SYMBOL_FILLING_FOK)
+    if filling == ORDER_FILLING_IOC:
+        return bool(mask & SYMBOL_FILLING_IOC)
+    # Market execution symbols do not take ORDER_FILLING_RETURN
+    return False
+
+def _invalid(request):
+    """Retcode and comment for a request the fake broker refuses, or None."""
+    info = symbol_info(request['symbol'])
+    volume = request['volume']
+    steps = round((volume - info.volume_min) / info.volume_step, 6)
+    if volume < info.volume_min or volume > info.volume_max or steps != int(steps):
+        return TRADE_RETCODE_INVALID_VOLUME, 'Invalid volume'
+    if not _filling_allowed(info.filling_mode, request.get('type_filling', ORDER_FILLING_FOK)):
+        return TRADE_RETCODE_INVALID_FILL, 'Unsupported filling mode'
+    return None
+
+def order_check(request):
+    """Validates volume and filling mode the way the terminal would; retcode 0 means the order is acceptable."""
+    calls.append(('order_check', request['symbol'], request['type'], request['volume'], request.get('type_filling')))
+    retcode, comment = _invalid(request) or (0, 'Done')
+    balance = _state['balance']
+    return OrderCheckResult(retcode=retcode, balance=balance, equity=balance, profit=0.0, margin=0.0,
+                            margin_free=balance, margin_level=0.0, comment=comment, request=request)
+
+def order_send(request):
+    """
+    Fills market orders at the requested price (less any injected slippage),
+    unless a fault is pending: a requote or off-quote moves the quote by a
+    point and rejects the order.
+    """
+    calls.append(('order_send', request['symbol'], request['type'], request['volume'], request['price']))
+    if faults['delay']:
+        _time.sleep(faults['delay'])
+    tick = symbol_info_tick(request['symbol'])
+    invalid = _invalid(request)
+    if invalid is None and (faults['requotes'] or faults['off_quotes']):
+        if faults['requotes']:
+            faults['requotes'] -= 1
+            invalid = TRADE_RETCODE_REQUOTE, 'Requote'
+        else:
+            faults['off_quotes'] -= 1
+            invalid = TRADE_RETCODE_PRICE_OFF, 'Off quotes'
+        _state['quote_shift'] += 1
+    if invalid is not None:
+        return OrderSendResult(retcode=invalid[0], deal=0, order=0, volume=0.0, price=0.0,
+                               bid=tick.bid, ask=tick.ask, comment=invalid[1], request=request)
+    orders.append(dict(request))
+    slippage = faults['slippage_points'] * symbol_info(request['symbol']).point
+    price = request['price'] + (slippage if request['type'] == ORDER_TYPE_BUY else -slippage)
+    positions.append(TradePosition(
+        ticket=len(orders), time=_now(), symbol=request['symbol'], type=request['type'], volume=request['volume'],
+        price_open=price, sl=request.get('sl', 0.0), tp=request.get('tp', 0.0), magic=request.get('magic', 0),
+        comment=request.get('comment', ''),
+    ))
+    return OrderSendResult(
+        retcode=TRADE_RETCODE_DONE, deal=len(orders), order=len(orders), volume=request['volume'],
+        price=price, bid=tick.bid, ask=tick.ask, comment='Request executed', request=request,
+    )
@@ -3,13 +3,19 @@ import pandas as pd
 import time
 import platform
 import os
+from datetime import datetime, timezone
 from config import ACCOUNT_LOGIN, ACCOUNT_PASSWORD, SERVER
+from utils import timeframe_seconds
+import bar_store
 
 # User settings
 SYMBOLS = ['EURUSD', 'GBPUSD', 'USDJPY']  # Add more symbols as needed
 TIMEFRAMES = ['D1', 'H1', 'M15']  # Add more timeframes as needed
-BARS = 1000  # Number of bars to fetch
+BARS = 1000  # Number of bars to fetch for a series that is not stored yet
 INTERVAL_MINUTES = 0  # Set >0 to run in a loop every N minutes, or 0 for one-time fetch
+SYNC = True  # Only fetch bars newer than the stored ones. False refetches the latest BARS bars every run.
+SYNC_CHUNK_BARS = 5000  # Max bars per request when catching up or backfilling
+BACKFILL_BARS = 0  # Set >0 to extend stored history backwards until it holds this many bars
 
 # Path to MT5 terminal (update if your MT5 is installed elsewhere)
 MT5_PATHS = [
@@ -42,6 +48,11 @@ def _get_mt5_timeframe(timeframe_str):
         return None
 
 def fetch_and_save(symbol, timeframe_str):
+    """
+    Fetches the latest BARS bars and merges them into the stored series; the
+    fetched bars replace stored ones with the same time, and older stored
+    history (e.g. from backfill_series) is kept.
+    """
     timeframe = _get_mt5_timeframe(timeframe_str)
     if timeframe is None:
         return
@@ -49,12 +60,81 @@ def fetch_and_save(symbol, timeframe_str):
     if rates is None or len(rates) == 0:
         print(f"No data fetched for {symbol} {timeframe_str}.")
         return
+    # Rates keep their int64 epoch times; the store writes them as-is
     df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    df = df[['time','open','high','low','close','tick_volume','spread','real_volume']]
-    filename = f"historical_{symbol}_{timeframe_str}.csv"
-    df.to_csv(filename, index=False)
-    print(f"Saved {len(df)} bars to {filename}")
+    added = bar_store.append_bars(symbol, timeframe_str, df)
+    print(f"Saved {len(df)} bars ({added} new) to {bar_store.series_dir(symbol, timeframe_str)}")
+
+def sync_series(symbol, timeframe_str):
+    """
+    Fetches only the bars newer than the last stored one and appends them.
+    The last stored bar is fetched again and replaced, since it may still have
+    been forming when it was saved. Long gaps are caught up in chunks of
+    SYNC_CHUNK_BARS.
+    """
+    last = bar_store.last_time(symbol, timeframe_str)
+    if last is None:
+        fetch_and_save(symbol, timeframe_str)
+        return
+    timeframe = _get_mt5_timeframe(timeframe_str)
+    if timeframe is None:
+        return
+    newest = mt5.copy_rates_from_pos(symbol, timeframe, 0, 1)
+    if newest is None or len(newest) == 0:
+        print(f"No data fetched for {symbol} {timeframe_str}.")
+        return
+
+    # Upper bound on the bars since `last`; weekends make it an over-estimate
+    missing = (int(newest['time'][-1]) - last) // timeframe_seconds(timeframe_str) + 1
+    chunks = []
+    start_pos = 0
+    while start_pos < missing:
+        count = min(SYNC_CHUNK_BARS, missing - start_pos)
+        rates = mt5.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+        if rates is None or len(rates) == 0:
+            break
+        chunks.append(rates[rates['time'] >= last])
+        if rates['time'][0] <= last or len(rates) < count:
+            break
+        start_pos += count
+
+    if not chunks:
+        print(f"No new bars for {symbol} {timeframe_str}.")
+        return
+    df = pd.concat([pd.DataFrame(rates) for rates in reversed(chunks)], ignore_index=True)
+    added = bar_store.append_bars(symbol, timeframe_str, df)
+    print(f"Synced {symbol} {timeframe_str}: {added} new bars")
+
+def backfill_series(symbol, timeframe_str, target_bars=BACKFILL_BARS):
+    """
+    Extends the stored history backwards in chunks of SYNC_CHUNK_BARS until
+    it holds target_bars bars or the server has no older data.
+    """
+    timeframe = _get_mt5_timeframe(timeframe_str)
+    stored = bar_store.load_arrays(symbol, timeframe_str, columns=['time'])
+    if timeframe is None or stored is None or len(stored['time']) == 0:
+        return
+    have = len(stored['time'])
+    cursor = int(stored['time'][0]) - 1
+    chunks = []
+    while have < target_bars:
+        count = min(SYNC_CHUNK_BARS, target_bars - have)
+        rates = mt5.copy_rates_from(symbol, timeframe, datetime.fromtimestamp(cursor, tz=timezone.utc), count)
+        if rates is None or len(rates) == 0:
+            break
+        rates = rates[rates['time'] <= cursor]
+        if len(rates) == 0:
+            break
+        chunks.append(rates)
+        have += len(rates)
+        cursor = int(rates['time'][0]) - 1
+        if len(rates) < count:
+            break  # Reached the start of the server's history
+
+    if chunks:
+        df = pd.concat([pd.DataFrame(rates) for rates in reversed(chunks)], ignore_index=True)
+        added = bar_store.append_bars(symbol, timeframe_str, df)
+        print(f"Backfilled {symbol} {timeframe_str}: {added} older bars ({have} total)")
 
 def run_fetch():
     print_diagnostics()
@@ -65,7 +145,12 @@ def run_fetch():
     print("Symbols in Market Watch:", [s.name for s in mt5.symbols_get()])
     for symbol in SYMBOLS:
         for tf in TIMEFRAMES:
-            fetch_and_save(symbol, tf)
+            if SYNC:
+                sync_series(symbol, tf)
+                if BACKFILL_BARS > 0:
+                    backfill_series(symbol, tf)
+            else:
+                fetch_and_save(symbol, tf)
     mt5.shutdown()
 
 def main():
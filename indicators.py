@@ -0,0 +1,256 @@
+"""
+Streaming versions of the indicators in strategy.py.
+
+Each indicator keeps just enough state (a ring buffer of the last `period`
+inputs with a running sum, or the previous EWM value) to take one new closed
+bar in O(1) time. Values match calculate_rsi, calculate_ma and calculate_atr
+run over the same bars, within float tolerance. State can be checkpointed to
+disk so a long-running bot or a bar-by-bar replay never recomputes history.
+"""
+import copy
+import json
+import math
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+from strategy import Indicator, get_strategies, combine_signals
+
+class SMA:
+    """Simple moving average, same as strategy.calculate_ma."""
+
+    def __init__(self, period=50):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.value = math.nan
+        self._since_resum = 0
+
+    def update(self, x):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        # Re-sum the buffer once per period so rounding error from the running
+        # sum cannot build up over a long session (amortised O(1))
+        self._since_resum += 1
+        if self._since_resum >= self.period:
+            self.total = math.fsum(self.window)
+            self._since_resum = 0
+        if len(self.window) == self.period:
+            self.value = self.total / self.period
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'window': list(self.window), 'since_resum': self._since_resum}
+
+    @classmethod
+    def from_dict(cls, state):
+        obj = cls(state['period'])
+        obj.window.extend(state['window'])
+        obj.total = math.fsum(obj.window)
+        obj._since_resum = state['since_resum']
+        if len(obj.window) == obj.period:
+            obj.value = obj.total / obj.period
+        return obj
+
+class RSI:
+    """RSI over simple averages of gains and losses, same as strategy.calculate_rsi."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.gain = SMA(period)
+        self.loss = SMA(period)
+        self.prev_close = None
+        self.value = math.nan
+
+    def update(self, close):
+        # pandas counts the undefined first difference as zero gain and loss
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        self.prev_close = close
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-delta if delta < 0 else 0.0)
+        if math.isnan(gain):
+            return self.value
+        # Averages of non-negative values; clamp rounding residue like pandas does
+        gain, loss = max(gain, 0.0), max(loss, 0.0)
+        if loss == 0.0:
+            self.value = math.nan if gain == 0.0 else 100.0
+        else:
+            self.value = 100 - (100 / (1 + gain / loss))
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'gain': self.gain.to_dict(), 'loss': self.loss.to_dict(), 'prev_close': self.prev_close, 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, state):
+        obj = cls(state['period'])
+        obj.gain = SMA.from_dict(state['gain'])
+        obj.loss = SMA.from_dict(state['loss'])
+        obj.prev_close = state['prev_close']
+        obj.value = state['value']
+        return obj
+
+class ATR:
+    """Wilder ATR (EWM with alpha = 1/period), same as strategy.calculate_atr."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.alpha = 1 / period
+        self.prev_close = None
+        self.value = math.nan
+
+    def update(self, high, low, close):
+        if self.prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        if math.isnan(self.value):
+            self.value = tr
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * tr
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'prev_close': self.prev_close, 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, state):
+        obj = cls(state['period'])
+        obj.prev_close = state['prev_close']
+        obj.value = state['value']
+        return obj
+
+# Streaming class for each strategy.Indicator kind
+_STREAMING = {'rsi': RSI, 'sma': SMA, 'atr': ATR}
+
+def _default_indicators():
+    return get_strategies(['rsi_ma'])[0].indicators
+
+class IndicatorState:
+    """
+    A set of declared indicators (strategy.Indicator, by default the ones of
+    the 'rsi_ma' strategy), updated one closed bar at a time. `last_time`
+    records the newest bar folded in, so callers can skip bars they have
+    already seen after a restart.
+    """
+    warmup = 0  # Read by strategies; the state only holds values past warm-up anyway
+
+    def __init__(self, indicators=None):
+        self.indicators = {Indicator(*indicator): _STREAMING[indicator[0]](indicator[1])
+                           for indicator in (indicators or _default_indicators())}
+        self.last_time = None
+
+    def update(self, time, high, low, close):
+        for (kind, _), indicator in self.indicators.items():
+            if kind == 'atr':
+                indicator.update(high, low, close)
+            else:
+                indicator.update(close)
+        self.last_time = time
+
+    def update_frame(self, df):
+        """Folds in the rows of df newer than last_time; returns how many were new."""
+        if self.last_time is not None:
+            df = df[df['time'] > self.last_time]
+        for t, high, low, close in zip(df['time'], df['high'].tolist(), df['low'].tolist(), df['close'].tolist()):
+            self.update(t, high, low, close)
+        return len(df)
+
+    def __getitem__(self, indicator):
+        """Current value of an indicator as a one-row array, so strategies can read the state like an IndicatorCache."""
+        return np.array([self.indicators[indicator].value])
+
+    def __len__(self):
+        return 1
+
+    def signal(self, strategies=None):
+        """
+        strategy.latest_signal on the state: (signal, atr_value, strategy
+        name), or (None, None, None).
+        """
+        strategies = get_strategies(strategies)
+        direction, atr, which = combine_signals(self, strategies)
+        if direction[0] == 0:
+            return None, None, None
+        return 'buy' if direction[0] == 1 else 'sell', float(atr[0]), strategies[which[0]].name
+
+    def to_dict(self):
+        last_time = self.last_time
+        if last_time is not None and hasattr(last_time, 'isoformat'):
+            last_time = last_time.isoformat()
+        return {
+            'indicators': [[kind, period, indicator.to_dict()] for (kind, period), indicator in self.indicators.items()],
+            'last_time': last_time,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        # Built from the saved kinds and periods, whatever the defaults are
+        obj = cls([(kind, period) for kind, period, _ in state['indicators']])
+        for kind, period, saved in state['indicators']:
+            obj.indicators[Indicator(kind, period)] = _STREAMING[kind].from_dict(saved)
+        obj.last_time = state['last_time']
+        if obj.last_time is not None:
+            obj.last_time = pd.Timestamp(obj.last_time)
+        return obj
+
+def save_states(states, path):
+    """Checkpoints a {symbol: IndicatorState} dict to a JSON file, atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({symbol: state.to_dict() for symbol, state in states.items()}, f)
+    os.replace(tmp_path, path)
+
+def load_states(path):
+    """Restores a dict saved by save_states; returns {} if there is no checkpoint or it is unreadable."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return {symbol: IndicatorState.from_dict(state) for symbol, state in data.items()}
+    except FileNotFoundError:
+        return {}
+    except (ValueError, KeyError, TypeError):
+        # A checkpoint from an older layout; the states are rebuilt from bars
+        return {}
+
+# --- Live loop ---
+
+_live_states = {}
+
+def live_signal(symbol, df, strategies=None):
+    """
+    strategy.latest_signal for a scan's bars of symbol, from the symbol's
+    IndicatorState instead of recomputing the indicators over all of df.
+    Every row but the last is a closed bar and only those newer than the
+    state are folded in; the last row (the bar still forming) is evaluated
+    on a copy, so it is folded in once a later scan sees it closed. The
+    state is rebuilt from df when it is missing, lacks an indicator the
+    strategies need, or df no longer overlaps it.
+    """
+    strategies = get_strategies(strategies)
+    if len(df) == 0:
+        return None, None, None
+    needed = {indicator for strategy in strategies for indicator in strategy.indicators}
+    state = _live_states.get(symbol)
+    closed = df.iloc[:-1]
+    if (state is None or not needed <= set(state.indicators) or state.last_time is None
+            or (len(closed) and closed['time'].iloc[0] > state.last_time)):
+        state = _live_states[symbol] = IndicatorState(needed)
+    state.update_frame(closed)
+    forming = copy.deepcopy(state)
+    last = df.iloc[-1]
+    forming.update(last['time'], float(last['high']), float(last['low']), float(last['close']))
+    return forming.signal(strategies)
+
+def restore_live_states(path):
+    """Loads the live states checkpointed at path, unless this process already has its own."""
+    if not _live_states:
+        _live_states.update(load_states(path))
+
+def checkpoint_live_states(path):
+    """Saves the live states to path."""
+    if _live_states:
+        save_states(_live_states, path)
@@ -0,0 +1,237 @@
+"""
+Lightweight metrics for the live loop: counters, fixed-bucket histograms and
+timing spans, exported in the Prometheus text format.
+
+Recording is a dictionary lookup, a bisect and an increment under a lock,
+so it is cheap enough to wrap every stage of a scan and every terminal call.
+Percentiles are estimated from the buckets the same way Prometheus'
+histogram_quantile does.
+
+    from instrumentation import span, inc, observe
+    with span('bot_stage_seconds', stage='fetch'):
+        ...
+    inc('bot_order_retcode_total', retcode=10009)
+
+write_metrics() writes METRICS_FILE for the dashboard; start_http_server()
+serves the same text at /metrics for a Prometheus scraper.
+"""
+import bisect
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_FILE
+
+# Upper bounds in seconds, 0.5 ms to 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds in pips; positive is slippage against us
+SLIPPAGE_BUCKETS = (-5.0, -2.0, -1.0, -0.5, -0.2, 0.0, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+class Histogram:
+    """Counts of observations per bucket (value <= bound), plus their sum and count."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float('nan')
+
+    def quantile(self, q):
+        """
+        Estimated q-quantile, interpolating linearly inside the bucket it falls
+        in. Values in the +Inf bucket are reported as the highest bound.
+        """
+        if self.count == 0:
+            return float('nan')
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                upper = self.bounds[i]
+                lower = self.bounds[i - 1] if i > 0 else min(0.0, upper)
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+class Metrics:
+    """A set of labelled counters and histograms, safe to update from several threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Records the wall time of the block in seconds, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + (math.inf,), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def load(self, text):
+        """Adds the counters and histograms of a render() output to this set."""
+        types = {}
+        buckets = {}  # (name, labels) -> [(bound, cumulative)]
+        sums = {}
+        for line in text.splitlines():
+            if line.startswith('# TYPE '):
+                _, _, name, kind = line.split(maxsplit=3)
+                types[name] = kind
+                continue
+            match = _SAMPLE.match(line)
+            if not match:
+                continue
+            name, label_text, value = match.groups()
+            labels = tuple(_LABEL.findall(label_text or ''))
+            if types.get(name) == 'counter':
+                self.inc(name, float(value), **dict(labels))
+            elif name.endswith('_bucket') and types.get(name[:-7]) == 'histogram':
+                le = dict(labels)['le']
+                key = (name[:-7], tuple(pair for pair in labels if pair[0] != 'le'))
+                buckets.setdefault(key, []).append((math.inf if le == '+Inf' else float(le), int(float(value))))
+            elif name.endswith('_sum') and types.get(name[:-4]) == 'histogram':
+                sums[(name[:-4], labels)] = float(value)
+        with self._lock:
+            for key, pairs in buckets.items():
+                pairs.sort()
+                bounds = tuple(bound for bound, _ in pairs if bound != math.inf)
+                counts = [cumulative - previous for (_, cumulative), previous in zip(pairs, [0] + [c for _, c in pairs[:-1]])]
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(bounds)
+                if histogram.bounds != bounds or len(counts) != len(histogram.counts):
+                    continue
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += sum(counts)
+                histogram.sum += sums.get(key, 0.0)
+
+_SAMPLE = re.compile(r'^([A-Za-z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# --- Process-wide metrics ---
+
+metrics = Metrics()
+inc = metrics.inc
+observe = metrics.observe
+span = metrics.span
+
+def write_metrics(path=METRICS_FILE):
+    """Writes the process-wide metrics to path, replacing it atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+
+def restore_metrics(path=METRICS_FILE):
+    """
+    Continues from the counts in a previously written metrics file, so runs
+    started by a scheduler accumulate instead of each overwriting the last.
+    """
+    try:
+        with open(path) as f:
+            metrics.load(f.read())
+    except FileNotFoundError:
+        pass
+
+def read_metrics(path=METRICS_FILE):
+    """A Metrics set loaded from a metrics file, or None if it does not exist."""
+    try:
+        with open(path) as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    loaded = Metrics()
+    loaded.load(text)
+    return loaded
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port, host='127.0.0.1'):
+    """Serves the process-wide metrics at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
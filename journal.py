@@ -0,0 +1,353 @@
+"""
+SQLite trade journal for live trades and backtest results.
+
+Every trade belongs to a run (one live session or one backtest). The
+database runs in WAL mode, so the dashboard can read while the bot writes,
+and trades are indexed by time, by symbol and time, and by run and time,
+so symbol and date filters are index range scans.
+
+Usage:
+    python journal.py export logs/trades.csv --kind live     # CSV export
+    python journal.py import logs/backtest_results.csv       # import an old backtest CSV
+    python journal.py runs
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from config import JOURNAL_FILE, JOURNAL_BATCH_SIZE
+
+# Trade columns in table order, after id and run_id
+COLUMNS = ['time', 'symbol', 'signal', 'price', 'lot', 'sl', 'tp', 'pnl', 'balance',
+           'exit_time', 'exit_price', 'exit_reason', 'bars_held', 'result', 'error']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    started TEXT NOT NULL,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    time TEXT NOT NULL,
+    symbol TEXT,
+    signal TEXT,
+    price REAL,
+    lot REAL,
+    sl REAL,
+    tp REAL,
+    pnl REAL,
+    balance REAL,
+    exit_time TEXT,
+    exit_price REAL,
+    exit_reason TEXT,
+    bars_held INTEGER,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trades_time ON trades(time);
+CREATE INDEX IF NOT EXISTS idx_trades_symbol_time ON trades(symbol, time);
+CREATE INDEX IF NOT EXISTS idx_trades_run_time ON trades(run_id, time);
+"""
+
+def _format_times(values):
+    """Times as sortable 'YYYY-MM-DD HH:MM:SS' text; missing values stay None."""
+    times = pd.to_datetime(pd.Series(values))
+    return times.dt.strftime('%Y-%m-%d %H:%M:%S').where(times.notna(), None).tolist()
+
+class TradeJournal:
+    """
+    A connection to the journal database, safe to share between threads.
+    add() buffers rows and writes them batch_size at a time; add_frame()
+    writes a whole results frame in one transaction.
+    """
+
+    def __init__(self, path=JOURNAL_FILE, batch_size=JOURNAL_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = []
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL plus NORMAL only risks the last transactions on power loss, never corruption
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    # --- Writing ---
+
+    def start_run(self, kind, params=None, run_id=None):
+        """Registers a run ('live' or 'backtest') and returns its id."""
+        started = datetime.now()
+        run_id = run_id or f"{kind}-{started:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO runs (run_id, kind, started, params) VALUES (?, ?, ?, ?)',
+                (run_id, kind, started.isoformat(timespec='seconds'), json.dumps(params) if params else None),
+            )
+            self.conn.commit()
+        return run_id
+
+    def add(self, run_id, trade):
+        """Buffers one trade (a dict with any of COLUMNS); writes when batch_size are pending."""
+        row = [run_id] + [trade.get(name) for name in COLUMNS]
+        row[1] = _format_times([row[1]])[0]
+        row[10] = _format_times([row[10]])[0] if row[10] is not None else None
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._write(self._pending)
+                self._pending = []
+
+    def flush(self):
+        """Writes any buffered trades."""
+        with self._lock:
+            if self._pending:
+                self._write(self._pending)
+                self._pending = []
+
+    def add_frame(self, run_id, df):
+        """Writes every row of a results frame (backtest layout) in one transaction."""
+        if df is None or df.empty:
+            return 0
+        columns = {}
+        for name in COLUMNS:
+            if name not in df.columns:
+                columns[name] = [None] * len(df)
+            elif name in ('time', 'exit_time'):
+                columns[name] = _format_times(df[name])
+            else:
+                # object dtype so NaN becomes None rather than a float in TEXT columns
+                values = df[name].astype(object)
+                columns[name] = values.where(values.notna(), None).tolist()
+        rows = [[run_id, *values] for values in zip(*(columns[name] for name in COLUMNS))]
+        with self._lock:
+            self._write(rows)
+        return len(rows)
+
+    def _write(self, rows):
+        placeholders = ', '.join('?' * (len(COLUMNS) + 1))
+        sql = f"INSERT INTO trades (run_id, {', '.join(COLUMNS)}) VALUES ({placeholders})"
+        with self.conn:
+            for start in range(0, len(rows), self.batch_size):
+                self.conn.executemany(sql, rows[start:start + self.batch_size])
+
+    # --- Reading ---
+
+    def _where(self, kind=None, run_id=None, symbols=None, start=None, end=None, after_id=None):
+        clauses, params = [], []
+        if run_id is not None:
+            clauses.append('run_id = ?')
+            params.append(run_id)
+        elif kind is not None:
+            clauses.append('run_id IN (SELECT run_id FROM runs WHERE kind = ?)')
+            params.append(kind)
+        if symbols is not None:
+            symbols = list(symbols)
+            clauses.append(f"symbol IN ({', '.join('?' * len(symbols))})")
+            params.extend(symbols)
+        if start is not None:
+            clauses.append('time >= ?')
+            params.append(_format_times([start])[0])
+        if end is not None:
+            clauses.append('time <= ?')
+            params.append(_format_times([end])[0])
+        if after_id is not None:
+            clauses.append('id > ?')
+            params.append(after_id)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, columns=None, kind=None, run_id=None, symbols=None, start=None, end=None, after_id=None, limit=None, offset=None):
+        """
+        Trades matching the filters, in journal order, as a DataFrame with
+        datetime time columns. `start`/`end` bound the entry time inclusively
+        and `after_id` returns only trades added after that row id.
+        `limit` and `offset` select one page of them.
+        """
+        where, params = self._where(kind, run_id, symbols, start, end, after_id)
+        select = ', '.join(columns) if columns else f"id, run_id, {', '.join(COLUMNS)}"
+        sql = f"SELECT {select} FROM trades{where} ORDER BY id"
+        if limit is not None or offset is not None:
+            sql += f" LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset or 0)}"
+        with self._lock:
+            df = pd.read_sql_query(sql, self.conn, params=params)
+        for name in ('time', 'exit_time'):
+            if name in df.columns:
+                df[name] = pd.to_datetime(df[name])
+        return df
+
+    def count(self, **filters):
+        """Number of trades matching the query() filters."""
+        where, params = self._where(**filters)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM trades{where}", params).fetchone()[0]
+
+    def summary(self, **filters):
+        """
+        Aggregates of the matching trades' PnL computed in SQLite: count,
+        wins, losses, total_pnl, gross_profit, gross_loss, sum_sq (of PnL)
+        and max_drawdown of the balance in journal order.
+        """
+        where, params = self._where(**filters)
+        sql = f"""
+            SELECT COUNT(pnl), COALESCE(SUM(pnl > 0), 0), COALESCE(SUM(pnl < 0), 0), COALESCE(SUM(pnl), 0),
+                   COALESCE(SUM(CASE WHEN pnl > 0 THEN pnl END), 0), COALESCE(-SUM(CASE WHEN pnl < 0 THEN pnl END), 0),
+                   COALESCE(SUM(pnl * pnl), 0), MAX(peak - balance)
+            FROM (SELECT pnl, balance, MAX(balance) OVER (ORDER BY id) AS peak FROM trades{where})
+        """
+        with self._lock:
+            row = self.conn.execute(sql, params).fetchone()
+        names = ('count', 'wins', 'losses', 'total_pnl', 'gross_profit', 'gross_loss', 'sum_sq', 'max_drawdown')
+        return dict(zip(names, row))
+
+    def sample(self, column, points, **filters):
+        """
+        The matching trades' `column` in journal order, reduced in SQLite to
+        at most about `points` rows: the minimum and maximum of each bucket
+        of consecutive trades, so peaks and troughs survive. Returns a
+        DataFrame of the trade number (from 0) and the value.
+        """
+        where, params = self._where(**filters)
+        step = max(1, -(-self.count(**filters) * 2 // max(points, 2)))
+        numbered = f"SELECT {column} AS value, ROW_NUMBER() OVER (ORDER BY id) - 1 AS trade FROM trades{where}"
+        # SQLite returns the other columns of the row that holds a bare MIN() or MAX()
+        sql = f"""
+            SELECT trade, MIN(value) AS value FROM ({numbered}) GROUP BY trade / {step}
+            UNION SELECT trade, MAX(value) AS value FROM ({numbered}) GROUP BY trade / {step}
+            ORDER BY trade
+        """
+        with self._lock:
+            return pd.read_sql_query(sql, self.conn, params=params + params)
+
+    def histogram(self, column, bins, **filters):
+        """Counts of the matching trades' `column` in `bins` equal-width bins, binned in SQLite. Returns (counts, edges) as np.histogram does."""
+        where, params = self._where(**filters)
+        with self._lock:
+            low, high = self.conn.execute(f"SELECT MIN({column}), MAX({column}) FROM trades{where}", params).fetchone()
+            if low is None:
+                return np.array([], dtype=np.int64), np.array([])
+            width = (high - low) / bins or 1.0
+            rows = self.conn.execute(
+                f"SELECT MIN(CAST(({column} - ?) / ? AS INTEGER), ?) AS bin, COUNT(*) FROM trades{where}"
+                f"{' AND' if where else ' WHERE'} {column} IS NOT NULL GROUP BY bin",
+                [low, width, bins - 1] + params,
+            ).fetchall()
+        counts = np.zeros(bins, dtype=np.int64)
+        for index, count in rows:
+            counts[index] = count
+        return counts, low + width * np.arange(bins + 1)
+
+    def time_range(self, kind=None, run_id=None):
+        """(first, last) entry time of the matching trades, or (None, None)."""
+        where, params = self._where(kind, run_id)
+        with self._lock:
+            first, last = self.conn.execute(f"SELECT MIN(time), MAX(time) FROM trades{where}", params).fetchone()
+        if first is None:
+            return None, None
+        return pd.Timestamp(first), pd.Timestamp(last)
+
+    def runs(self, kind=None):
+        sql = 'SELECT run_id, kind, started, params FROM runs'
+        params = []
+        if kind is not None:
+            sql += ' WHERE kind = ?'
+            params.append(kind)
+        with self._lock:
+            return pd.read_sql_query(sql + ' ORDER BY started, rowid', self.conn, params=params)
+
+    def latest_run(self, kind):
+        """Id of the most recently started run of a kind, or None."""
+        with self._lock:
+            row = self.conn.execute('SELECT run_id FROM runs WHERE kind = ? ORDER BY started DESC, rowid DESC LIMIT 1', (kind,)).fetchone()
+        return row[0] if row else None
+
+    def export_csv(self, path, columns=None, **filters):
+        """
+        Writes the trades matching the query() filters to a CSV file (a path
+        or buffer). `columns` picks and orders the columns; by default every
+        journal column but the row id is written. Returns the row count.
+        """
+        df = self.query(columns=columns, **filters) if columns else self.query(**filters).drop(columns=['id'])
+        df.to_csv(path, index=False)
+        return len(df)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+_journal = None
+_journal_lock = threading.Lock()
+_live_run_id = None
+
+def get_journal():
+    """The shared journal for JOURNAL_FILE, opened on first use."""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = TradeJournal()
+    return _journal
+
+def log_live_trade(trade_data):
+    """
+    Records a live trade. Accepts the keys main.scan_and_trade uses
+    (timestamp, direction, entry) as well as the journal's own column names,
+    and is written immediately rather than batched.
+    """
+    global _live_run_id
+    journal = get_journal()
+    if _live_run_id is None:
+        _live_run_id = journal.start_run('live')
+    trade = dict(trade_data)
+    trade.setdefault('time', trade.pop('timestamp', None) or datetime.now())
+    trade.setdefault('signal', trade.pop('direction', None))
+    trade.setdefault('price', trade.pop('entry', None))
+    journal.add(_live_run_id, trade)
+    journal.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Trade journal maintenance.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="Export trades to CSV")
+    export.add_argument('path')
+    export.add_argument('--kind', choices=['live', 'backtest'])
+    export.add_argument('--run', help="Run id; defaults to the latest run of --kind backtest")
+    export.add_argument('--symbols', nargs='*')
+    export.add_argument('--start')
+    export.add_argument('--end')
+    imp = sub.add_parser('import', help="Import a results CSV as a new run")
+    imp.add_argument('path')
+    imp.add_argument('--kind', default='backtest', choices=['live', 'backtest'])
+    sub.add_parser('runs', help="List runs")
+    args = parser.parse_args()
+
+    journal = get_journal()
+    if args.command == 'export':
+        run_id = args.run
+        if run_id is None and args.kind == 'backtest':
+            run_id = journal.latest_run('backtest')
+        count = journal.export_csv(args.path, kind=args.kind, run_id=run_id, symbols=args.symbols or None, start=args.start, end=args.end)
+        print(f"Exported {count} trades to {args.path}")
+    elif args.command == 'import':
+        df = pd.read_csv(args.path)
+        if 'timestamp' in df.columns:
+            df = df.rename(columns={'timestamp': 'time', 'direction': 'signal', 'entry': 'price'})
+        run_id = journal.start_run(args.kind, params={'imported_from': args.path})
+        print(f"Imported {journal.add_frame(run_id, df)} trades from {args.path} as run {run_id}")
+    else:
+        print(journal.runs().to_string(index=False))
+    journal.close()
+
+if __name__ == '__main__':
+    main()
@@ -5,146 +5,424 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 LOCK_FILE = 'bot.lock'
+_lock_handle = None
 
-# Atomic lock: prevent multiple instances
-if os.path.exists(LOCK_FILE):
-    print('Another instance of the bot is already running. Exiting.')
-    sys.exit(1)
+def acquire_lock():
+    """
+    Takes an OS-level exclusive lock on LOCK_FILE. The OS drops the lock when
+    the process exits for any reason, so a crash cannot leave a stale lock.
+    """
+    handle = open(LOCK_FILE, 'a+')
+    try:
+        handle.seek(0)
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
 
-with open(LOCK_FILE, 'w') as f:
-    f.write('locked')
+# Prevent multiple instances. Only the top-level script takes the lock;
+# backtest worker processes re-import this module as __mp_main__.
+if __name__ == '__main__':
+    _lock_handle = acquire_lock()
+    if _lock_handle is None:
+        print('Another instance of the bot is already running. Exiting.')
+        sys.exit(1)
 
 import atexit
 
 def remove_lock():
-    if os.path.exists(LOCK_FILE):
-        os.remove(LOCK_FILE)
+    global _lock_handle
+    if _lock_handle is not None:
+        _lock_handle.close()
+        _lock_handle = None
+        try:
+            os.remove(LOCK_FILE)
+        except OSError:
+            pass
 
 atexit.register(remove_lock)
 
 try:
-    from broker import connect, disconnect, get_account_info, get_historical_data, place_order
-    from strategy import generate_signal
+    import broker as mt5_broker
+    from indicators import live_signal, restore_live_states, checkpoint_live_states
     from risk import calculate_lot_size, get_sl_tp
-    from utils import setup_logger, log_trade
-    from config import SYMBOLS, TIMEFRAME, ATR_SL_MULTIPLIER, BACKTEST, INITIAL_BALANCE
-    from backtest import run_backtest
+    from symbol_registry import get_symbol_spec, refresh_if_stale
+    from instrumentation import inc, observe, span, write_metrics, restore_metrics, start_http_server
+    from utils import setup_logger, log_trade, timeframe_seconds
+    from config import SYMBOLS, TIMEFRAME, ATR_SL_MULTIPLIER, BACKTEST, INITIAL_BALANCE, BACKTEST_WORKERS, FETCH_WORKERS
+    from config import PORTFOLIO_BACKTEST, MAX_PORTFOLIO_POSITIONS, HTF_FILTERS
+    from config import DAEMON, DAEMON_BAR_CLOSE_DELAY, DAEMON_MAX_BACKOFF, METRICS_PORT, METRICS_FILE, LIVE_MAX_OPEN_POSITIONS
+    from config import INDICATOR_STATE_FILE
+    from backtest import backtest_symbol, RESULT_COLUMNS
+    from portfolio import iter_portfolio_trades
+    from timeframes import live_trend
+    from journal import get_journal
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+    import argparse
+    import signal
+    import threading
+    import time
     import pandas as pd
     from datetime import datetime
 
     logger = setup_logger('main')
 
-    def live_trading():
-        """Scans multiple symbols and executes a trade on the first valid signal."""
-        if not connect():
-            return
+    def _timed_fetch(broker, symbol):
+        """Fetches bars for one symbol on a pool thread; returns (df, seconds)."""
+        start = time.perf_counter()
+        df = broker.get_historical_data(symbol, TIMEFRAME, bars=100)
+        seconds = time.perf_counter() - start
+        observe('bot_stage_seconds', seconds, stage='fetch')
+        return df, seconds
 
-        info = get_account_info()
-        if info is None:
-            disconnect()
-            return
-        
-        balance = info.balance
+    def scan_and_trade(balance, broker=None, trade_logger=None, metrics_file=METRICS_FILE, state_file=INDICATOR_STATE_FILE):
+        """
+        Scans SYMBOLS in order and executes a trade on the first valid signal.
+        Symbols that already have LIVE_MAX_OPEN_POSITIONS open positions are skipped.
+        Bars for every symbol are requested up front on a thread pool; each
+        symbol is evaluated as soon as its own data arrives, while the fetches
+        for later symbols are still in flight (the broker serializes the terminal
+        calls themselves). Returns True if a trade was placed.
+        Stage latencies and counts are recorded in the instrumentation metrics,
+        which are written to metrics_file (None to skip) at the end of the scan.
+        Indicators are kept per symbol and only take in newly closed bars; their
+        state is checkpointed to state_file (None to skip) after the scan.
+
+        `broker` is anything with broker.py's functions (the default), e.g. a
+        replay.ReplayBroker; `trade_logger` receives each executed trade
+        (default utils.log_trade).
+        """
+        broker = broker or mt5_broker
+        trade_logger = trade_logger or log_trade
         trade_executed = False
+        scan_start = time.perf_counter()
+        fetch_times, wait_time, signal_time, order_time = [], 0.0, 0.0, 0.0
 
         logger.info(f"Scanning {len(SYMBOLS)} symbols for a signal...")
 
-        for symbol in SYMBOLS:
-            logger.info(f"--- Analyzing {symbol} ---")
-            df = get_historical_data(symbol, TIMEFRAME, bars=100)
-            if df is None or df.empty:
-                logger.warning(f"Could not get historical data for {symbol}. Skipping.")
-                continue
+        pool = ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(SYMBOLS))))
+        futures = [pool.submit(_timed_fetch, broker, symbol) for symbol in SYMBOLS]
+        try:
+            for symbol, future in zip(SYMBOLS, futures):
+                logger.info(f"--- Analyzing {symbol} ---")
+                wait_start = time.perf_counter()
+                try:
+                    df, fetch_seconds = future.result()
+                    fetch_times.append(fetch_seconds)
+                except Exception as e:
+                    logger.error(f"Fetching data for {symbol} raised: {e}")
+                    df = None
+                waited = time.perf_counter() - wait_start
+                wait_time += waited
+                observe('bot_stage_seconds', waited, stage='data_wait')
+                if df is None or df.empty:
+                    logger.warning(f"Could not get historical data for {symbol}. Skipping.")
+                    continue
+
+                signal_start = time.perf_counter()
+                # Every strategy in STRATEGIES, from the symbol's streaming indicators
+                signal, atr, strategy_name = live_signal(symbol, df)
+                if HTF_FILTERS:
+                    # Updated on every scan, so the resampled bars only ever take in the new ones
+                    trend = live_trend(symbol, df, lambda bars: broker.get_historical_data(symbol, TIMEFRAME, bars=bars), TIMEFRAME)
+                    if signal and trend != (1 if signal == 'buy' else -1):
+                        logger.info(f"{signal.upper()} signal for {symbol} not confirmed on {', '.join(HTF_FILTERS)}.")
+                        inc('bot_signals_unconfirmed_total', symbol=symbol, direction=signal)
+                        signal, atr = None, None
+                signal_seconds = time.perf_counter() - signal_start
+                signal_time += signal_seconds
+                observe('bot_stage_seconds', signal_seconds, stage='signal')
+                if signal and atr:
+                    logger.info(f"Signal FOUND for {symbol}: {signal.upper()} ({strategy_name}), ATR: {atr:.5f}")
+                    inc('bot_signals_total', symbol=symbol, direction=signal, strategy=strategy_name)
+                    if LIVE_MAX_OPEN_POSITIONS is not None:
+                        open_positions = len(broker.get_positions(symbol))
+                        if open_positions >= LIVE_MAX_OPEN_POSITIONS:
+                            logger.info(f"{symbol} already has {open_positions} open position(s). Skipping.")
+                            continue
+
+                    with span('bot_stage_seconds', stage='sizing'):
+                        # Convert ATR to pips for position sizing
+                        spec = get_symbol_spec(symbol)
+                        sl_pips = (atr * ATR_SL_MULTIPLIER) / spec.pip_size
 
-            signal, atr = generate_signal(df)
-            if signal and atr:
-                logger.info(f"Signal FOUND for {symbol}: {signal.upper()}, ATR: {atr:.5f}")
-                
-                # Convert ATR to pips for position sizing
-                pip_size = 0.0001  # For 5-digit brokers
-                sl_pips = (atr * ATR_SL_MULTIPLIER) / pip_size
-
-                price = df.iloc[-1]['close']
-                lot = calculate_lot_size(balance, sl_pips)
-                sl, tp = get_sl_tp(price, signal, atr)
-                
-                if lot > 0.0 and sl is not None:
-                    success = place_order(symbol, signal, lot, sl, tp)
-                    if success:
-                        logger.info(f"Trade executed for {symbol}: {signal} {lot} lots at {price}, SL: {sl:.5f}, TP: {tp:.5f}")
-                        trade_executed = True
-                        trade_data = {
-                            'timestamp': datetime.now().isoformat(),
-                            'symbol': symbol,
-                            'direction': signal,
-                            'lot': lot,
-                            'entry': price,
-                            'sl': sl,
-                            'tp': tp,
-                            'result': 'executed',
-                            'error': '',
-                            'pnl': 0,  # Placeholder for now
-                            'balance': balance  # Current balance after trade
-                        }
-                        log_trade(trade_data)
-                        break  # Stop scanning after one successful trade
+                        price = df.iloc[-1]['close']
+                        lot = calculate_lot_size(balance, sl_pips, spec)
+                        sl, tp = get_sl_tp(price, signal, atr)
+
+                    if lot > 0.0 and sl is not None:
+                        order_start = time.perf_counter()
+                        success = broker.place_order(symbol, signal, lot, sl, tp, signal_price=price)
+                        order_seconds = time.perf_counter() - order_start
+                        order_time += order_seconds
+                        observe('bot_stage_seconds', order_seconds, stage='order')
+                        if success:
+                            logger.info(f"Trade executed for {symbol}: {signal} {lot} lots at {price}, SL: {sl:.5f}, TP: {tp:.5f}")
+                            logger.info(f"Scan start to order filled: {(time.perf_counter() - scan_start) * 1000:.1f} ms")
+                            trade_executed = True
+                            trade_data = {
+                                'timestamp': datetime.now().isoformat(),
+                                'symbol': symbol,
+                                'direction': signal,
+                                'lot': lot,
+                                'entry': price,
+                                'sl': sl,
+                                'tp': tp,
+                                'result': 'executed',
+                                'error': '',
+                                'pnl': 0,  # Placeholder for now
+                                'balance': balance  # Current balance after trade
+                            }
+                            trade_logger(trade_data)
+                            break  # Stop scanning after one successful trade
+                        else:
+                            logger.error(f"Failed to place order for {symbol}. Will continue scanning.")
                     else:
-                        logger.error(f"Failed to place order for {symbol}. Will continue scanning.")
+                        logger.warning(f"Could not calculate valid lot size or SL/TP for {symbol}. Skipping trade.")
                 else:
-                    logger.warning(f"Could not calculate valid lot size or SL/TP for {symbol}. Skipping trade.")
-            else:
-                logger.info(f"No signal for {symbol}.")
+                    logger.info(f"No signal for {symbol}.")
+        finally:
+            # Fetches for symbols after the traded one are no longer needed
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
 
         if not trade_executed:
             logger.info("Scan complete. No valid trading signals found on any symbol today.")
 
-        disconnect()
+        total = time.perf_counter() - scan_start
+        observe('bot_scan_seconds', total)
+        inc('bot_scans_total')
+        if trade_executed:
+            inc('bot_trades_total')
+        if metrics_file:
+            write_metrics(metrics_file)
+        if state_file:
+            checkpoint_live_states(state_file)
+        slowest = max(fetch_times) if fetch_times else 0.0
+        logger.info(
+            f"Scan timings: total {total * 1000:.1f} ms | fetched {len(fetch_times)} symbols, slowest fetch {slowest * 1000:.1f} ms, "
+            f"waited on data {wait_time * 1000:.1f} ms | signals {signal_time * 1000:.1f} ms | orders {order_time * 1000:.1f} ms"
+        )
+        return trade_executed
 
-    def run_full_backtest():
+    def live_trading(broker=None, trade_logger=None, metrics_file=METRICS_FILE, state_file=INDICATOR_STATE_FILE):
         """
-        Runs a backtest across all symbols defined in the config and combines the results.
+        Connects, scans multiple symbols and executes a trade on the first valid signal.
+        See scan_and_trade for the arguments; metrics carry on from metrics_file
+        and indicators from state_file.
         """
-        logger.info("--- Starting Full Multi-Symbol Backtest ---")
-        all_results = []
-        
-        for symbol in SYMBOLS:
-            file_path = f'historical_{symbol}_{TIMEFRAME}.csv'
-            logger.info(f"Loading data for {symbol} from {file_path}...")
-            
-            try:
-                df = pd.read_csv(file_path)
-                if df.empty:
-                    logger.warning(f"Data file for {symbol} is empty. Skipping.")
+        broker = broker or mt5_broker
+        if not broker.connect():
+            return
+
+        info = broker.get_account_info()
+        if info is None:
+            broker.disconnect()
+            return
+
+        if metrics_file:
+            restore_metrics(metrics_file)
+        if state_file:
+            restore_live_states(state_file)
+        scan_and_trade(info.balance, broker, trade_logger, metrics_file, state_file)
+        broker.disconnect()
+
+    def _next_bar_close(period, server_offset):
+        """Local epoch time at which the current bar closes, in the server's bar grid."""
+        server_now = time.time() + server_offset
+        return (server_now // period + 1) * period - server_offset
+
+    def _sleep_until(target, stop):
+        """
+        Sleeps until the wall clock reaches target; returns False if stop is set first.
+        Sleeps in bounded steps and re-reads the clock each time, so sleep
+        overshoot and clock adjustments (e.g. NTP) do not accumulate.
+        """
+        while True:
+            remaining = target - time.time()
+            if remaining <= 0:
+                return True
+            if stop.wait(min(remaining, 30.0)):
+                return False
+
+    def run_daemon():
+        """
+        Keeps one MT5 session open and runs a scan just after every TIMEFRAME
+        bar close until SIGINT/SIGTERM. Failed connects and dropped connections
+        are retried with exponential backoff, reset once an account query
+        succeeds; a bar whose scan could not run within half a bar
+        period of its close is skipped rather than traded late.
+        """
+        stop = threading.Event()
+
+        def handle_signal(signum, frame):
+            logger.info(f"Received signal {signum}. Shutting down after the current cycle.")
+            stop.set()
+
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), handle_signal)
+
+        restore_metrics()
+        restore_live_states(INDICATOR_STATE_FILE)
+        if METRICS_PORT:
+            start_http_server(METRICS_PORT)
+            logger.info(f"Serving metrics at http://127.0.0.1:{METRICS_PORT}/metrics")
+
+        period = timeframe_seconds(TIMEFRAME)
+        connected = False
+        backoff = 1.0
+        server_offset = 0
+        bar_close = None
+        logger.info(f"--- Starting daemon: scanning every {TIMEFRAME} bar close ---")
+
+        while not stop.is_set():
+            if not connected:
+                connected = mt5_broker.connect()
+                if not connected:
+                    logger.warning(f"Reconnecting in {backoff:.0f}s")
+                    stop.wait(backoff)
+                    backoff = min(backoff * 2, DAEMON_MAX_BACKOFF)
                     continue
-            except FileNotFoundError:
-                logger.warning(f"Historical data file not found for {symbol} at {file_path}. Skipping.")
+                server_offset = mt5_broker.get_server_time_offset(SYMBOLS[0])
+                logger.info(f"Server clock offset: {server_offset / 3600:+.1f}h")
+
+            if bar_close is None:
+                bar_close = _next_bar_close(period, server_offset)
+            if not _sleep_until(bar_close + DAEMON_BAR_CLOSE_DELAY, stop):
+                break
+
+            late = time.time() - bar_close
+            if late > period / 2:
+                logger.warning(f"Skipping bar that closed {late:.0f}s ago")
+                inc('bot_skipped_bars_total')
+                bar_close = None
+                continue
+
+            info = mt5_broker.get_account_info()
+            if info is None:
+                logger.error(f"Lost connection to MetaTrader 5. Reconnecting in {backoff:.0f}s")
+                mt5_broker.disconnect()
+                connected = False
+                bar_close = None
+                stop.wait(backoff)
+                backoff = min(backoff * 2, DAEMON_MAX_BACKOFF)
                 continue
-            
-            # We need to add the symbol to the results to differentiate trades
-            symbol_results = run_backtest(df, initial_balance=INITIAL_BALANCE)
-            if not symbol_results.empty:
-                symbol_results['symbol'] = symbol
-                all_results.append(symbol_results)
+            backoff = 1.0
 
+            logger.info(f"Bar closed {late * 1000:.0f} ms ago. Starting scan.")
+            try:
+                refresh_if_stale()
+                scan_and_trade(info.balance)
+            except Exception as e:
+                logger.exception(f"Scan failed: {e}. Reconnecting before the next bar.")
+                mt5_broker.disconnect()
+                connected = False
+            bar_close = None
+
+        if connected:
+            mt5_broker.disconnect()
+        logger.info("--- Daemon stopped ---")
+
+    def run_portfolio(journal, run_id):
+        """
+        Streams the portfolio backtest's trades into the journal as they
+        close. Returns (trades, final balance).
+        """
+        count, balance = 0, INITIAL_BALANCE
+        for trade in iter_portfolio_trades(SYMBOLS, TIMEFRAME, INITIAL_BALANCE):
+            journal.add(run_id, trade)
+            count, balance = count + 1, trade['balance']
+        journal.flush()
+        return count, balance
+
+    def run_per_symbol(journal, run_id, workers):
+        """
+        Backtests each symbol on its own INITIAL_BALANCE and journals the
+        trades merged in entry-time order, with the balance recomputed as a
+        running total. Returns (trades, final balance).
+        With more than one worker, symbols are spread across a process pool and
+        each symbol's result is collected as soon as it finishes; the merge
+        always follows SYMBOLS order, so the output matches a serial run exactly.
+        """
+        results = [None] * len(SYMBOLS)
+        if workers > 1 and len(SYMBOLS) > 1:
+            logger.info(f"Running {len(SYMBOLS)} symbols on {workers} worker processes")
+            with ProcessPoolExecutor(max_workers=min(workers, len(SYMBOLS))) as pool:
+                futures = {pool.submit(backtest_symbol, symbol, TIMEFRAME, INITIAL_BALANCE): i for i, symbol in enumerate(SYMBOLS)}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    symbol, symbol_results = future.result()
+                    results[futures[future]] = symbol_results
+                    trades = 0 if symbol_results is None else len(symbol_results)
+                    logger.info(f"[{done}/{len(SYMBOLS)}] {symbol} finished with {trades} trades")
+        else:
+            for i, symbol in enumerate(SYMBOLS):
+                _, results[i] = backtest_symbol(symbol, TIMEFRAME, INITIAL_BALANCE)
+
+        all_results = [r for r in results if r is not None and not r.empty]
         if not all_results:
+            return 0, INITIAL_BALANCE
+        # Symbols may come from the bar store or a CSV; merge on one time dtype
+        for r in all_results:
+            r['time'] = pd.to_datetime(r['time'])
+        # Stable sort, so trades entered at the same time keep SYMBOLS order
+        final_results = pd.concat(all_results, ignore_index=True)
+        final_results = final_results.sort_values('time', kind='stable', ignore_index=True)
+        final_results['balance'] = INITIAL_BALANCE + final_results['pnl'].cumsum()
+        journal.add_frame(run_id, final_results)
+        return len(final_results), final_results['balance'].iloc[-1]
+
+    def run_full_backtest(workers=None):
+        """
+        Runs a backtest across all symbols defined in the config. With
+        PORTFOLIO_BACKTEST the symbols trade as one portfolio on a shared
+        balance (see portfolio.py); otherwise (the default) each is backtested
+        on its own, `workers` at a time. Trades go to the trade journal, with
+        a CSV copy in logs/backtest_results.csv.
+        """
+        if workers is None:
+            workers = BACKTEST_WORKERS
+        logger.info("--- Starting Full Multi-Symbol Backtest ---")
+        journal = get_journal()
+        run_id = journal.start_run('backtest', params={
+            'symbols': SYMBOLS, 'timeframe': TIMEFRAME, 'initial_balance': INITIAL_BALANCE,
+            'atr_sl_multiplier': ATR_SL_MULTIPLIER, 'portfolio': PORTFOLIO_BACKTEST,
+            'max_portfolio_positions': MAX_PORTFOLIO_POSITIONS if PORTFOLIO_BACKTEST else None,
+        })
+
+        if PORTFOLIO_BACKTEST:
+            logger.info("Portfolio backtest (PORTFOLIO_BACKTEST = True): BACKTEST_WORKERS and BACKTEST_CHUNK_BARS are not used.")
+            count, balance = run_portfolio(journal, run_id)
+        else:
+            count, balance = run_per_symbol(journal, run_id, workers)
+
+        if count == 0:
             logger.error("No trades were generated across any symbols. Backtest results file will be empty.")
             # Create an empty file with headers so the dashboard doesn't error out on file-not-found
-            pd.DataFrame(columns=['signal', 'price', 'lot', 'pnl', 'balance', 'symbol']).to_csv('logs/backtest_results.csv', index=False)
+            pd.DataFrame(columns=RESULT_COLUMNS).to_csv('logs/backtest_results.csv', index=False)
             return
 
-        # Combine all results and sort by the trade execution order (index)
-        final_results = pd.concat(all_results).sort_index().reset_index(drop=True)
-        
-        # Recalculate the balance column to be cumulative across all trades
-        final_results['balance'] = INITIAL_BALANCE + final_results['pnl'].cumsum()
-
-        final_results.to_csv('logs/backtest_results.csv', index=False)
+        # CSV copy for tools that read the flat file, in the backtest's own layout
+        # (no run id), so identical runs give identical files
+        journal.export_csv('logs/backtest_results.csv', columns=RESULT_COLUMNS, run_id=run_id)
         logger.info(f"--- Full Backtest Complete ---")
-        logger.info(f"Results for {len(final_results)} trades across {len(SYMBOLS)} symbols saved to logs/backtest_results.csv")
+        logger.info(f"Results for {count} trades across {len(SYMBOLS)} symbols (final balance {balance:.2f}) saved to the trade journal as run {run_id} and to logs/backtest_results.csv")
 
     def main():
+        parser = argparse.ArgumentParser(description="Forex trading bot")
+        parser.add_argument('--daemon', action='store_true', default=DAEMON, help="Stay running and scan at every bar close")
+        args = parser.parse_args()
         if BACKTEST:
             run_full_backtest()
+        elif args.daemon:
+            run_daemon()
         else:
             live_trading()
 
@@ -0,0 +1,211 @@
+"""
+Monte Carlo risk analysis of a backtest's trade sequence.
+
+The per-trade returns of a run (PnL over the balance before the trade, so
+compounding lot sizes carry over) are resampled with replacement
+('bootstrap') or reordered ('shuffle') into MC_PATHS alternative equity
+paths. Paths are computed as 2D NumPy arrays, MC_CHUNK_PATHS rows at a time,
+and summarised as distributions of final balance and max drawdown, the
+probability of ruin, and percentile bands of the equity curve.
+
+Reports are cached as JSON under MC_CACHE_DIR, keyed by the results file
+(path, size, mtime) or journal run, so the dashboard reads them instantly.
+
+Usage:
+    python monte_carlo.py                                  # latest backtest run in the journal
+    python monte_carlo.py --file logs/backtest_results.csv --method shuffle
+"""
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from config import INITIAL_BALANCE
+
+# --- Monte Carlo Settings ---
+MC_PATHS = 10000
+MC_METHOD = 'bootstrap'  # 'bootstrap' resamples trades with replacement, 'shuffle' reorders them
+MC_RUIN_LEVEL = 0.5  # A path is ruined once it has lost this fraction of the initial balance
+MC_SEED = 0
+MC_BAND_POINTS = 200  # Points along the trade axis kept for the equity bands
+MC_CHUNK_PATHS = 1000  # Paths simulated per 2D block, bounding memory to chunk x trades
+MC_PERCENTILES = (5, 25, 50, 75, 95)
+MC_CACHE_DIR = 'logs/monte_carlo/'
+
+def trade_returns(pnl, balance=None, initial_balance=INITIAL_BALANCE):
+    """
+    Per-trade returns: PnL over the balance before each trade. Without a
+    balance column the balance is rebuilt from the PnL. A trade cannot lose
+    more than the whole balance, so returns are floored at -100%.
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    if balance is None:
+        balance = initial_balance + np.cumsum(pnl)
+    before = np.asarray(balance, dtype=float) - pnl
+    returns = np.divide(pnl, before, out=np.full_like(pnl, -1.0), where=before > 0)
+    return np.maximum(returns, -1.0)
+
+def _distribution(values):
+    values = np.asarray(values, dtype=float)
+    summary = {'mean': float(values.mean())}
+    summary.update({f"p{p}": float(v) for p, v in zip(MC_PERCENTILES, np.percentile(values, MC_PERCENTILES))})
+    counts, edges = np.histogram(values, bins=40)
+    summary['histogram'] = {'edges': edges.tolist(), 'counts': counts.tolist()}
+    return summary
+
+def _drawdowns(equity):
+    """Max absolute and fractional drawdown of each row of an equity array."""
+    peaks = np.maximum.accumulate(equity, axis=-1)
+    drawdown = peaks - equity
+    return drawdown.max(axis=-1), (drawdown / np.where(peaks > 0, peaks, 1.0)).max(axis=-1)
+
+def simulate(returns, initial_balance=INITIAL_BALANCE, paths=MC_PATHS, method=MC_METHOD,
+             ruin_level=MC_RUIN_LEVEL, seed=MC_SEED, band_points=MC_BAND_POINTS, chunk_paths=MC_CHUNK_PATHS):
+    """
+    Runs the Monte Carlo over a sequence of per-trade returns and returns the
+    report as a dict of plain Python values (JSON-serialisable).
+    """
+    returns = np.asarray(returns, dtype=float)
+    n = len(returns)
+    if n == 0:
+        return None
+    if method not in ('bootstrap', 'shuffle'):
+        raise ValueError(f"Unknown Monte Carlo method: {method}")
+    rng = np.random.default_rng(seed)
+    growth = 1.0 + returns
+    # Trade counts at which the equity bands are sampled (always including the last trade)
+    checkpoints = np.unique(np.linspace(0, n - 1, min(band_points, n)).round().astype(np.int64))
+    ruin_balance = initial_balance * (1 - ruin_level)
+
+    final = np.empty(paths)
+    max_dd = np.empty(paths)
+    max_dd_pct = np.empty(paths)
+    ruined = np.empty(paths, dtype=bool)
+    sampled = np.empty((paths, len(checkpoints)))
+    for start in range(0, paths, chunk_paths):
+        rows = min(chunk_paths, paths - start)
+        if method == 'bootstrap':
+            block = growth[rng.integers(0, n, size=(rows, n))]
+        else:
+            block = rng.permuted(np.broadcast_to(growth, (rows, n)), axis=1)
+        equity = initial_balance * np.cumprod(block, axis=1)
+        done = slice(start, start + rows)
+        final[done] = equity[:, -1]
+        max_dd[done], max_dd_pct[done] = _drawdowns(np.hstack([np.full((rows, 1), float(initial_balance)), equity]))
+        ruined[done] = equity.min(axis=1) <= ruin_balance
+        sampled[done] = equity[:, checkpoints]
+
+    actual_equity = initial_balance * np.cumprod(growth)
+    actual_dd, actual_dd_pct = _drawdowns(np.r_[initial_balance, actual_equity])
+    bands = np.percentile(sampled, MC_PERCENTILES, axis=0)
+    return {
+        'paths': paths,
+        'trades': n,
+        'method': method,
+        'initial_balance': float(initial_balance),
+        'ruin_level': ruin_level,
+        'ruin_probability': float(ruined.mean()),
+        'final_balance': _distribution(final),
+        'max_drawdown': _distribution(max_dd),
+        'max_drawdown_pct': _distribution(max_dd_pct * 100),
+        'bands': {'trade': (checkpoints + 1).tolist(), **{f"p{p}": band.tolist() for p, band in zip(MC_PERCENTILES, bands)}},
+        'actual': {
+            'final_balance': float(actual_equity[-1]),
+            'max_drawdown': float(actual_dd),
+            'max_drawdown_pct': float(actual_dd_pct * 100),
+        },
+    }
+
+def annualized_sharpe(pnl, times):
+    """
+    Sharpe ratio of per-trade PnL scaled by the number of trades per year
+    actually observed, rather than assuming one trade a day.
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    if len(pnl) < 2:
+        return None
+    std = pnl.std(ddof=1)
+    times = pd.to_datetime(pd.Series(times))
+    years = (times.max() - times.min()).total_seconds() / (365.25 * 86400)
+    if std == 0 or years <= 0:
+        return None
+    return float(pnl.mean() / std * np.sqrt(len(pnl) / years))
+
+def _cache_path(source, **params):
+    digest = hashlib.sha1(json.dumps([source, params], sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return os.path.join(MC_CACHE_DIR, f"{digest}.json")
+
+def analyze(results, source=None, initial_balance=INITIAL_BALANCE, **params):
+    """
+    Monte Carlo report for a results frame (pnl, balance and time columns in
+    trade order), or for a zero-argument callable returning one. When
+    `source` identifies the frame's contents (see analyze_file and
+    analyze_run), the report is cached under that key and the callable is
+    only called on a cache miss.
+    """
+    path = _cache_path(source, initial_balance=initial_balance, **params) if source is not None else None
+    if path is not None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+    if callable(results):
+        results = results()
+    if results is None or results.empty or 'pnl' not in results.columns:
+        return None
+    balance = results['balance'] if 'balance' in results.columns else None
+    report = simulate(trade_returns(results['pnl'], balance, initial_balance), initial_balance, **params)
+    if 'time' in results.columns:
+        report['sharpe_annualized'] = annualized_sharpe(results['pnl'], results['time'])
+    if path is not None:
+        os.makedirs(MC_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f)
+        os.replace(tmp_path, path)
+    return report
+
+def analyze_file(path, **params):
+    """Cached report for a results CSV; recomputed only when the file changes."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    source = ['file', os.path.abspath(path), st.st_size, st.st_mtime_ns]
+    return analyze(lambda: pd.read_csv(path), source=source, **params)
+
+def analyze_run(journal, run_id, **params):
+    """Cached report for a journal run, keyed by the run id and its trade count."""
+    count = journal.conn.execute('SELECT COUNT(*) FROM trades WHERE run_id = ?', (run_id,)).fetchone()[0]
+    source = ['run', os.path.abspath(journal.path), run_id, count]
+    return analyze(lambda: journal.query(columns=['time', 'pnl', 'balance'], run_id=run_id), source=source, **params)
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo risk analysis of backtest trades.")
+    parser.add_argument('--file', help="Results CSV (default: latest backtest run in the trade journal)")
+    parser.add_argument('--paths', type=int, default=MC_PATHS)
+    parser.add_argument('--method', choices=['bootstrap', 'shuffle'], default=MC_METHOD)
+    parser.add_argument('--seed', type=int, default=MC_SEED)
+    args = parser.parse_args()
+    params = {'paths': args.paths, 'method': args.method, 'seed': args.seed}
+
+    if args.file:
+        report = analyze_file(args.file, **params)
+    else:
+        from journal import get_journal
+        journal = get_journal()
+        run_id = journal.latest_run('backtest')
+        report = analyze_run(journal, run_id, **params) if run_id else None
+    if report is None:
+        print("No trades to analyse.")
+        return
+    final, dd = report['final_balance'], report['max_drawdown_pct']
+    print(f"{report['paths']} {report['method']} paths over {report['trades']} trades")
+    print(f"Final balance: median {final['p50']:,.2f}, 5th-95th percentile {final['p5']:,.2f} to {final['p95']:,.2f} (actual {report['actual']['final_balance']:,.2f})")
+    print(f"Max drawdown: median {dd['p50']:.1f}%, 95th percentile {dd['p95']:.1f}% (actual {report['actual']['max_drawdown_pct']:.1f}%)")
+    print(f"Probability of losing {report['ruin_level']:.0%} of the balance: {report['ruin_probability']:.2%}")
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,181 @@
+import atexit
+import queue
+import threading
+import time
 import requests
-from config import TELEGRAM_TOKEN, TELEGRAM_CHAT_ID
+from config import TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL
+from utils import setup_logger
+
+logger = setup_logger('notifier')
+
+# --- Dispatcher Settings ---
+NOTIFY_QUEUE_SIZE = 100  # Messages waiting to be sent; new ones are dropped when full
+NOTIFY_COALESCE_SECONDS = 1.0  # Messages arriving within this window go out as one
+NOTIFY_MAX_RETRIES = 3
+NOTIFY_RETRY_BACKOFF = 1.0  # Seconds before the first retry, doubled on each attempt
+TELEGRAM_MAX_LENGTH = 4096  # Telegram's limit on message text
+
+_STOP = object()
+
+class TelegramDispatcher:
+    """
+    Sends Telegram messages from a background thread so callers never wait on
+    the network. enqueue() only puts the message on a bounded queue; the
+    worker batches whatever arrives within NOTIFY_COALESCE_SECONDS into one
+    message, posts it over a single keep-alive session and retries rate
+    limits (429), server errors (5xx) and network errors with exponential
+    backoff. Any other rejection is permanent and the message is dropped.
+    """
+
+    def __init__(self, token, chat_id, api_url=TELEGRAM_API_URL, maxsize=NOTIFY_QUEUE_SIZE,
+                 coalesce_seconds=NOTIFY_COALESCE_SECONDS, max_retries=NOTIFY_MAX_RETRIES,
+                 retry_backoff=NOTIFY_RETRY_BACKOFF, timeout=5):
+        self.url = f'{api_url.rstrip("/")}/bot{token}/sendMessage'
+        self._token = token
+        self.chat_id = chat_id
+        self.coalesce_seconds = coalesce_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.session = requests.Session()
+        self.session.mount(api_url, requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, message):
+        """Queues a message without blocking. Returns False if the queue was full and it was dropped."""
+        if self._thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telegram-notifier', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            message = self.queue.get()
+            if message is _STOP:
+                self.queue.task_done()
+                break
+            batch = [message]
+            deadline = time.monotonic() + self.coalesce_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if message is _STOP:
+                    stopping = True
+                    self.queue.task_done()
+                    break
+                batch.append(message)
+            self._send_batch(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _send_batch(self, batch):
+        if self.dropped:
+            batch = batch + [f"({self.dropped} notifications dropped while the queue was full)"]
+            self.dropped = 0
+        text = '\n\n'.join(batch)
+        for start in range(0, len(text), TELEGRAM_MAX_LENGTH):
+            if self._post(text[start:start + TELEGRAM_MAX_LENGTH]):
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def _post(self, text):
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, data={'chat_id': self.chat_id, 'text': text}, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = self._redact(e)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Dropping Telegram message: {self._redact(e)}")
+                return False
+            else:
+                if response.ok:
+                    return True
+                error = f"HTTP {response.status_code}: {self._redact(response.text[:200])}"
+                if response.status_code == 429:
+                    # Telegram tells us how long to back off when rate limited
+                    try:
+                        delay = max(delay, float(response.json()['parameters']['retry_after']))
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                elif response.status_code < 500:
+                    # Bad request, token or chat id; sending it again cannot succeed
+                    logger.error(f"Telegram rejected the message, dropping it: {error}")
+                    return False
+            if attempt == self.max_retries:
+                break
+            logger.warning(f"Telegram send failed ({error}); retrying in {delay:g}s")
+            time.sleep(delay)
+            delay *= 2
+        logger.error(f"Failed to send Telegram message after {self.max_retries + 1} attempts: {error}")
+        return False
+
+    def _redact(self, error):
+        # Request errors quote the URL, which carries the bot token
+        return str(error).replace(self._token, '<token>')
+
+    def flush(self):
+        """Blocks until every queued message has been sent or given up on."""
+        if self._thread is not None:
+            self.queue.join()
+
+    def stop(self, timeout=10):
+        """Sends what is queued, then stops the worker, waiting at most `timeout` seconds."""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def _is_configured():
+    return TELEGRAM_TOKEN != 'YOUR_TELEGRAM_BOT_TOKEN' and TELEGRAM_CHAT_ID != 'YOUR_TELEGRAM_CHAT_ID'
+
+def get_dispatcher():
+    """The shared dispatcher, created on first use."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = TelegramDispatcher(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+    return _dispatcher
 
 def send_telegram(message):
-    """Sends a message to the pre-configured Telegram chat."""
-    if TELEGRAM_TOKEN == 'YOUR_TELEGRAM_BOT_TOKEN' or TELEGRAM_CHAT_ID == 'YOUR_TELEGRAM_CHAT_ID':
-        print("Telegram token or chat ID is not configured. Please update config.py.")
+    """Queues a message for the pre-configured Telegram chat and returns immediately."""
+    if not _is_configured():
+        logger.warning("Telegram token or chat ID is not configured. Please update config.py.")
         return
+    get_dispatcher().enqueue(message)
 
-    url = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage'
-    data = {'chat_id': TELEGRAM_CHAT_ID, 'text': message}
-    try:
-        response = requests.post(url, data=data, timeout=5)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to send Telegram message: {e}") 
\ No newline at end of file
+@atexit.register
+def shutdown_notifier():
+    """Delivers queued messages before the interpreter exits."""
+    if _dispatcher is not None:
+        _dispatcher.stop()
@@ -0,0 +1,197 @@
+"""
+Portfolio backtest: every symbol traded against one shared account.
+
+Each symbol's bars are streamed in chunks (backtest.iter_history) through
+strategy.iter_signals and turned into a generator of bar events. The
+generators are merged by timestamp with a heap-based k-way merge
+(heapq.merge), so the engine sees the bars of all symbols in chronological
+order while holding only one chunk per symbol; PORTFOLIO_BUFFER_BARS is
+split across the symbols, so memory stays bounded however many there are.
+
+At each timestamp the open positions are checked against their symbol's
+bar first (stop-loss, take-profit, holding limit, end of data) and
+realised into the shared balance. The signals of that timestamp then
+open positions sized off that balance, within MAX_OPEN_POSITIONS per
+symbol and MAX_PORTFOLIO_POSITIONS across all of them. With one symbol
+the trades are the same as run_backtest's.
+
+Usage:
+    python portfolio.py                      # SYMBOLS on TIMEFRAME from config
+    python portfolio.py EURUSD GBPUSD --max-positions 3
+"""
+import argparse
+import heapq
+from collections import deque
+from itertools import groupby, repeat
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from strategy import iter_signals, get_strategies, SIGNAL_WINDOW
+from risk import calculate_lot_size
+from symbol_registry import get_symbol_spec
+from timeframes import ResampleCache, confirm
+from backtest import iter_history, stored_intrabar, tp_hit_first, log_summary, dump_trades, VERBOSITY_SUMMARY, VERBOSITY_TRADES
+from utils import setup_logger
+from config import SYMBOLS, TIMEFRAME, INITIAL_BALANCE, ATR_SL_MULTIPLIER, REWARD_RISK_RATIO, MAX_HOLDING_BARS, MAX_OPEN_POSITIONS
+from config import MAX_PORTFOLIO_POSITIONS, PORTFOLIO_BUFFER_BARS, BACKTEST_VERBOSITY
+
+logger = setup_logger('backtest')
+
+# Columns of the trades yielded by iter_portfolio_trades
+COLUMNS = ['time', 'symbol', 'signal', 'price', 'lot', 'sl', 'tp', 'pnl', 'balance',
+           'exit_time', 'exit_price', 'exit_reason', 'bars_held']
+
+def bar_events(index, chunks, window=SIGNAL_WINDOW, strategies=None):
+    """
+    Bar events of one symbol, as tuples (time, index, bar, high, low, close,
+    direction, atr, last): time in epoch nanoseconds, `index` the symbol's
+    position in the portfolio (which breaks ties between symbols in the
+    merge), `bar` the bar's position in its series and `last` True on the
+    final bar. As in simulate_trades the final two bars never signal, so
+    two events are held back until the next chunk shows they are not last.
+    Signals come from `strategies` (default STRATEGIES) and are confirmed
+    on HTF_FILTERS, resampled chunk by chunk.
+    """
+    held = deque()
+    bar = 0
+    htf = ResampleCache()
+    for chunk, direction, atr in iter_signals(chunks, window=window, strategies=get_strategies(strategies)):
+        if htf.timeframes:
+            direction = confirm(direction, htf.update(chunk))
+        times = pd.to_datetime(chunk['time']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        for event in zip(times.tolist(), repeat(index), range(bar, bar + len(chunk)),
+                         chunk['high'].to_numpy(dtype=float).tolist(), chunk['low'].to_numpy(dtype=float).tolist(),
+                         chunk['close'].to_numpy(dtype=float).tolist(), direction.tolist(), atr.tolist()):
+            held.append(event)
+            if len(held) > 2:
+                yield held.popleft() + (False,)
+        bar += len(chunk)
+    while held:
+        time, index, bar, high, low, close, _, atr = held.popleft()
+        yield time, index, bar, high, low, close, 0, atr, not held
+
+def iter_portfolio_trades(symbols, timeframe=TIMEFRAME, initial_balance=None, sources=None, specs=None, intrabar=None,
+                          sl_multiplier=ATR_SL_MULTIPLIER, reward_risk=REWARD_RISK_RATIO, max_holding_bars=MAX_HOLDING_BARS,
+                          max_open_positions=MAX_OPEN_POSITIONS, max_portfolio_positions=MAX_PORTFOLIO_POSITIONS,
+                          chunk_bars=None, strategies=None):
+    """
+    Runs the portfolio and yields every trade as a dict of COLUMNS when it
+    closes, so trades come out in the order they were realised and
+    `balance` is the shared balance right after each one.
+
+    `sources` maps each symbol to an iterable of bar chunks (DataFrames with
+    time, open, high, low and close); by default they are read with iter_history
+    in chunks of chunk_bars (PORTFOLIO_BUFFER_BARS split across symbols).
+    `specs` and `intrabar` optionally map symbols to their SymbolSpec and
+    find_exits intrabar tuple; by default the registry and the bar store
+    are used. `strategies` defaults to STRATEGIES, as in run_backtest.
+    """
+    if initial_balance is None:
+        initial_balance = INITIAL_BALANCE
+    symbols = list(symbols)
+    if sources is None:
+        chunk_bars = chunk_bars or max(SIGNAL_WINDOW * 4, PORTFOLIO_BUFFER_BARS // max(len(symbols), 1))
+        sources = {symbol: iter_history(symbol, timeframe, chunk_bars) for symbol in symbols}
+        if intrabar is None:
+            intrabar = {symbol: stored_intrabar(symbol, timeframe) for symbol in symbols}
+    specs = [(specs or {}).get(symbol) or get_symbol_spec(symbol) for symbol in symbols]
+    intrabar = [(intrabar or {}).get(symbol) for symbol in symbols]
+
+    balance = initial_balance
+    # Per symbol: [is_buy, sl, tp, entry, lot, entry bar, entry time, signal]
+    positions = [[] for _ in symbols]
+    total_open = 0
+    strategies = get_strategies(strategies)
+    streams = [bar_events(i, sources[symbol], strategies=strategies) for i, symbol in enumerate(symbols)]
+
+    for time, group in groupby(heapq.merge(*streams), key=itemgetter(0)):
+        group = list(group)
+        # Exits first, so a position closed on this bar frees its slot and
+        # its PnL counts towards the sizing of new ones
+        for _, i, bar, high, low, close, _, _, last in group:
+            if not positions[i]:
+                continue
+            still_open = []
+            for position in positions[i]:
+                is_buy, sl, tp, entry, lot, entry_bar, entry_time, signal = position
+                if is_buy:
+                    sl_hit, tp_hit = low <= sl, high >= tp
+                else:
+                    sl_hit, tp_hit = high >= sl, low <= tp
+                if sl_hit and tp_hit:
+                    reason = 'tp' if intrabar[i] is not None and tp_hit_first(bar, is_buy, sl, tp, intrabar[i]) else 'sl'
+                elif sl_hit:
+                    reason = 'sl'
+                elif tp_hit:
+                    reason = 'tp'
+                elif max_holding_bars is not None and bar - entry_bar >= max_holding_bars:
+                    reason = 'time'
+                elif last:
+                    reason = 'end'
+                else:
+                    still_open.append(position)
+                    continue
+                exit_price = sl if reason == 'sl' else tp if reason == 'tp' else close
+                spec = specs[i]
+                pips = (exit_price - entry if is_buy else entry - exit_price) / spec.pip_size
+                pnl = pips * lot * spec.pip_value
+                balance += pnl
+                total_open -= 1
+                yield {
+                    'time': pd.Timestamp(entry_time), 'symbol': symbols[i], 'signal': signal, 'price': entry,
+                    'lot': lot, 'sl': sl, 'tp': tp, 'pnl': pnl, 'balance': balance,
+                    'exit_time': pd.Timestamp(time), 'exit_price': exit_price, 'exit_reason': reason,
+                    'bars_held': bar - entry_bar,
+                }
+            positions[i] = still_open
+
+        for _, i, bar, high, low, close, direction, atr, last in group:
+            if direction == 0 or atr == 0:
+                continue
+            if max_open_positions is not None and len(positions[i]) >= max_open_positions:
+                continue
+            if max_portfolio_positions is not None and total_open >= max_portfolio_positions:
+                continue
+            # Same arithmetic as simulate_trades so levels match bit for bit
+            is_buy = direction == 1
+            sl_distance = atr * sl_multiplier
+            tp_distance = sl_distance * reward_risk
+            sl = close - sl_distance if is_buy else close + sl_distance
+            tp = close + tp_distance if is_buy else close - tp_distance
+            lot = calculate_lot_size(balance, abs(close - sl) / specs[i].pip_size, specs[i])
+            if lot <= 0:
+                continue
+            positions[i].append([is_buy, sl, tp, close, lot, bar, time, 'buy' if is_buy else 'sell'])
+            total_open += 1
+
+def run_portfolio_backtest(symbols=None, timeframe=TIMEFRAME, initial_balance=None, verbosity=BACKTEST_VERBOSITY, **kwargs):
+    """
+    Collects iter_portfolio_trades into a DataFrame in the order the trades
+    closed. Logs a summary and dumps the trades as run_backtest does.
+    """
+    if initial_balance is None:
+        initial_balance = INITIAL_BALANCE
+    trades = list(iter_portfolio_trades(symbols or SYMBOLS, timeframe, initial_balance, **kwargs))
+    results = pd.DataFrame(trades, columns=COLUMNS) if trades else pd.DataFrame()
+    if verbosity >= VERBOSITY_SUMMARY:
+        log_summary(results, initial_balance, 'portfolio')
+    if verbosity >= VERBOSITY_TRADES and not results.empty:
+        dump_trades(results, 'portfolio')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest several symbols against one shared balance.")
+    parser.add_argument('symbols', nargs='*', default=SYMBOLS)
+    parser.add_argument('--timeframe', default=TIMEFRAME)
+    parser.add_argument('--balance', type=float, default=INITIAL_BALANCE)
+    parser.add_argument('--max-positions', type=int, default=MAX_PORTFOLIO_POSITIONS, help="Open positions across all symbols")
+    args = parser.parse_args()
+    results = run_portfolio_backtest(args.symbols, args.timeframe, args.balance, max_portfolio_positions=args.max_positions)
+    if results.empty:
+        print("No trades.")
+        return
+    print(results.groupby('symbol')['pnl'].agg(['count', 'sum']).to_string())
+    print(f"{len(results)} trades, final balance {results['balance'].iloc[-1]:,.2f}")
+
+if __name__ == '__main__':
+    main()
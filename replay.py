@@ -0,0 +1,376 @@
+"""
+Offline replay of the live loop over stored bars.
+
+ReplayBroker offers the functions main.py calls on broker.py (connect,
+disconnect, get_account_info, get_historical_data, get_tick, get_positions,
+place_order, get_server_time_offset) on top of the bar store or the
+historical CSVs, with a simulated clock. run_replay moves that clock from
+one bar close to the next as fast as the CPU allows and runs
+main.live_trading at each one, so the scan, HTF confirmation, sizing and
+order code all run exactly as they do live, and weeks replay in seconds.
+The scan is held to the backtest's MAX_OPEN_POSITIONS per symbol (in place
+of LIVE_MAX_OPEN_POSITIONS) so its trades can be compared with it.
+
+At each bar close the scan sees the bars up to it plus the bar that just
+opened, as MT5 returns it at its first tick (open = high = low = close);
+with --closed-bars it sees the closed bars only, as the backtester does.
+Market orders fill at the new bar's open, plus its stored spread for buys.
+Open positions are then settled on every bar as it closes, with the
+stop-loss taken first when a bar touches both levels and MAX_HOLDING_BARS
+closing them at the bar's close, as in the backtester.
+
+Closed trades have the backtester's columns and go to the trade journal
+as a 'replay' run and to logs/replay_results.csv; --compare matches them
+against run_backtest's trades over the same span.
+
+Usage:
+    python replay.py --start 2024-01-01 --end 2024-02-01
+    python replay.py --symbols EURUSD GBPUSD --compare
+"""
+import argparse
+import logging
+import time
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from backtest import load_history, run_backtest
+from risk import round_volume
+from symbol_registry import get_symbol_spec
+from timeframes import warmup_bars
+from utils import setup_logger, timeframe_seconds
+import indicators
+import timeframes
+from config import SYMBOLS, TIMEFRAME, INITIAL_BALANCE, MAX_HOLDING_BARS, MAX_OPEN_POSITIONS, LOG_DIR
+
+logger = setup_logger('replay')
+
+# Trade columns, as in the backtester's results
+COLUMNS = ['time', 'symbol', 'signal', 'price', 'lot', 'sl', 'tp', 'pnl', 'balance',
+           'exit_time', 'exit_price', 'exit_reason', 'bars_held']
+
+AccountInfo = namedtuple('AccountInfo', 'login balance equity margin_free currency')
+Tick = namedtuple('Tick', 'time bid ask last')
+TradePosition = namedtuple('TradePosition', 'ticket time symbol type volume price_open sl tp magic comment')
+
+# Bars the scan requests, plus the history live_trend loads on first use
+SCAN_BARS = 100
+
+def _bar_arrays(df):
+    """A bar frame as plain arrays, with time in epoch seconds and spread in points (0 if absent)."""
+    arrays = {'time': pd.to_datetime(df['time']).to_numpy(dtype='datetime64[s]').astype(np.int64)}
+    for name in ('open', 'high', 'low', 'close'):
+        arrays[name] = df[name].to_numpy(dtype=float)
+    for name in ('tick_volume', 'spread', 'real_volume'):
+        arrays[name] = df[name].to_numpy(dtype=np.int64) if name in df.columns else np.zeros(len(df), dtype=np.int64)
+    return arrays
+
+class ReplayBroker:
+    """
+    A broker over stored bars with a simulated clock. `now` is the open time
+    of the bar being formed; step() moves it to the next bar open across all
+    symbols within [start, end]. By default the replay starts as soon as every
+    symbol has the history a scan needs (SCAN_BARS and the HTF warm-up).
+    Without `forming_bar` the bars returned stop at the last closed one.
+    """
+
+    def __init__(self, symbols=None, timeframe=TIMEFRAME, start=None, end=None, initial_balance=None,
+                 max_holding_bars=MAX_HOLDING_BARS, spread=True, forming_bar=True):
+        self.timeframe = timeframe
+        self.period = timeframe_seconds(timeframe)
+        self.balance = INITIAL_BALANCE if initial_balance is None else initial_balance
+        self.max_holding_bars = max_holding_bars
+        self.spread = spread
+        self.forming_bar = forming_bar
+        self.bars = {}
+        for symbol in symbols or SYMBOLS:
+            df = load_history(symbol, timeframe)
+            if df is not None:
+                self.bars[symbol] = _bar_arrays(df)
+        self.symbols = list(self.bars)
+        self.specs = {symbol: get_symbol_spec(symbol) for symbol in self.symbols}
+
+        history = max(SCAN_BARS, warmup_bars(timeframe))
+        first = max((int(data['time'][min(history, len(data['time']) - 1)]) for data in self.bars.values()), default=0)
+        if start is not None:
+            first = max(first, int(pd.Timestamp(start).timestamp()))
+        last = int(pd.Timestamp(end).timestamp()) if end is not None else None
+        times = np.unique(np.concatenate([data['time'] for data in self.bars.values()])) if self.bars else np.array([], dtype=np.int64)
+        self._clock = times[(times >= first) & (times <= last if last is not None else True)]
+        self._next = 0
+        self.now = None
+        # Per symbol: how many of its bars have closed (open time < now)
+        self._closed = dict.fromkeys(self.symbols, 0)
+        self.positions = {symbol: [] for symbol in self.symbols}
+        self.trades = []
+        self._tickets = 0
+
+    # --- Clock ---
+
+    def step(self):
+        """
+        Moves the clock to the next bar open and settles the open positions
+        on the bars that closed on the way. Returns False once the replay is over.
+        """
+        if self._next >= len(self._clock):
+            return False
+        self.now = int(self._clock[self._next])
+        self._next += 1
+        for symbol, data in self.bars.items():
+            closed = int(np.searchsorted(data['time'], self.now, side='left'))
+            for bar in range(self._closed[symbol], closed):
+                if not self.positions[symbol]:
+                    break
+                self._settle(symbol, bar)
+            self._closed[symbol] = closed
+        return True
+
+    def finish(self):
+        """Closes whatever is still open at the close of its symbol's last closed bar."""
+        for symbol in self.symbols:
+            bar = self._closed[symbol] - 1
+            for position in list(self.positions[symbol]):
+                self._close(symbol, position, bar, 'end', self.bars[symbol]['close'][bar])
+            self.positions[symbol] = []
+
+    def _settle(self, symbol, bar):
+        data = self.bars[symbol]
+        high, low = data['high'][bar], data['low'][bar]
+        still_open = []
+        for position in self.positions[symbol]:
+            if position['is_buy']:
+                sl_hit, tp_hit = low <= position['sl'], high >= position['tp']
+            else:
+                sl_hit, tp_hit = high >= position['sl'], low <= position['tp']
+            if sl_hit:
+                self._close(symbol, position, bar, 'sl', position['sl'])
+            elif tp_hit:
+                self._close(symbol, position, bar, 'tp', position['tp'])
+            elif self.max_holding_bars is not None and bar - position['bar'] >= self.max_holding_bars:
+                self._close(symbol, position, bar, 'time', data['close'][bar])
+            else:
+                still_open.append(position)
+        self.positions[symbol] = still_open
+
+    def _close(self, symbol, position, bar, reason, exit_price):
+        spec = self.specs[symbol]
+        is_buy = position['is_buy']
+        pnl = (exit_price - position['price'] if is_buy else position['price'] - exit_price) / spec.pip_size * position['lot'] * spec.pip_value
+        self.balance += pnl
+        self.trades.append({
+            'time': pd.Timestamp(position['time'], unit='s'), 'symbol': symbol, 'signal': 'buy' if is_buy else 'sell',
+            'price': position['price'], 'lot': position['lot'], 'sl': position['sl'], 'tp': position['tp'],
+            'pnl': pnl, 'balance': self.balance, 'exit_time': pd.Timestamp(int(self.bars[symbol]['time'][bar]), unit='s'),
+            'exit_price': exit_price, 'exit_reason': reason, 'bars_held': bar - position['bar'],
+        })
+
+    def _forming(self, symbol):
+        """Index of the symbol's bar opening at `now`, or None if it has none there."""
+        data = self.bars.get(symbol)
+        closed = self._closed.get(symbol, 0)
+        if data is not None and closed < len(data['time']) and data['time'][closed] == self.now:
+            return closed
+        return None
+
+    def results(self):
+        """The closed trades, in the order they closed."""
+        return pd.DataFrame(self.trades, columns=COLUMNS)
+
+    # --- broker.py surface ---
+
+    def connect(self):
+        return self.now is not None
+
+    def disconnect(self):
+        pass
+
+    def get_server_time_offset(self, symbol):
+        return 0
+
+    def get_account_info(self):
+        """Balance of the closed trades; equity also marks the open positions to the current ticks."""
+        equity = self.balance
+        for symbol, positions in self.positions.items():
+            if not positions:
+                continue
+            tick = self.get_tick(symbol)
+            spec = self.specs[symbol]
+            for position in positions:
+                exit_price = tick.bid if position['is_buy'] else tick.ask
+                pips = (exit_price - position['price'] if position['is_buy'] else position['price'] - exit_price) / spec.pip_size
+                equity += pips * position['lot'] * spec.pip_value
+        return AccountInfo(login=0, balance=self.balance, equity=equity, margin_free=equity, currency='USD')
+
+    def get_historical_data(self, symbol, timeframe, bars=100):
+        """The last `bars` bars at `now` (the forming one last, if enabled) with MT5's columns."""
+        if timeframe != self.timeframe:
+            logger.error(f"Replay has {self.timeframe} bars only, not {timeframe}")
+            return None
+        data = self.bars.get(symbol)
+        if data is None:
+            logger.error(f"No replay data for {symbol}")
+            return None
+        forming = self._forming(symbol) if self.forming_bar else None
+        hi = self._closed[symbol] + (forming is not None)
+        lo = max(0, hi - bars)
+        df = pd.DataFrame({name: values[lo:hi] for name, values in data.items()})
+        if forming is not None:
+            # Only the first tick of the new bar has happened
+            df.iloc[-1, df.columns.get_indexer(['high', 'low', 'close'])] = data['open'][forming]
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df
+
+    def get_tick(self, symbol):
+        """Bid at the forming bar's open (the last close if the symbol has no bar now); ask adds its spread."""
+        data = self.bars.get(symbol)
+        if data is None or self._closed[symbol] == 0:
+            logger.error(f"No tick for {symbol} at {self.now}")
+            return None
+        forming = self._forming(symbol)
+        bar = self._closed[symbol] - 1 if forming is None else forming
+        bid = data['open'][bar] if forming is not None else data['close'][bar]
+        ask = bid + (data['spread'][bar] * self.specs[symbol].point if self.spread else 0.0)
+        return Tick(time=self.now, bid=bid, ask=ask, last=bid)
+
+    def get_positions(self, symbol=None):
+        symbols = [symbol] if symbol else self.symbols
+        return [
+            TradePosition(ticket=p['ticket'], time=p['time'], symbol=s, type=0 if p['is_buy'] else 1, volume=p['lot'],
+                          price_open=p['price'], sl=p['sl'], tp=p['tp'], magic=0, comment='replay')
+            for s in symbols for p in self.positions.get(s, [])
+        ]
+
+    def place_order(self, symbol, direction, lot, sl, tp, signal_price=None):
+        """Fills a market order at the current tick. Stops on the wrong side of the fill are rejected."""
+        tick = self.get_tick(symbol)
+        if tick is None:
+            return False
+        is_buy = direction == 'buy'
+        price = tick.ask if is_buy else tick.bid
+        if (is_buy and not sl < price < tp) or (not is_buy and not tp < price < sl):
+            logger.error(f"Replay order for {symbol} rejected: invalid stops (price {price}, SL {sl}, TP {tp})")
+            return False
+        self._tickets += 1
+        # The bar the signal was taken on, so bars_held counts as in the backtester
+        self.positions[symbol].append({
+            'ticket': self._tickets, 'is_buy': is_buy, 'price': price, 'lot': round_volume(lot, self.specs[symbol]),
+            'sl': sl, 'tp': tp, 'bar': self._closed[symbol] - 1, 'time': self.now,
+        })
+        return True
+
+def run_replay(symbols=None, timeframe=TIMEFRAME, start=None, end=None, initial_balance=None, forming_bar=True,
+               verbose=False, save=True):
+    """
+    Replays the live loop over [start, end] and returns the closed trades as
+    a DataFrame of COLUMNS. main's per-scan logging is raised to warnings
+    unless `verbose`; live metrics, indicator checkpoints and the live trade
+    log are left alone.
+    With `save` the trades go to the journal and logs/replay_results.csv.
+    """
+    # broker.py needs the MetaTrader5 module to import; the replay never calls into it
+    try:
+        import MetaTrader5  # noqa: F401
+    except ImportError:
+        import fake_mt5
+        fake_mt5.install()
+    import main
+
+    broker = ReplayBroker(symbols, timeframe, start, end, initial_balance, forming_bar=forming_bar)
+    # The scan walks main's SYMBOLS on its TIMEFRAME, which come from config,
+    # and is held to the backtest's per-symbol position cap for parity with it
+    live_settings = main.SYMBOLS, main.TIMEFRAME, main.LIVE_MAX_OPEN_POSITIONS
+    main.SYMBOLS, main.TIMEFRAME, main.LIVE_MAX_OPEN_POSITIONS = broker.symbols, timeframe, MAX_OPEN_POSITIONS
+    timeframes._live_caches.clear()
+    indicators._live_states.clear()
+    main_logger = logging.getLogger('main')
+    level = main_logger.level
+    if not verbose:
+        main_logger.setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    scans = 0
+    try:
+        while broker.step():
+            main.live_trading(broker=broker, trade_logger=lambda trade: None, metrics_file=None, state_file=None)
+            scans += 1
+    finally:
+        main_logger.setLevel(level)
+        main.SYMBOLS, main.TIMEFRAME, main.LIVE_MAX_OPEN_POSITIONS = live_settings
+    broker.finish()
+    seconds = time.perf_counter() - started
+
+    results = broker.results()
+    if scans:
+        span_text = f"{pd.Timestamp(int(broker._clock[0]), unit='s')} to {pd.Timestamp(broker.now, unit='s')}"
+        logger.info(f"Replayed {scans} scans ({span_text}) in {seconds:.1f}s: {len(results)} trades, final balance {broker.balance:.2f}")
+    else:
+        logger.warning("Nothing to replay: no bars in the requested span.")
+    if save and not results.empty:
+        from journal import get_journal
+        journal = get_journal()
+        run_id = journal.start_run('replay', params={
+            'symbols': broker.symbols, 'timeframe': timeframe, 'start': str(start), 'end': str(end),
+            'initial_balance': initial_balance if initial_balance is not None else INITIAL_BALANCE, 'forming_bar': forming_bar,
+        })
+        journal.add_frame(run_id, results)
+        journal.export_csv(f'{LOG_DIR}replay_results.csv', run_id=run_id)
+        logger.info(f"Saved to the trade journal as run {run_id} and to {LOG_DIR}replay_results.csv")
+    return results
+
+def compare_with_backtest(results, symbols=None, timeframe=TIMEFRAME, start=None, end=None):
+    """
+    Per symbol, the replay's trades against run_backtest's entered in the
+    same span. A replay trade entered at a bar's open matches the backtest
+    trade signalled on the bar before with the same direction. PnL is
+    compared in pips, which does not depend on either run's balance.
+    """
+    period = pd.Timedelta(seconds=timeframe_seconds(timeframe))
+    rows = []
+    for symbol in symbols or SYMBOLS:
+        df = load_history(symbol, timeframe)
+        if df is None:
+            continue
+        spec = get_symbol_spec(symbol)
+        backtest = run_backtest(df, spec=spec, name=symbol, verbosity=0)
+        replay = results[results['symbol'] == symbol]
+        signal_times = pd.to_datetime(replay['time']) - period
+        if backtest.empty:
+            backtest = pd.DataFrame(columns=COLUMNS)
+        backtest_times = pd.to_datetime(backtest['time'])
+        lo = signal_times.min() if start is None else pd.Timestamp(start) - period
+        hi = signal_times.max() if end is None else pd.Timestamp(end)
+        backtest = backtest[(backtest_times >= lo) & (backtest_times <= hi)]
+
+        def pips(trades):
+            sign = np.where(trades['signal'] == 'buy', 1.0, -1.0)
+            return float(((trades['exit_price'] - trades['price']) * sign).sum() / spec.pip_size)
+
+        matched = set(zip(signal_times, replay['signal'])) & set(zip(pd.to_datetime(backtest['time']), backtest['signal']))
+        rows.append({
+            'symbol': symbol, 'replay_trades': len(replay), 'backtest_trades': len(backtest), 'matched': len(matched),
+            'replay_pips': pips(replay) if len(replay) else 0.0, 'backtest_pips': pips(backtest) if len(backtest) else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the live trading loop over stored bars.")
+    parser.add_argument('--symbols', nargs='*', default=SYMBOLS)
+    parser.add_argument('--timeframe', default=TIMEFRAME)
+    parser.add_argument('--start', help="First bar close to scan at (default: once every symbol has enough history)")
+    parser.add_argument('--end', help="Last bar close to scan at (default: the end of the data)")
+    parser.add_argument('--balance', type=float, default=INITIAL_BALANCE)
+    parser.add_argument('--closed-bars', action='store_true', help="Leave the forming bar out of the scan's bars")
+    parser.add_argument('--compare', action='store_true', help="Compare the trades with run_backtest's")
+    parser.add_argument('--verbose', action='store_true', help="Keep main's per-scan log lines")
+    args = parser.parse_args()
+    results = run_replay(args.symbols, args.timeframe, args.start, args.end, args.balance,
+                         forming_bar=not args.closed_bars, verbose=args.verbose)
+    if results.empty:
+        print("No trades.")
+        return
+    print(results.groupby('symbol')['pnl'].agg(['count', 'sum']).to_string())
+    print(f"{len(results)} trades, final balance {results['balance'].iloc[-1]:,.2f}")
+    if args.compare:
+        print(compare_with_backtest(results, args.symbols, args.timeframe, args.start, args.end).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
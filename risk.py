@@ -5,32 +5,45 @@ from config import (
     ATR_SL_MULTIPLIER,
     REWARD_RISK_RATIO
 )
+from symbol_registry import default_spec
 
-def calculate_lot_size(balance, stop_loss_pips):
+_DEFAULT_SPEC = default_spec('')
+
+def calculate_lot_size(balance, stop_loss_pips, spec=None):
     """
     Calculates the trade volume (lot size) based on the chosen method in config.py.
+    `spec` is the symbol's SymbolSpec from symbol_registry; it supplies the
+    pip value and the broker's volume step and limits. Without it a major
+    USD-quoted pair is assumed.
     """
+    if spec is None:
+        spec = _DEFAULT_SPEC
+
     if USE_FIXED_LOT_SIZE:
         return LOT_SIZE
 
     # --- Dynamic Lot Size Calculation ---
     if stop_loss_pips <= 0:
         # Avoid division by zero and invalid trades
-        return 0.01  # Default to minimum lot size as a fallback
+        return spec.volume_min  # Default to minimum lot size as a fallback
 
     # Risk amount in account currency (e.g., USD)
     risk_amount = balance * RISK_PER_TRADE
 
-    # This is a simplification. For a multi-currency portfolio, this needs to be
-    # dynamic based on the quote currency of the pair.
-    # For major USD-quoted pairs (EURUSD, GBPUSD), this is ~$10 per standard lot.
-    value_per_pip_per_lot = 10.0
-
     # Calculate required lot size to match the risk amount
-    calculated_lots = risk_amount / (stop_loss_pips * value_per_pip_per_lot)
+    calculated_lots = risk_amount / (stop_loss_pips * spec.pip_value)
+
+    return round_volume(calculated_lots, spec)
 
-    # Return the calculated lot size, rounded to 2 decimal places, but not less than 0.01
-    return max(0.01, round(calculated_lots, 2))
+def round_volume(lots, spec=None):
+    """Rounds lots to the broker's volume step and keeps them within its limits."""
+    if spec is None:
+        spec = _DEFAULT_SPEC
+    lots = round(round(lots / spec.volume_step) * spec.volume_step, 8)
+    lots = max(spec.volume_min, lots)
+    if spec.volume_max:
+        lots = min(spec.volume_max, lots)
+    return lots
 
 
 def get_sl_tp(price, direction, atr):
@@ -1,5 +1,6 @@
 import MetaTrader5 as mt5
 from config import ACCOUNT_LOGIN, ACCOUNT_PASSWORD, SERVER
+from symbol_registry import refresh_registry
 
 # --- Filter Settings ---
 # Set the maximum allowed spread in points. 10 points = 1 pip for 5-digit brokers.
@@ -30,12 +31,11 @@ def scan_symbols():
     print(f"Scanning {len(all_symbols)} total symbols from the broker...")
     filtered_symbols = []
 
-    for symbol in all_symbols:
-        # We need to get the full symbol information
-        info = mt5.symbol_info(symbol.name)
-        if not info:
-            continue
+    # symbols_get() already returns the full symbol information; cache it for
+    # pip sizing and lot limits while we have it
+    refresh_registry(all_symbols)
 
+    for info in all_symbols:
         # --- Apply Filters ---
         # 1. Check if the symbol is visible in Market Watch (tradable)
         if not info.visible:
@@ -1,3 +1,5 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
 import pandas as pd
 import numpy as np
 # Add a check for ATR_PERIOD, if not found, use a default
@@ -5,6 +7,10 @@ try:
     from config import ATR_PERIOD
 except ImportError:
     ATR_PERIOD = 14
+try:
+    from config import STRATEGIES as ACTIVE_STRATEGIES
+except ImportError:
+    ACTIVE_STRATEGIES = ['rsi_ma']
 
 def calculate_rsi(series, period=14):
     delta = series.diff()
@@ -17,15 +23,272 @@ def calculate_rsi(series, period=14):
 def calculate_ma(series, period=50):
     return series.rolling(window=period).mean()
 
-def calculate_atr(high, low, close, period=14):
-    """Calculates the Average True Range (ATR)."""
+def calculate_atr(high, low, close, period=14, initial=None):
+    """
+    Calculates the Average True Range (ATR).
+    `initial` is the ATR of the first row as computed over earlier data; the
+    EWM then continues from it instead of restarting at that row.
+    """
     tr1 = pd.DataFrame(high - low)
     tr2 = pd.DataFrame(abs(high - close.shift(1)))
     tr3 = pd.DataFrame(abs(low - close.shift(1)))
     tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+    if initial is not None and len(tr):
+        tr.iloc[0] = initial
     atr = tr.ewm(alpha=1/period, adjust=False).mean()
     return atr
 
+# Number of bars generate_signal is given per evaluation in the backtest.
+SIGNAL_WINDOW = 51
+
+def calculate_windowed_atr(high, low, close, period=14, window=SIGNAL_WINDOW):
+    """
+    ATR as calculate_atr would return it on the last row of every trailing
+    `window`-bar slice, computed for the whole series at once.
+
+    The EWM is seeded with the first row of whatever frame it is given, so a
+    sliced frame gives a different value than the full series. Because the
+    recursion is linear, the sliced value is the full-series EWM with the
+    seed swapped out: y[t] = E[t] - d * (E[s] - (high[s] - low[s])), where
+    s = t - window + 1 and d = (1 - 1/period) ** (window - 1).
+    """
+    full = calculate_atr(high, low, close, period=period).to_numpy(dtype=float)
+    return _window_atr(full, high, low, period, window)
+
+def _window_atr(full, high, low, period, window):
+    seed = (high - low).to_numpy(dtype=float)
+    decay = (1 - 1 / period) ** (window - 1)
+    atr = np.full(len(full), np.nan)
+    if len(full) >= window:
+        atr[window - 1:] = full[window - 1:] - decay * (full[:len(full) - window + 1] - seed[:len(full) - window + 1])
+    return atr
+
+def signals_from_indicators(rsi, ma_short, ma_long, atr, warmup, rsi_low=30, rsi_high=70):
+    """
+    Applies the generate_signal rule to precomputed indicator arrays.
+    Bars before `warmup` never signal. Returns an int8 array with 1 for buy,
+    -1 for sell and 0 for no signal.
+    """
+    # NaN comparisons are False, so bars without enough history never signal
+    with np.errstate(invalid='ignore'):
+        buy = (ma_short > ma_long) & (rsi < rsi_low)
+        sell = (ma_short < ma_long) & (rsi > rsi_high)
+    valid = ~np.isnan(rsi) & ~np.isnan(atr)
+    valid[:warmup] = False
+
+    direction = np.zeros(len(rsi), dtype=np.int8)
+    direction[valid & buy] = 1
+    direction[valid & sell] = -1
+    return direction
+
+# --- Strategy registry ---
+
+# An indicator a strategy needs, e.g. Indicator('sma', 20). Kinds: 'rsi',
+# 'sma' and 'atr'. Equal indicators are computed once per IndicatorCache.
+Indicator = namedtuple('Indicator', 'kind period')
+
+def _lookback(indicator):
+    """Earlier bars an indicator needs for its first value (ATR's EWM is carried instead)."""
+    kind, period = indicator
+    return {'rsi': period, 'sma': period - 1}.get(kind, 0)
+
+class IndicatorCache:
+    """
+    Indicators of one bar series, each computed the first time a strategy
+    asks for it and shared by every strategy evaluated on the series.
+
+    With `window`, ATRs are the ones generate_signal sees on each trailing
+    `window`-bar slice (see calculate_windowed_atr) and signals start after
+    `warmup` bars (default window - 1), as in the backtester; without it
+    they are calculate_atr over the whole frame, as in the live scan.
+    `atr_initial` maps ATR periods to the EWM value at the first row, carried
+    over from earlier data (see iter_signals).
+    """
+
+    def __init__(self, df, window=None, warmup=None, atr_initial=None):
+        self.df = df
+        self.window = window
+        self.warmup = warmup if warmup is not None else max(0, (window or 1) - 1)
+        self.atr_initial = atr_initial or {}
+        self._values = {}
+        self._full_atr = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def __getitem__(self, indicator):
+        if indicator not in self._values:
+            self._values[indicator] = self._compute(indicator)
+        return self._values[indicator]
+
+    def full_atr(self, period):
+        """calculate_atr over the whole frame, continuing from atr_initial."""
+        if period not in self._full_atr:
+            self._full_atr[period] = calculate_atr(
+                self.df['high'], self.df['low'], self.df['close'], period=period, initial=self.atr_initial.get(period),
+            ).to_numpy(dtype=float)
+        return self._full_atr[period]
+
+    def _compute(self, indicator):
+        kind, period = indicator
+        close = self.df['close']
+        if kind == 'rsi':
+            return calculate_rsi(close, period=period).to_numpy(dtype=float)
+        if kind == 'sma':
+            return calculate_ma(close, period=period).to_numpy(dtype=float)
+        if kind == 'atr':
+            full = self.full_atr(period)
+            return full if self.window is None else _window_atr(full, self.df['high'], self.df['low'], period, self.window)
+        raise ValueError(f"Unknown indicator: {kind}")
+
+class Strategy(ABC):
+    """
+    A signal rule over declared indicators. Subclasses set `name`, list
+    what they read in `indicators` and implement signals(); one that does
+    not cannot be created, so register() rejects it at import. `atr` is
+    the ATR the stops are sized from.
+    """
+    name = None
+
+    def __init__(self, atr_period=ATR_PERIOD):
+        self.atr = Indicator('atr', atr_period)
+
+    @property
+    def indicators(self):
+        return (self.atr,)
+
+    @abstractmethod
+    def signals(self, cache):
+        """int8 array over the cache's rows: 1 buy, -1 sell, 0 no signal."""
+
+# Strategies by name; see register()
+REGISTRY = {}
+
+def register(cls):
+    """Class decorator adding a Strategy with default parameters to REGISTRY."""
+    REGISTRY[cls.name] = cls()
+    return cls
+
+@register
+class RsiMaStrategy(Strategy):
+    """Buys oversold RSI while the short MA is above the long one, and sells the reverse."""
+    name = 'rsi_ma'
+
+    def __init__(self, short_period=20, long_period=50, rsi_period=14, atr_period=ATR_PERIOD, rsi_low=30, rsi_high=70):
+        super().__init__(atr_period)
+        self.rsi = Indicator('rsi', rsi_period)
+        self.ma_short = Indicator('sma', short_period)
+        self.ma_long = Indicator('sma', long_period)
+        self.rsi_low = rsi_low
+        self.rsi_high = rsi_high
+
+    @property
+    def indicators(self):
+        return (self.rsi, self.ma_short, self.ma_long, self.atr)
+
+    def signals(self, cache):
+        return signals_from_indicators(cache[self.rsi], cache[self.ma_short], cache[self.ma_long], cache[self.atr],
+                                       cache.warmup, rsi_low=self.rsi_low, rsi_high=self.rsi_high)
+
+def get_strategies(strategies=None):
+    """Strategy instances for names or instances (default STRATEGIES from config)."""
+    strategies = ACTIVE_STRATEGIES if strategies is None else strategies
+    if isinstance(strategies, (str, Strategy)):
+        strategies = [strategies]
+    try:
+        return [REGISTRY[s] if isinstance(s, str) else s for s in strategies]
+    except KeyError as e:
+        raise ValueError(f"Unknown strategy: {e.args[0]} (registered: {', '.join(REGISTRY)})") from None
+
+def combine_signals(cache, strategies):
+    """
+    Evaluates strategies in order on one IndicatorCache (or anything that
+    serves indicator arrays the same way); at each row the
+    first to signal wins. Returns (direction, atr, which): the direction,
+    the winning strategy's ATR (the first strategy's where none signals)
+    and its position in `strategies` (-1 where none signals).
+    """
+    direction = np.zeros(len(cache), dtype=np.int8)
+    atr = np.array(cache[strategies[0].atr], dtype=float)
+    which = np.full(len(cache), -1, dtype=np.int8)
+    for i, strategy in enumerate(strategies):
+        signals = strategy.signals(cache)
+        fired = (direction == 0) & (signals != 0)
+        if not fired.any():
+            continue
+        direction[fired] = signals[fired]
+        which[fired] = i
+        if i > 0:
+            atr[fired] = cache[strategy.atr][fired]
+    return direction, atr, which
+
+def latest_signal(df, strategies=None):
+    """
+    The live form of combine_signals: the signal on the last bar of df as
+    (signal, atr_value, strategy name), e.g. ('buy', 0.0015, 'rsi_ma'), or
+    (None, None, None). Each indicator is computed once however many
+    strategies read it.
+    """
+    strategies = get_strategies(strategies)
+    if len(df) == 0:
+        return None, None, None
+    direction, atr, which = combine_signals(IndicatorCache(df), strategies)
+    if direction[-1] == 0:
+        return None, None, None
+    return 'buy' if direction[-1] == 1 else 'sell', float(atr[-1]), strategies[which[-1]].name
+
+def generate_signals(df, window=SIGNAL_WINDOW, short_period=20, long_period=50, atr_period=ATR_PERIOD, rsi_low=30, rsi_high=70,
+                     strategies=None):
+    """
+    Vectorized generate_signal over every trailing `window`-bar slice of df.
+    Returns a tuple of arrays aligned with the rows of df: (direction, atr),
+    where direction is 1 for buy, -1 for sell and 0 for no signal.
+    `strategies` replaces the RSI/MA rule of the other arguments with
+    registered strategies, combined as in combine_signals.
+    """
+    if strategies is None:
+        strategies = [RsiMaStrategy(short_period, long_period, atr_period=atr_period, rsi_low=rsi_low, rsi_high=rsi_high)]
+    direction, atr, _ = combine_signals(IndicatorCache(df, window=window), get_strategies(strategies))
+    return direction, atr
+
+def iter_signals(chunks, window=SIGNAL_WINDOW, short_period=20, long_period=50, atr_period=ATR_PERIOD, rsi_low=30, rsi_high=70,
+                 strategies=None):
+    """
+    generate_signals over a series that arrives as consecutive chunks
+    (DataFrames in time order). Yields (chunk, direction, atr) per chunk.
+
+    The last bars of each chunk are carried into the next as warm-up, and
+    the ATR's EWM continues from its value at the start of that tail rather
+    than restarting, so the ATR matches the whole-series one bit for bit.
+    Only the carried tail is ever held besides the current chunk.
+    """
+    if strategies is None:
+        strategies = [RsiMaStrategy(short_period, long_period, atr_period=atr_period, rsi_low=rsi_low, rsi_high=rsi_high)]
+    strategies = get_strategies(strategies)
+    indicators = {indicator for strategy in strategies for indicator in strategy.indicators}
+    atr_periods = {period for kind, period in indicators if kind == 'atr'}
+    keep = max([window - 1] + [_lookback(indicator) for indicator in indicators])
+    tail = None
+    carry = None  # Whole-series ATR EWMs at the first row of tail
+    seen = 0  # Bars before the current frame
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if tail is None:
+            frame = chunk.reset_index(drop=True)
+        else:
+            frame = pd.concat([tail, chunk], ignore_index=True)
+        cache = IndicatorCache(frame, window=window, warmup=max(0, window - 1 - seen), atr_initial=carry)
+        direction, atr, _ = combine_signals(cache, strategies)
+
+        skip = len(frame) - len(chunk)
+        yield chunk, direction[skip:], atr[skip:]
+
+        cut = max(0, len(frame) - keep)
+        seen += cut
+        carry = {period: cache.full_atr(period)[cut] for period in atr_periods}
+        tail = frame.iloc[cut:][['high', 'low', 'close']]
+
 def generate_signal(df):
     """
     Generates a trade signal and the current ATR value.
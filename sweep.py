@@ -0,0 +1,202 @@
+"""
+Parameter sweep over the strategy and risk settings.
+
+Indicators are computed once per symbol for every distinct period in the
+search space, then the combinations are evaluated in batches on a process
+pool using the vectorized backtest. Results are ranked and written to
+SWEEP_RESULTS_FILE.
+
+Usage:
+    python sweep.py                  # full grid over SWEEP_SPACE
+    python sweep.py --random 500     # 500 random draws from SWEEP_SPACE
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from backtest import load_history, simulate_trades
+from symbol_registry import get_symbol_spec
+from strategy import calculate_rsi, calculate_ma, calculate_windowed_atr, signals_from_indicators, SIGNAL_WINDOW
+from timeframes import ResampleCache, confirm
+from config import SYMBOLS, TIMEFRAME, INITIAL_BALANCE
+from utils import setup_logger
+
+logger = setup_logger('sweep')
+
+# --- Sweep Settings ---
+# Each entry is a list of values to try. For --random, a (low, high) tuple is
+# sampled uniformly instead (integers if both bounds are ints).
+SWEEP_SPACE = {
+    'atr_sl_multiplier': [1.5, 2.0, 2.5, 3.0],
+    'reward_risk_ratio': [1.0, 1.5, 2.0, 3.0],
+    'atr_period': [10, 14, 20],
+    'rsi_low': [20, 25, 30],
+    'rsi_high': [70, 75, 80],
+    'ma_short': [10, 20, 30],
+    'ma_long': [50, 100, 200],
+}
+SWEEP_WORKERS = os.cpu_count() or 1
+SWEEP_BATCH_SIZE = 32  # Combinations per task sent to a worker
+SWEEP_RANK_BY = 'sharpe'  # One of RANK_COLUMNS
+SWEEP_RESULTS_FILE = 'logs/sweep_results.csv'
+
+def grid_combinations(space):
+    """All combinations of the listed values, skipping ma_short >= ma_long."""
+    keys = list(space)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    return [c for c in combos if c['ma_short'] < c['ma_long']]
+
+def random_combinations(space, n, seed=0):
+    """n random draws from the space, skipping ma_short >= ma_long."""
+    rng = random.Random(seed)
+    combos = []
+    attempts = 0
+    while len(combos) < n and attempts < n * 100:
+        attempts += 1
+        combo = {}
+        for key, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                combo[key] = rng.randint(low, high) if isinstance(low, int) and isinstance(high, int) else rng.uniform(low, high)
+            else:
+                combo[key] = rng.choice(values)
+        if combo['ma_short'] < combo['ma_long']:
+            combos.append(combo)
+    return combos
+
+def _signal_window(ma_long):
+    # generate_signal needs a full long MA on the last bar of its window
+    return max(SIGNAL_WINDOW, ma_long + 1)
+
+def precompute_indicators(df, combos, spec=None):
+    """
+    Computes every distinct indicator the combinations need, once.
+    Returns a dict of NumPy arrays shared by all combinations for the symbol,
+    along with its SymbolSpec and its higher-timeframe trend (None without
+    HTF_FILTERS).
+    """
+    htf = ResampleCache()
+    close, high, low = df['close'], df['high'], df['low']
+    ma_periods = {c['ma_short'] for c in combos} | {c['ma_long'] for c in combos}
+    atr_keys = {(c['atr_period'], _signal_window(c['ma_long'])) for c in combos}
+    return {
+        'time': df['time'].to_numpy(),
+        'high': high.to_numpy(dtype=float),
+        'low': low.to_numpy(dtype=float),
+        'close': close.to_numpy(dtype=float),
+        'rsi': calculate_rsi(close).to_numpy(dtype=float),
+        'ma': {p: calculate_ma(close, period=p).to_numpy(dtype=float) for p in ma_periods},
+        'atr': {k: calculate_windowed_atr(high, low, close, period=k[0], window=k[1]) for k in atr_keys},
+        'spec': spec,
+        'htf': htf.update(df) if htf.timeframes else None,
+    }
+
+# Metrics from summarize() that results can be ranked by
+RANK_COLUMNS = ('total_pnl', 'win_rate', 'profit_factor', 'max_drawdown', 'sharpe', 'trades')
+
+def summarize(times, pnl, initial_balance=INITIAL_BALANCE):
+    """PnL, win rate, profit factor, max drawdown and Sharpe of a trade list, in time order."""
+    pnl = np.asarray(pnl, dtype=float)
+    if len(pnl) == 0:
+        return {'trades': 0, 'total_pnl': 0.0, 'win_rate': 0.0, 'profit_factor': 0.0, 'max_drawdown': 0.0, 'sharpe': 0.0}
+    pnl = pnl[np.argsort(np.asarray(times), kind='stable')]
+    balance = initial_balance + np.cumsum(pnl)
+    max_drawdown = float((np.maximum.accumulate(balance) - balance).max())
+    gross_profit = pnl[pnl > 0].sum()
+    gross_loss = -pnl[pnl < 0].sum()
+    std = pnl.std(ddof=1) if len(pnl) > 1 else 0.0
+    return {
+        'trades': len(pnl),
+        'total_pnl': float(pnl.sum()),
+        'win_rate': float((pnl > 0).mean() * 100),
+        'profit_factor': float(gross_profit / gross_loss) if gross_loss > 0 else float('inf'),
+        'max_drawdown': max_drawdown,
+        'sharpe': float(pnl.mean() / std * np.sqrt(252)) if std > 0 else 0.0,
+    }
+
+def evaluate(combo, data):
+    """Backtests one combination on every symbol in `data` and returns its metrics row."""
+    window = _signal_window(combo['ma_long'])
+    times, pnl = [], []
+    for arrays in data.values():
+        atr = arrays['atr'][(combo['atr_period'], window)]
+        direction = signals_from_indicators(
+            arrays['rsi'], arrays['ma'][combo['ma_short']], arrays['ma'][combo['ma_long']], atr,
+            window - 1, rsi_low=combo['rsi_low'], rsi_high=combo['rsi_high'],
+        )
+        if arrays['htf'] is not None:
+            direction = confirm(direction, arrays['htf'])
+        trades = simulate_trades(
+            arrays['time'], arrays['high'], arrays['low'], arrays['close'], direction, atr, INITIAL_BALANCE,
+            sl_multiplier=combo['atr_sl_multiplier'], reward_risk=combo['reward_risk_ratio'], spec=arrays['spec'],
+        )
+        times.extend(trades['time'])
+        pnl.extend(trades['pnl'])
+    return {**combo, **summarize(times, pnl)}
+
+_worker_data = None
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _evaluate_batch(batch):
+    return [evaluate(combo, _worker_data) for combo in batch]
+
+def run_sweep(combos, symbols=None, timeframe=TIMEFRAME, workers=SWEEP_WORKERS, rank_by=SWEEP_RANK_BY, output=SWEEP_RESULTS_FILE):
+    """Evaluates the combinations over the symbols and writes the ranked table to `output`."""
+    if rank_by not in RANK_COLUMNS:
+        # Checked up front rather than failing in the sort after the whole sweep has run
+        raise ValueError(f"rank_by must be one of {', '.join(RANK_COLUMNS)}, not {rank_by!r}")
+    symbols = symbols or SYMBOLS
+    data = {}
+    for symbol in symbols:
+        df = load_history(symbol, timeframe)
+        if df is not None:
+            data[symbol] = precompute_indicators(df, combos, spec=get_symbol_spec(symbol))
+    if not data:
+        logger.error("No historical data found for any symbol. Nothing to sweep.")
+        return pd.DataFrame()
+
+    logger.info(f"Sweeping {len(combos)} combinations over {len(data)} symbols on {workers} workers")
+    start = time.perf_counter()
+    rows = []
+    batches = [combos[i:i + SWEEP_BATCH_SIZE] for i in range(0, len(combos), SWEEP_BATCH_SIZE)]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+            futures = [pool.submit(_evaluate_batch, batch) for batch in batches]
+            for done, future in enumerate(as_completed(futures), start=1):
+                rows.extend(future.result())
+                if done % 10 == 0 or done == len(futures):
+                    logger.info(f"Sweep progress: {len(rows)}/{len(combos)} combinations")
+    else:
+        rows = [evaluate(combo, data) for combo in combos]
+
+    # Lower drawdown is better; everything else is ranked highest first
+    ascending = rank_by == 'max_drawdown'
+    results = pd.DataFrame(rows).sort_values(rank_by, ascending=ascending, kind='stable').reset_index(drop=True)
+    results.insert(0, 'rank', results.index + 1)
+    results.to_csv(output, index=False)
+    logger.info(f"Sweep complete in {time.perf_counter() - start:.1f}s. Results saved to {output}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep over strategy and risk settings.")
+    parser.add_argument('--random', type=int, default=0, help="Evaluate N random combinations instead of the full grid")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for --random")
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS)
+    parser.add_argument('--rank-by', default=SWEEP_RANK_BY, choices=RANK_COLUMNS)
+    parser.add_argument('--symbols', nargs='*', help="Override config.SYMBOLS")
+    args = parser.parse_args()
+
+    combos = random_combinations(SWEEP_SPACE, args.random, args.seed) if args.random else grid_combinations(SWEEP_SPACE)
+    results = run_sweep(combos, symbols=args.symbols, workers=args.workers, rank_by=args.rank_by)
+    if not results.empty:
+        print(results.head(10).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Cached symbol metadata (digits, point, tick value, contract size, volume
+limits, spread, filling modes) for pip sizing, lot sizing and orders.
+
+The registry is built from one bulk mt5.symbols_get() call and saved to
+SYMBOL_CACHE_FILE. Lookups are dictionary hits on the in-memory copy, so
+sizing, scans and backtests never query the terminal per symbol. When
+connected, refresh_if_stale() rebuilds it once SYMBOL_CACHE_TTL has passed;
+offline (e.g. in backtests) the last saved copy is used regardless of age.
+"""
+import json
+import os
+import time
+from collections import namedtuple
+from config import SYMBOL_CACHE_FILE, SYMBOL_CACHE_TTL
+from utils import setup_logger
+
+logger = setup_logger('symbol_registry')
+
+_FIELDS = ('name', 'digits', 'point', 'tick_value', 'tick_size', 'contract_size', 'volume_min', 'volume_max', 'volume_step', 'spread',
+           'filling_mode')
+
+# filling_mode is the broker's SYMBOL_FILLING_* bitmask; None when unknown
+# (including registries saved before it was cached)
+class SymbolSpec(namedtuple('SymbolSpec', _FIELDS, defaults=(None,))):
+    __slots__ = ()
+
+    @property
+    def pip_size(self):
+        """A pip is 10 points on 5- and 3-digit quotes, otherwise one point."""
+        return self.point * 10 if self.digits in (3, 5) else self.point
+
+    @property
+    def pip_value(self):
+        """Value of one pip for one lot, in the account currency."""
+        return self.tick_value * self.pip_size / self.tick_size
+
+def default_spec(symbol):
+    """
+    Fallback for symbols missing from the registry: a 5-digit quote worth $10
+    per pip per lot (3-digit for JPY-quoted pairs), as the bot assumed before
+    the registry existed.
+    """
+    jpy = symbol.upper().endswith('JPY')
+    point = 0.001 if jpy else 0.00001
+    return SymbolSpec(
+        name=symbol, digits=3 if jpy else 5, point=point,
+        tick_value=1.0, tick_size=point, contract_size=100000.0,
+        volume_min=0.01, volume_max=None, volume_step=0.01, spread=0,
+    )
+
+def spec_from_info(info):
+    """Builds a SymbolSpec from an MT5 SymbolInfo."""
+    return SymbolSpec(
+        name=info.name, digits=info.digits, point=info.point,
+        tick_value=info.trade_tick_value, tick_size=info.trade_tick_size,
+        contract_size=info.trade_contract_size, volume_min=info.volume_min,
+        volume_max=info.volume_max, volume_step=info.volume_step, spread=info.spread,
+        filling_mode=getattr(info, 'filling_mode', None),
+    )
+
+_registry = None
+_updated = 0.0
+_warned = set()
+
+def _load():
+    global _registry, _updated
+    try:
+        with open(SYMBOL_CACHE_FILE) as f:
+            data = json.load(f)
+        _registry = {name: SymbolSpec(**spec) for name, spec in data['symbols'].items()}
+        _updated = data['updated']
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        _registry, _updated = {}, 0.0
+
+def save_registry(specs, path=SYMBOL_CACHE_FILE):
+    """Replaces the registry with `specs` and writes it to disk atomically."""
+    global _registry, _updated
+    _registry = {spec.name: spec for spec in specs}
+    _updated = time.time()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'updated': _updated, 'symbols': {name: spec._asdict() for name, spec in _registry.items()}}, f)
+    os.replace(tmp_path, path)
+
+def refresh_registry(symbol_infos=None):
+    """
+    Rebuilds the registry from one bulk symbols_get() call, or from
+    `symbol_infos` if the caller already has them. Needs an MT5 connection.
+    """
+    if symbol_infos is None:
+        import MetaTrader5 as mt5
+        symbol_infos = mt5.symbols_get()
+    if not symbol_infos:
+        logger.warning("symbols_get() returned nothing; keeping the cached symbol registry")
+        return False
+    save_registry([spec_from_info(info) for info in symbol_infos])
+    logger.info(f"Symbol registry refreshed with {len(_registry)} symbols")
+    return True
+
+def refresh_if_stale(max_age=SYMBOL_CACHE_TTL):
+    """Refreshes the registry if it is older than max_age seconds. Needs an MT5 connection."""
+    if _registry is None:
+        _load()
+    if time.time() - _updated > max_age:
+        return refresh_registry()
+    return True
+
+def get_symbol_spec(symbol):
+    """Metadata for symbol from the registry, or default_spec if it is not known."""
+    if _registry is None:
+        _load()
+    spec = _registry.get(symbol)
+    if spec is None:
+        if symbol not in _warned:
+            _warned.add(symbol)
+            logger.warning(f"{symbol} is not in the symbol registry; using default pip size and value")
+        return default_spec(symbol)
+    return spec
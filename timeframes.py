@@ -0,0 +1,174 @@
+"""
+Higher-timeframe trend confirmation from resampled base bars.
+
+Higher-timeframe (HTF) bars are never fetched separately: a ResampleCache
+folds the base TIMEFRAME bars into each timeframe in HTF_FILTERS as they
+arrive, keeping the last HTF_MA_LONG completed bars plus the one still
+forming. Backtests feed it the whole series or one chunk at a time, and
+the live loop feeds it each scan's bars, of which only the new ones are
+folded in; all three go through the same code, so they agree bar for bar.
+
+The trend of a timeframe at a base bar is the sign of its short MA minus
+its long MA over the HTF closes, with the forming HTF bar taken as it
+stands at that base bar's close (as a chart of that timeframe would show
+it, with no look-ahead). A signal is confirmed when every timeframe's
+trend points its way; without enough HTF history there is no confirmation.
+"""
+from collections import deque
+import numpy as np
+import pandas as pd
+from utils import timeframe_seconds
+from config import HTF_FILTERS, HTF_MA_SHORT, HTF_MA_LONG
+
+def _epoch_seconds(times):
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.integer):
+        return times.astype(np.int64)
+    return pd.to_datetime(times).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+def _moving_average(completed, count, close, period):
+    """
+    MA over the last period - 1 completed closes before each row (`count`
+    of them exist, indexing into `completed`) plus the row's own close.
+    NaN where there are not enough completed bars.
+    """
+    ma = np.full(len(close), np.nan)
+    if period == 1:
+        return close.astype(float)
+    valid = count >= period - 1
+    if valid.any() and len(completed) >= period - 1:
+        # Each window is summed on its own, so the result does not depend on
+        # where the array starts (chunked and live runs match a full run)
+        sums = np.lib.stride_tricks.sliding_window_view(completed, period - 1).sum(axis=1)
+        ma[valid] = (sums[count[valid] - period + 1] + close[valid]) / period
+    return ma
+
+class _Resampled:
+    """Completed bars of one higher timeframe plus the one still forming."""
+
+    def __init__(self, timeframe, keep):
+        if timeframe.rstrip('0123456789') in ('W', 'MN'):
+            raise ValueError(f"Cannot resample to {timeframe}: only timeframes up to D1 are aligned to the epoch")
+        self.timeframe = timeframe
+        self.period = timeframe_seconds(timeframe)
+        self.bars = deque(maxlen=keep)  # (start, open, high, low, close)
+        self.forming = None
+
+    def update(self, times, open_, high, low, close, short, long):
+        """Folds the rows in and returns the trend (1, -1 or 0) at each of them."""
+        start = times // self.period * self.period
+        first = np.r_[0, np.flatnonzero(start[1:] != start[:-1]) + 1]
+        last = np.r_[first[1:] - 1, len(times) - 1]
+        groups = [list(bar) for bar in zip(start[first].tolist(), open_[first].tolist(),
+                                           np.maximum.reduceat(high, first).tolist(),
+                                           np.minimum.reduceat(low, first).tolist(), close[last].tolist())]
+        if self.forming is not None:
+            if self.forming[0] == groups[0][0]:
+                # Still the same HTF bar (or the last base bar again, revised)
+                groups[0][1] = self.forming[1]
+                groups[0][2] = max(groups[0][2], self.forming[2])
+                groups[0][3] = min(groups[0][3], self.forming[3])
+            else:
+                self.bars.append(tuple(self.forming))
+
+        prior = np.array([bar[4] for bar in self.bars], dtype=float)
+        completed = np.r_[prior, [group[4] for group in groups[:-1]]]
+        group_of_row = np.repeat(np.arange(len(groups)), last - first + 1)
+        count = len(prior) + group_of_row
+        ma_short = _moving_average(completed, count, close, short)
+        ma_long = _moving_average(completed, count, close, long)
+        with np.errstate(invalid='ignore'):
+            trend = np.where(ma_short > ma_long, 1, np.where(ma_short < ma_long, -1, 0)).astype(np.int8)
+
+        self.bars.extend(tuple(group) for group in groups[:-1])
+        self.forming = groups[-1]
+        return trend
+
+class ResampleCache:
+    """
+    The higher timeframes of one symbol's base bars, updated incrementally.
+    update() takes bars in time order; rows older than the last one seen
+    are ignored and a repeat of the last one (a bar still forming when it
+    was first seen) replaces it.
+    """
+
+    def __init__(self, timeframes=None, short=HTF_MA_SHORT, long=HTF_MA_LONG):
+        self.timeframes = list(HTF_FILTERS if timeframes is None else timeframes)
+        self.short = short
+        self.long = long
+        self.resampled = {tf: _Resampled(tf, long) for tf in self.timeframes}
+        self.last_time = None
+
+    def update(self, df):
+        """
+        Folds the new rows of df (time, open, high, low, close) in. Returns
+        the combined trend for every row of df: 1 when all timeframes trend
+        up, -1 when all trend down, else 0 (also for ignored old rows).
+        """
+        trend = np.zeros(len(df), dtype=np.int8)
+        if len(df) == 0 or not self.timeframes:
+            return trend
+        times = _epoch_seconds(df['time'])
+        new = 0 if self.last_time is None else int(np.searchsorted(times, self.last_time, side='left'))
+        if new == len(times):
+            return trend
+        arrays = [times[new:]] + [df[name].to_numpy(dtype=float)[new:] for name in ('open', 'high', 'low', 'close')]
+        combined = None
+        for resampled in self.resampled.values():
+            tf_trend = resampled.update(*arrays, self.short, self.long)
+            combined = tf_trend if combined is None else np.where(combined == tf_trend, combined, 0).astype(np.int8)
+        trend[new:] = combined
+        self.last_time = int(times[-1])
+        return trend
+
+    def is_behind(self, df):
+        """True if df does not overlap the bars seen so far, so bars in between may be missing."""
+        if self.last_time is None or len(df) == 0:
+            return True
+        return int(_epoch_seconds(df['time'][:1])[0]) > self.last_time
+
+    def frame(self, timeframe):
+        """The cached bars of a timeframe, the forming one last, as a DataFrame."""
+        resampled = self.resampled[timeframe]
+        rows = list(resampled.bars) + ([tuple(resampled.forming)] if resampled.forming else [])
+        df = pd.DataFrame(rows, columns=['time', 'open', 'high', 'low', 'close'])
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df
+
+def warmup_bars(base_timeframe, timeframes=None, long=HTF_MA_LONG):
+    """Base bars needed for a full long MA on the largest higher timeframe."""
+    timeframes = HTF_FILTERS if timeframes is None else timeframes
+    if not timeframes:
+        return 0
+    ratio = max(timeframe_seconds(tf) for tf in timeframes) // timeframe_seconds(base_timeframe)
+    return (long + 1) * ratio
+
+def confirm(direction, trend):
+    """Keeps the signals in `direction` (1 buy, -1 sell) that agree with `trend`."""
+    return np.where(direction == trend, direction, 0).astype(direction.dtype)
+
+def htf_filter(df, direction, timeframes=None):
+    """Confirms a whole series of signals against df's higher timeframes; a no-op without HTF_FILTERS."""
+    timeframes = HTF_FILTERS if timeframes is None else timeframes
+    if not timeframes:
+        return direction
+    return confirm(direction, ResampleCache(timeframes).update(df))
+
+# --- Live loop ---
+
+_live_caches = {}
+
+def live_trend(symbol, df, fetch_history, base_timeframe):
+    """
+    Combined higher-timeframe trend at the last bar of df, a scan's bars for
+    symbol. The symbol's cache lives for the whole process: it is built from
+    fetch_history(bars) (warmup_bars of history) on first use or when the
+    scan's bars no longer overlap it, and otherwise only folds in new bars.
+    """
+    cache = _live_caches.get(symbol)
+    if cache is None or cache.is_behind(df):
+        cache = _live_caches[symbol] = ResampleCache()
+        history = fetch_history(warmup_bars(base_timeframe))
+        if history is not None:
+            cache.update(history)
+    return int(cache.update(df)[-1]) if len(df) else 0
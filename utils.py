@@ -1,23 +1,102 @@
+import atexit
 import os
 import logging
+import multiprocessing
+import queue
+import threading
 from datetime import datetime
 from config import LOG_DIR
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def setup_logger(name, log_file='logs/main.log', level=logging.INFO):
+# All loggers put records on one queue; a listener thread formats them and
+# writes each to its component's file, so logging never blocks on disk I/O.
+_log_queue = queue.Queue()
+_file_handlers = {}  # logger name -> RotatingFileHandler
+_file_handlers_lock = threading.Lock()
+_listener = None
+# Set in worker processes, which exit without running atexit hooks (and,
+# when forked, have no listener thread); records there are written directly.
+_direct = False
+
+class _ComponentRouter(logging.Handler):
+    """Hands each record to the file handler of the logger that made it."""
+
+    def handle(self, record):
+        handler = _file_handlers.get(record.name)
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+        return True
+
+_router = _ComponentRouter()
+
+class _ComponentQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        if _direct:
+            _router.handle(record)
+        else:
+            super().enqueue(record)
+
+def _start_listener():
+    global _listener
+    if _listener is None:
+        _listener = QueueListener(_log_queue, _router)
+        _listener.start()
+
+@atexit.register
+def stop_logging():
+    """Writes out every queued record and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _after_fork_in_child():
+    global _direct, _listener
+    _direct = True
+    _listener = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def setup_logger(name, log_file=None, level=logging.INFO):
+    """
+    Logger for a component, writing to LOG_DIR/<name>.log (or log_file)
+    through the shared queue and listener thread.
+    """
+    global _direct
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
-    handler = RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=5)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    # Prevent duplicate handlers
-    if not any(isinstance(h, RotatingFileHandler) and h.baseFilename == handler.baseFilename for h in logger.handlers):
-        logger.addHandler(handler)
+    with _file_handlers_lock:
+        if name not in _file_handlers:
+            handler = RotatingFileHandler(log_file or os.path.join(LOG_DIR, f'{name}.log'), maxBytes=1_000_000, backupCount=5)
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            _file_handlers[name] = handler
+        # Prevent duplicate handlers
+        if not any(isinstance(h, _ComponentQueueHandler) for h in logger.handlers):
+            logger.addHandler(_ComponentQueueHandler(_log_queue))
+        if not _direct and multiprocessing.parent_process() is not None:
+            # Worker processes exit without running atexit hooks, so a
+            # listener there could lose its last records
+            _direct = True
+        if not _direct:
+            _start_listener()
     return logger
 
 def format_time(ts=None):
     if ts is None:
         ts = datetime.now()
-    return ts.strftime('%Y-%m-%d %H:%M:%S') 
\ No newline at end of file
+    return ts.strftime('%Y-%m-%d %H:%M:%S')
+
+def log_trade(trade_data):
+    """Records a live trade in the trade journal (see journal.py)."""
+    from journal import log_live_trade
+    log_live_trade(trade_data)
+
+_TIMEFRAME_UNITS = {'M': 60, 'H': 3600, 'D': 86400, 'W': 604800, 'MN': 2592000}
+
+def timeframe_seconds(timeframe):
+    """Length of a bar in seconds for an MT5 timeframe string like 'M15' or 'H1' (MN is approximate)."""
+    unit = timeframe.rstrip('0123456789')
+    return _TIMEFRAME_UNITS[unit] * int(timeframe[len(unit):])